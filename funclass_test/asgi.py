@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'funclass_test.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from virtual_classroom.streaming import cancel_on_disconnect  # noqa: E402
+
+# Close the live question streams as soon as their client goes away
+application = cancel_on_disconnect(django_application)
@@ -0,0 +1,157 @@
+"""
+API documentation: the Swagger UI of drf_yasg on /swagger/ and the coreapi
+docs of Django REST Framework on /docs/.
+
+Generating a schema walks every view of the API, which only changes with a
+deploy: each schema is generated on its first request, then served from
+memory for the life of the worker. With API_DOCS['SCHEMA_FILE'] the OpenAPI
+schema is not generated at all, the file written at build time with
+`manage.py generate_swagger --format json <file>` is served instead.
+
+The documentation views are built on their first request too, so the schema
+generators and the documentation renderers are not imported while a worker
+boots. With API_DOCS['ENABLED'] off, the docs URLs are not mounted at all.
+"""
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import include, path
+from drf_yasg import openapi
+from rest_framework import exceptions, permissions
+from rest_framework.response import Response
+
+DEFAULT_API_DOCS = {
+    # Mount /swagger/ and /docs/
+    'ENABLED': True,
+    # Pre-generated OpenAPI schema (JSON) served by /swagger/ instead of generating it
+    'SCHEMA_FILE': None,
+}
+
+API_INFO = openapi.Info(
+    title="Virtual Classroom API for Funclass",
+    default_version='v1',
+    description="API documentation",
+)
+
+DOCS_TITLE = 'Your API Title'
+
+# Schemas kept per view, one per URL they were requested from since they embed it
+MAX_CACHED_SCHEMAS = 8
+
+
+def api_docs_config():
+    return {**DEFAULT_API_DOCS, **getattr(settings, 'API_DOCS', {})}
+
+
+class SchemaCache:
+    """
+        The schemas of a view by key, each generated once even when the first requests come at the same time.
+    """
+    def __init__(self):
+        self.schemas = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, generate):
+        schema = self.schemas.get(key)
+        if schema is None:
+            with self.lock:
+                schema = self.schemas.get(key)
+                if schema is None:
+                    if len(self.schemas) >= MAX_CACHED_SCHEMAS:
+                        self.schemas.clear()
+                    schema = self.schemas[key] = generate()
+        return schema
+
+
+@lru_cache(maxsize=None)
+def read_schema_file(name):
+    with open(name, 'rb') as schema_file:
+        return schema_file.read()
+
+
+class LazyView:
+    """
+        A view built by `factory` on its first request.
+    """
+    # The documentation views are DRF views, exempt from the CSRF checks
+    csrf_exempt = True
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.view = None
+
+    def __call__(self, request, *args, **kwargs):
+        if self.view is None:
+            self.view = self.factory()
+        return self.view(request, *args, **kwargs)
+
+
+def swagger_view():
+    from drf_yasg.renderers import _SpecRenderer
+    from drf_yasg.views import get_schema_view
+
+    schemas = SchemaCache()
+
+    class SchemaView(get_schema_view(API_INFO, public=True, permission_classes=[permissions.AllowAny])):
+        def get(self, request, version='', format=None):
+            renderer = request.accepted_renderer
+            # The UI page does not list the endpoints, its script fetches the schema with ?format=openapi
+            if not isinstance(renderer, _SpecRenderer):
+                return super().get(request, version, format)
+
+            schema_file = api_docs_config()['SCHEMA_FILE']
+            if schema_file and 'json' in renderer.media_type:
+                return HttpResponse(read_schema_file(schema_file), content_type=renderer.media_type)
+
+            version = request.version or version or ''
+            schema = schemas.get((version, request.build_absolute_uri(request.path)),
+                                 lambda: self.generator_class(API_INFO, version).get_schema(request, self.public))
+            if schema is None:
+                raise exceptions.PermissionDenied()
+            return Response(schema)
+
+    return SchemaView.with_ui('swagger', cache_timeout=0)
+
+
+def coreapi_generator_class():
+    from rest_framework.schemas import SchemaGenerator
+
+    class CachedSchemaGenerator(SchemaGenerator):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.schemas = SchemaCache()
+
+        def get_schema(self, request=None, public=False):
+            # The private schemas only list the endpoints the user can access
+            if not public or request is None:
+                return super().get_schema(request, public)
+            return self.schemas.get(request.build_absolute_uri(request.path),
+                                    lambda: super(CachedSchemaGenerator, self).get_schema(request, public))
+
+    return CachedSchemaGenerator
+
+
+def docs_view():
+    from rest_framework.documentation import get_docs_view
+    return get_docs_view(title=DOCS_TITLE, generator_class=coreapi_generator_class())
+
+
+def schema_js_view():
+    from rest_framework.documentation import get_schemajs_view
+    return get_schemajs_view(title=DOCS_TITLE, generator_class=coreapi_generator_class())
+
+
+def docs_urls():
+    """
+        The documentation URLs, to add to the root URLconf when API_DOCS['ENABLED'].
+    """
+    return [
+        path('swagger/', LazyView(swagger_view), name='schema-swagger-ui'),
+        # The URL names of `rest_framework.documentation.include_docs_urls`, its templates reverse them
+        path('docs/', include(([
+            path('', LazyView(docs_view), name='docs-index'),
+            path('schema.js', LazyView(schema_js_view), name='schema-js'),
+        ], 'api-docs'), namespace='api-docs')),
+    ]
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import json
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,18 +46,117 @@ INSTALLED_APPS = [
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
+    'DEFAULT_THROTTLE_CLASSES': ['virtual_classroom.throttling.TokenBucketThrottle'],
+    # JSON rendered by orjson, and MessagePack, see virtual_classroom/renderers.py
+    'DEFAULT_RENDERER_CLASSES': [
+        'virtual_classroom.renderers.ORJSONRenderer',
+        'virtual_classroom.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
+# Token bucket rate limits per URL name, see virtual_classroom/throttling.py
+# 'user' limits each authenticated user, 'ip' each client address. '30/min' allows
+# bursts of 30 requests, refilled at 30 per minute. RATE_LIMITING=0 turns them off,
+# e.g. for load tests.
+RATE_LIMITS = {
+    'signup': {'ip': '20/hour'},
+    'login': {'ip': '30/min'},
+    'post-question': {'user': '30/min', 'ip': '300/min'},
+    'post-questions': {'user': '10/min', 'ip': '100/min'},
+} if os.environ.get('RATE_LIMITING', '') != '0' else {}
+# Must be shared by the workers for the limits to hold, see CACHES
+RATE_LIMIT_CACHE = 'default'
+
+# Fan-out of posted questions to the live streams, see virtual_classroom/broker.py
+# Use 'virtual_classroom.broker.RedisBroker' with {'url': 'redis://...'} to run several workers
+QUESTION_BROKER = {
+    'BACKEND': 'virtual_classroom.broker.InProcessBroker',
+    'OPTIONS': {},
+}
+
+# Serve the read endpoints from plain `.values()` rows instead of the DRF
+# serializers, see virtual_classroom/fast_serializers.py
+FAST_READ_SERIALIZERS = os.environ.get('FAST_READ_SERIALIZERS', '') == '1'
+
+# Write the questions posted at the same time together, see virtual_classroom/questions.py
+# WINDOW is how long (seconds) the first question of a batch waits for others
+QUESTION_WRITE_COALESCING = {
+    'WINDOW': 0.005,
+    'MAX_BATCH': 200,
+} if os.environ.get('QUESTION_WRITE_COALESCING', '') == '1' else None
+
+# Background jobs queued in the database, run with `manage.py run_jobs`, see virtual_classroom/jobs.py
+JOB_QUEUE = {
+    'POLL_INTERVAL': 1.0,
+    'BATCH_SIZE': 10,
+    'HEARTBEAT_INTERVAL': 30,
+    'TIMEOUT': 120,
+    'RESULT_FILE_MAX_AGE': 7 * 24 * 3600,
+}
+
+# Route the question read/write endpoints to the async views of
+# virtual_classroom/async_views.py, for deployments running under ASGI
+ASYNC_QUESTION_VIEWS = os.environ.get('ASYNC_QUESTION_VIEWS', '') == '1'
+
 MIDDLEWARE = [
+    'virtual_classroom.middleware.InstrumentationMiddleware',
+    'virtual_classroom.middleware.ConcurrencyLimitMiddleware',
+    'virtual_classroom.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'virtual_classroom.middleware.PrimaryPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Latency and SQL query metrics per view, exported on /metrics, see virtual_classroom/metrics.py
+# SAMPLE_RATE is the share of the requests measured, 0 turns the instrumentation off
+REQUEST_METRICS = {
+    'SAMPLE_RATE': float(os.environ.get('REQUEST_METRICS_SAMPLE_RATE', 1)),
+    'SERVER_TIMING': True,
+    # Clients allowed to read /metrics, besides staff users
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+}
+
+# Requests served at a time by each worker process, the next ones wait up to
+# QUEUE_TIMEOUT seconds then get a 503, see virtual_classroom/middleware.py.
+# Set to None to serve every request.
+ADMISSION_CONTROL = {
+    'MAX_CONCURRENT': int(os.environ.get('MAX_CONCURRENT_REQUESTS', 64)),
+    'QUEUE_TIMEOUT': 0.1,
+    'RETRY_AFTER': 1,
+    'EXEMPT_PATHS': ['/metrics'],
+}
+
+# Compression of the responses of at least MIN_SIZE bytes, with brotli or gzip,
+# see virtual_classroom/middleware.py.
+# The threshold also keeps the small responses carrying secrets, like the login
+# token, out of reach of compression side channels. Set to None to send them as they are.
+RESPONSE_COMPRESSION = {
+    'MIN_SIZE': 1024,
+    'ENCODINGS': ['br', 'gzip'],
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+} if os.environ.get('RESPONSE_COMPRESSION', '') != '0' else None
+
+# API documentation on /swagger/ and /docs/, see funclass_test/docs.py. Each schema is
+# generated once per worker, or not at all with SCHEMA_FILE, a JSON schema written at
+# build time with `manage.py generate_swagger --format json <file>`.
+# API_DOCS=0 removes the docs URLs.
+API_DOCS = {
+    'ENABLED': os.environ.get('API_DOCS', '') != '0',
+    'SCHEMA_FILE': os.environ.get('API_SCHEMA_FILE') or None,
+}
+
+# The API description of the schemas, also used by `manage.py generate_swagger`
+SWAGGER_SETTINGS = {
+    'DEFAULT_INFO': 'funclass_test.docs.API_INFO',
+}
+
 ROOT_URLCONF = 'funclass_test.urls'
 
 TEMPLATES = [
@@ -79,11 +180,128 @@ WSGI_APPLICATION = 'funclass_test.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# The database is selected from the environment. Defaults to the local SQLite
+# file, for PostgreSQL set e.g.
+#   DB_ENGINE=django.db.backends.postgresql DB_NAME=funclass DB_USER=... DB_PASSWORD=... DB_HOST=...
+# Setting DB_REPLICA_HOST (or DB_REPLICA_NAME) adds a read replica: the GET
+# endpoints read from it, everything else goes to the primary, see
+# virtual_classroom/routers.py. Two SQLite files can stand in for both:
+#   DB_NAME=db.sqlite3 DB_REPLICA_NAME=db-replica.sqlite3
+
+# SQLite uses virtual_classroom's tuned backend (WAL journal, busy timeout,
+# BEGIN IMMEDIATE for writes), DB_SQLITE_TUNING=0 falls back to the stock one.
+#   DB_SQLITE_PRAGMAS='{"mmap_size": 0}' overrides some of its PRAGMAs.
+
+SQLITE_ENGINE = 'virtual_classroom.db.backends.sqlite3' if os.environ.get('DB_SQLITE_TUNING', '1') == '1' \
+    else 'django.db.backends.sqlite3'
+DB_ENGINE = os.environ.get('DB_ENGINE', SQLITE_ENGINE)
+
+
+def database(prefix, **defaults):
+    config = {
+        'ENGINE': DB_ENGINE,
+        'NAME': os.environ.get(prefix + 'NAME', defaults.get('NAME', '')),
+        'USER': os.environ.get(prefix + 'USER', os.environ.get('DB_USER', '')),
+        'PASSWORD': os.environ.get(prefix + 'PASSWORD', os.environ.get('DB_PASSWORD', '')),
+        'HOST': os.environ.get(prefix + 'HOST', os.environ.get('DB_HOST', '')),
+        'PORT': os.environ.get(prefix + 'PORT', os.environ.get('DB_PORT', '')),
+        # Keep connections open between requests, checking them before reuse
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0 if 'sqlite' in DB_ENGINE else 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+    }
+    if DB_ENGINE == 'virtual_classroom.db.backends.sqlite3':
+        config['OPTIONS'] = {'pragmas': json.loads(os.environ.get('DB_SQLITE_PRAGMAS', '{}'))}
+    config.update({key: value for key, value in defaults.items() if key != 'NAME'})
+    return config
+
+
 DATABASES = {
+    'default': database('DB_', NAME=BASE_DIR / 'db.sqlite3'),
+}
+
+if os.environ.get('DB_REPLICA_HOST') or os.environ.get('DB_REPLICA_NAME'):
+    DATABASES['replica'] = database('DB_REPLICA_', NAME=DATABASES['default']['NAME'], TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['virtual_classroom.routers.PrimaryReplicaRouter']
+
+# Seconds during which a client that wrote keeps reading from the primary
+DATABASE_REPLICA_PIN_SECONDS = 5
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The rendered question feed pages live in their own cache. locmem evicts
+# the least recently used pages and suits a single node, point it to a
+# shared file or database cache when running several nodes, e.g.
+# QUESTION_FEED_CACHE_BACKEND=django.core.cache.backends.db.DatabaseCache
+# QUESTION_FEED_CACHE_LOCATION=question_feed_cache (then run createcachetable)
+
+# The default cache holds the rate limits and replica pins, use a shared backend
+# with several workers, e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# CACHE_LOCATION=redis://127.0.0.1:6379
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+    'question_feed': {
+        'BACKEND': os.environ.get('QUESTION_FEED_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('QUESTION_FEED_CACHE_LOCATION', 'question-feed'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('QUESTION_FEED_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+}
+
+QUESTION_FEED_CACHE = 'question_feed'
+
+# Cache of the classrooms each student is enrolled in, checked when posting
+# questions. A cached enrollment is trusted without asking the database, so it
+# is only used with a backend shared by every worker (e.g. Redis): with the
+# per-process LocMemCache the database is always asked, otherwise a student
+# removed on one worker would keep their access on the others for up to
+# ENROLLMENT_CACHE_TIMEOUT seconds. Set to None to always ask the database.
+ENROLLMENT_CACHE = 'default'
+ENROLLMENT_CACHE_TIMEOUT = 300
+
+# In-process cache of authentication tokens, see virtual_classroom/authentication.py
+# TTL (seconds) bounds how long another worker may accept a deleted token
+TOKEN_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 60,
+}
+
+# Password hashing
+# https://docs.djangoproject.com/en/4.2/topics/auth/passwords/
+# PASSWORD_HASHER picks the hasher of new passwords (pbkdf2, scrypt or argon2,
+# argon2 needs argon2-cffi). The others still check older passwords, which
+# are rehashed on the next login. Hashing runs on a bounded thread pool,
+# see virtual_classroom/hashers.py.
+
+_PASSWORD_HASHERS = {
+    'argon2': 'virtual_classroom.hashers.TunedArgon2PasswordHasher',
+    'scrypt': 'virtual_classroom.hashers.TunedScryptPasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+_preferred_hasher = _PASSWORD_HASHERS[os.environ.get('PASSWORD_HASHER', 'pbkdf2')]
+
+PASSWORD_HASHERS = [_preferred_hasher] + [
+    hasher for hasher in [
+        *_PASSWORD_HASHERS.values(),
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    ] if hasher != _preferred_hasher
+]
+
+PASSWORD_HASHER_COST = {
+    'scrypt': {'work_factor': 2 ** 14, 'block_size': 8, 'parallelism': 1},
+    'argon2': {'time_cost': 2, 'memory_cost': 64 * 1024, 'parallelism': 1},
+}
+
+PASSWORD_HASHING_POOL = {
+    'WORKERS': int(os.environ.get('PASSWORD_HASHING_WORKERS', os.cpu_count() or 1)),
+    'MAX_PENDING': 32,
+    'QUEUE_TIMEOUT': 0.5,
 }
 
 # Password validation
@@ -120,6 +338,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Files written by the background jobs, e.g. the classroom exports
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', BASE_DIR / 'media')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
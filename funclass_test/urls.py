@@ -16,24 +16,15 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from rest_framework import permissions
-from rest_framework.documentation import include_docs_urls
-
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Virtual Classroom API for Funclass",
-      default_version='v1',
-      description="API documentation",
-   ),
-   public=True,
-   permission_classes=([permissions.AllowAny]),
-)
+from funclass_test.docs import api_docs_config, docs_urls
+from virtual_classroom.views import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('virtual_classroom.urls')),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('docs/', include_docs_urls(title='Your API Title')),
+    path('metrics', metrics, name='metrics'),
 ]
+
+# Swagger UI and coreapi docs, see funclass_test/docs.py
+if api_docs_config()['ENABLED']:
+    urlpatterns += docs_urls()
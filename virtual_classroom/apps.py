@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class VirtualClassroomConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'virtual_classroom'
+
+    def ready(self):
+        # Connect the signal receivers
+        from . import signals  # noqa: F401
+        # Register the background tasks for the workers
+        from . import tasks  # noqa: F401
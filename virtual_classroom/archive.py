@@ -0,0 +1,88 @@
+"""
+Archival of the old questions.
+
+The `archive_questions` command moves the questions posted before a cutoff
+from the Question table to ArchivedQuestion, keeping their ids, and records
+the cutoff on their classroom in `archived_before`. The live table and its
+feed index then only hold the recent questions, which most reads ask for.
+
+The archive only holds questions older than the live ones of the same
+classroom, the oldest are moved first. So the question feed reads it after
+the live questions, and only when a page reaches past the oldest live
+question (or, towards the newer questions, starts before the cutoff), see
+`seek_parts` in pagination.py. The first pages, the `since` polls and the
+conditional requests never touch it.
+
+`Classroom.question_count` counts the archived questions too, so moving
+them leaves it unchanged; `Classroom.refresh_counters` recounts both tables.
+
+The search index covers both tables: an archived question is found by
+`search_questions` like a live one, under the same id.
+"""
+from django.db.models import Q
+from django.utils import timezone
+
+from .db.transaction import immediate_atomic
+from .models import ArchivedQuestion, Classroom, Question
+from .pagination import Archive
+
+ARCHIVED_FIELDS = ('id', 'text', 'student_id', 'classroom_id', 'timestamp')
+
+
+def feed_archive(classroom_id, archived_before, shape=None):
+    """
+        The archive of a classroom's question feed for QuestionCursorPagination, None when nothing
+        was archived. `shape` is applied to the archived questions like to the live ones, e.g. `.values()`.
+    """
+    if archived_before is None:
+        return None
+    questions = ArchivedQuestion.objects.filter(classroom_id=classroom_id)
+    return Archive(shape(questions) if shape else questions, archived_before)
+
+
+def archive_classroom(classroom_id, before, batch_size=5000):
+    """
+        Move the questions of a classroom posted before `before` to the archive, the oldest first,
+        one transaction per batch. Returns the number of questions moved.
+    """
+    moved = 0
+    while True:
+        with immediate_atomic():
+            # Reads look into the archive from the first moved question on
+            Classroom.objects.filter(Q(archived_before__isnull=True) | Q(archived_before__lt=before),
+                                     id=classroom_id).update(archived_before=before)
+            rows = list(Question.objects.filter(classroom_id=classroom_id, timestamp__lt=before).order_by(
+                'timestamp', 'id').values_list(*ARCHIVED_FIELDS)[:batch_size])
+            if not rows:
+                return moved
+            # Moved within the classroom, question_count stays the same: deleted without the post_delete signal
+            # that uncounts them. Deleted first: the FTS5 triggers unindex the live rows before indexing the
+            # archived ones under their id.
+            moved_questions = Question.objects.filter(id__in=[row[0] for row in rows])
+            moved_questions._raw_delete(moved_questions.db)
+            ArchivedQuestion.objects.bulk_create(ArchivedQuestion(**dict(zip(ARCHIVED_FIELDS, row))) for row in rows)
+        moved += len(rows)
+        if len(rows) < batch_size:
+            return moved
+
+
+def archive_questions(before, classroom_ids=None, batch_size=5000, log=None):
+    """
+        Archive the questions posted before `before` in every classroom, or in `classroom_ids`.
+        Reports each classroom to `log`, a function taking a message, when given.
+        Returns the number of questions moved.
+    """
+    if before > timezone.now():
+        # The questions posted from now on would be older than the cutoff of the archive
+        raise ValueError('Cannot archive the questions posted before a future date')
+    classrooms = Question.objects.filter(timestamp__lt=before)
+    if classroom_ids:
+        classrooms = classrooms.filter(classroom_id__in=classroom_ids)
+    total = 0
+    for classroom_id in classrooms.order_by('classroom_id').values_list('classroom_id', flat=True).distinct():
+        moved = archive_classroom(classroom_id, before, batch_size)
+        if log is not None:
+            log('Classroom %s: %d questions archived' % (classroom_id, moved))
+        total += moved
+    return total
+
@@ -0,0 +1,192 @@
+"""
+Async versions of the question feed views, routed instead of the ones in
+views.py when ASYNC_QUESTION_VIEWS is enabled.
+
+They answer exactly like the API views but never hold a thread while they
+wait on the database: reads go through the async ORM, and under ASGI one
+worker can keep many requests in flight. Saving a question still runs in a
+transaction, which the async ORM does not support yet, so that single step
+is handed to the thread of the sync ORM.
+
+These are plain Django views: they are not part of the browsable API nor
+of the Swagger schema. They negotiate the format like the API views, between
+the renderers of REST_FRAMEWORK (JSON or MessagePack) and NDJSON for the
+export; the errors of authentication, permissions and throttling are JSON.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import exceptions, status
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import cache, fast_serializers, fieldsets
+from .archive import feed_archive
+from .authentication import aauthenticate
+from .enrollment import ais_enrolled
+from .models import Classroom, Question
+from .pagination import POSITION_FIELDS, QuestionCursorPagination, seek_parts
+from .renderers import NDJSONRenderer, json_renderer
+from .serializers import QuestionSerializer
+from .throttling import TokenBucketThrottle
+from .views import IsStudent, export_questions, questions_etag, save_question
+
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    # Same bytes as the API views render
+    renderer = json_renderer()
+    return HttpResponse(renderer.render(data), status=status, content_type=renderer.media_type, headers=headers)
+
+
+def negotiate(request, renderer_classes=()):
+    """
+        The renderer and media type of the response, selected like the API views do among the
+        renderers of REST_FRAMEWORK but the browsable API, and `renderer_classes`.
+    """
+    renderers = [renderer_class() for renderer_class in [*api_settings.DEFAULT_RENDERER_CLASSES, *renderer_classes]
+                 if not issubclass(renderer_class, BrowsableAPIRenderer)]
+    try:
+        return DefaultContentNegotiation().select_renderer(Request(request), renderers)
+    except Http404:
+        # Unknown ?format=
+        raise exceptions.NotFound
+
+
+def render_response(data, renderer, media_type, status=status.HTTP_200_OK, headers=None):
+    return HttpResponse(renderer.render(data, media_type), status=status, content_type=renderer.media_type,
+                        headers=headers)
+
+
+def async_api_view(methods, permission_classes=()):
+    """
+        Authenticate, check the permissions and throttle an async view like `@api_view` does,
+        and turn the API exceptions it raises into JSON error responses.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            try:
+                request.user = await aauthenticate(request)
+                for permission_class in permission_classes:
+                    if not permission_class().has_permission(request, None):
+                        if not request.user.is_authenticated:
+                            raise exceptions.NotAuthenticated
+                        raise exceptions.PermissionDenied
+                throttle = TokenBucketThrottle()
+                if throttle.get_limits(request) and not await sync_to_async(throttle.allow_request)(request, None):
+                    raise exceptions.Throttled(throttle.wait())
+                return await view(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                status_code = exc.status_code
+                # Session authentication comes first and has no WWW-Authenticate challenge
+                if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                    status_code = status.HTTP_403_FORBIDDEN
+                # Same body as the exception handler of DRF
+                data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+                response = json_response(data, status=status_code)
+                if getattr(exc, 'wait', None):
+                    response['Retry-After'] = '%d' % exc.wait
+                return response
+
+        # Like the API views, CSRF is only checked for session authentication
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+def parse_data(request):
+    """
+        The submitted data, from a JSON body or a form.
+    """
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'null')
+        except ValueError as exc:
+            raise exceptions.ParseError('JSON parse error - %s' % exc)
+    return request.POST
+
+
+@async_api_view(['POST'], permission_classes=[IsAuthenticated, IsStudent])
+async def post_question(request, classroom_id):
+    """
+        Async version of `views.post_question`.
+    """
+    renderer, media_type = negotiate(request)
+
+    # Get the classroom if exists
+    try:
+        classroom = await Classroom.objects.only('id').aget(id=classroom_id)
+    except Classroom.DoesNotExist:
+        raise exceptions.NotFound
+
+    # Check if user is enrolled
+    if not await ais_enrolled(request.user.id, classroom.id):
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+
+    serializer = QuestionSerializer(data=parse_data(request))
+    if not serializer.is_valid():
+        return render_response(serializer.errors, renderer, media_type, status=status.HTTP_400_BAD_REQUEST)
+    await sync_to_async(save_question)(serializer, request.user, classroom.id)
+    return render_response(serializer.data, renderer, media_type, status=status.HTTP_201_CREATED)
+
+
+@async_api_view(['GET'])
+async def get_questions(request, classroom_id):
+    """
+        Async version of `views.get_questions`, always on the fast serialization path.
+    """
+    renderer, media_type = negotiate(request, [NDJSONRenderer])
+    fields = fieldsets.requested_fields(request, fast_serializers.QUESTION_FIELDS)
+
+    # Answer unchanged feeds from the classroom version alone, without reading the questions
+    etag = last_modified = None
+    feed_version = await Classroom.objects.filter(id=classroom_id).values_list(
+        'question_version', 'last_question_at', 'archived_before').afirst()
+    archived_before = None
+    if feed_version is not None:
+        question_version, last_question_at, archived_before = feed_version
+        etag = questions_etag(request, classroom_id, question_version)
+        if last_question_at is not None:
+            last_modified = int(last_question_at.timestamp())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+    questions = Question.objects.filter(classroom_id=classroom_id)
+    ndjson = isinstance(renderer, NDJSONRenderer)
+    cacheable = etag is not None and not ndjson
+    cached_page = await cache.aget_page(classroom_id, etag) if cacheable else None
+    if ndjson:
+        archive = feed_archive(classroom_id, archived_before)
+        position = await QuestionCursorPagination(archive).aget_position(request, questions)
+        response = export_questions(request, seek_parts(questions, archive, position), renderer, fields)
+    elif cached_page is not None:
+        content, headers = cached_page
+        response = HttpResponse(content, content_type=renderer.media_type, headers=headers)
+        response['X-Cache'] = 'HIT'
+    else:
+        columns = fieldsets.query_fields(fields, POSITION_FIELDS)
+        paginator = QuestionCursorPagination(feed_archive(
+            classroom_id, archived_before, lambda archived: archived.values(*columns)))
+        page = await paginator.apaginate_queryset(questions.values(*columns), request)
+        link_header = paginator.get_link_header()
+        headers = {'Link': link_header} if link_header else {}
+        response = render_response(fast_serializers.question_data(page, fields), renderer, media_type, headers=headers)
+        if cacheable:
+            await cache.aset_page(classroom_id, etag, response.content, headers)
+            response['X-Cache'] = 'MISS'
+
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,141 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.contrib.auth.models import AnonymousUser
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication, get_authorization_header
+
+DEFAULT_TOKEN_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TTL': 60,
+}
+
+
+class TokenCache:
+    """
+        Bounded LRU map of token keys to their (user, token), entries expire after a TTL.
+
+        The map lives in the worker process: changes are dropped by the signal receivers of the
+        process making them, the TTL bounds how long other processes can serve a stale entry.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            user, token, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return user, token
+
+    def set(self, key, user, token):
+        with self.lock:
+            self.entries[key] = (user, token, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def forget_token(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def forget_user(self, user_id):
+        with self.lock:
+            for key in [key for key, (user, _, _) in self.entries.items() if user.pk == user_id]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_config = {**DEFAULT_TOKEN_CACHE, **getattr(settings, 'TOKEN_CACHE', {})}
+token_cache = TokenCache(max_entries=_config['MAX_ENTRIES'], ttl=_config['TTL'])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+        Token authentication remembering the user of recently seen tokens,
+        so that most requests do not query the token and user tables.
+        The cached user carries its role, the permission checks need no further query.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user, token)
+            cached = user, token
+        # Each request gets its own copy, views may change request.user
+        user, token = cached
+        return copy.copy(user), token
+
+    async def aauthenticate(self, request):
+        """
+            Same as `authenticate`, a token missing from the cache is looked up with the async ORM.
+        """
+        key = self.get_key(request)
+        if key is None:
+            return None
+        cached = token_cache.get(key)
+        if cached is None:
+            model = self.get_model()
+            try:
+                token = await model.objects.select_related('user').aget(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+            token_cache.set(key, token.user, token)
+            cached = token.user, token
+        user, token = cached
+        return copy.copy(user), token
+
+    def get_key(self, request):
+        """
+            The token key of the Authorization header, None if there is no token.
+        """
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        elif len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. Token string should not contain invalid characters.'))
+
+
+async def aauthenticate(request):
+    """
+        Authenticate a plain Django request for the async views, like the API views do with
+        SessionAuthentication then CachedTokenAuthentication.
+        Returns the user, AnonymousUser without credentials. Raises AuthenticationFailed or
+        PermissionDenied (CSRF) like the DRF authentication classes.
+    """
+    # Only requests carrying a session cookie can be logged in with a session
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        user = await sync_to_async(get_user)(request)
+        if user.is_active:
+            SessionAuthentication().enforce_csrf(request)
+            return user
+    result = await CachedTokenAuthentication().aauthenticate(request)
+    return result[0] if result is not None else AnonymousUser()
@@ -0,0 +1,161 @@
+"""
+Fan-out of newly posted questions to the clients streaming a classroom.
+
+The broker backend is chosen with the QUESTION_BROKER setting:
+
+    QUESTION_BROKER = {
+        'BACKEND': 'virtual_classroom.broker.InProcessBroker',
+        'OPTIONS': {},
+    }
+
+InProcessBroker only reaches the subscribers of the current process, which
+is enough for a single ASGI worker. RedisBroker relays messages through the
+pub/sub of any Redis compatible server (Redis, Valkey, KeyDB, ...) so every
+worker receives the questions posted on any other one. When its connection
+to the server drops, it reconnects with an exponential backoff; the
+questions posted in the meantime are missed by the live streams.
+"""
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROKER = {
+    'BACKEND': 'virtual_classroom.broker.InProcessBroker',
+    'OPTIONS': {},
+}
+
+
+def classroom_channel(classroom_id):
+    return 'classroom:%s:questions' % classroom_id
+
+
+class Subscription:
+    """
+        The messages of a channel waiting to be read by one subscriber.
+        Messages can be put from any thread, they are read from the subscriber's event loop.
+    """
+
+    def __init__(self, broker, channel, max_pending):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(max_pending)
+
+    def put(self, message):
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        # A subscriber that does not keep up loses its oldest messages
+        # instead of making the queue grow without bounds
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+        Deliver the messages to the subscribers of the current process.
+    """
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        """
+            Start receiving the messages of a channel.
+            Must be called from the event loop the messages will be read from.
+        """
+        subscription = Subscription(self, channel, self.max_pending)
+        with self.lock:
+            self.subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.channel, None)
+
+    def publish(self, channel, message):
+        self.dispatch(channel, message)
+
+    def dispatch(self, channel, message):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+
+class RedisBroker(InProcessBroker):
+    """
+        Relay the messages through Redis pub/sub.
+        A single pub/sub connection per process serves all of its subscribers.
+        The client classes are those of the `redis` package unless given as dotted paths,
+        e.g. the fakeredis ones in the tests.
+    """
+    channel_pattern = 'classroom:*'
+
+    def __init__(self, url='redis://localhost:6379/0', max_pending=100, client_class='redis.Redis',
+                 async_client_class='redis.asyncio.Redis', reconnect_delay=0.5, max_reconnect_delay=30):
+        super().__init__(max_pending=max_pending)
+        self.url = url
+        # Seconds before reconnecting after the pub/sub connection dropped, doubled on every failed attempt
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.client = import_string(client_class).from_url(url)
+        self.async_client_class = import_string(async_client_class)
+        self.listener = None
+
+    def subscribe(self, channel):
+        subscription = super().subscribe(channel)
+        if self.listener is None or self.listener.done():
+            self.listener = subscription.loop.create_task(self.listen())
+        return subscription
+
+    def publish(self, channel, message):
+        self.client.publish(channel, message)
+
+    async def listen(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                async with self.async_client_class.from_url(self.url) as client, \
+                        client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.psubscribe(self.channel_pattern)
+                    delay = self.reconnect_delay
+                    async for message in pubsub.listen():
+                        self.dispatch(message['channel'].decode(), message['data'].decode())
+            except Exception:
+                logger.warning('Redis pub/sub connection lost, reconnecting in %.1fs', delay, exc_info=True)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+        The broker configured in the QUESTION_BROKER setting, created once per process.
+    """
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            config = getattr(settings, 'QUESTION_BROKER', DEFAULT_BROKER)
+            _broker = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+        return _broker
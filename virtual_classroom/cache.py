@@ -0,0 +1,73 @@
+"""
+Cache of the rendered question feed pages.
+
+Pages are stored already rendered to JSON, under keys that contain the
+question version of the classroom. Posting a question bumps that version,
+which invalidates every cached page of the classroom at once; the stale
+entries are then evicted by the cache backend (LRU for locmem).
+
+The cache alias is set with QUESTION_FEED_CACHE, see CACHES in settings.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_CACHE_ALIAS = 'question_feed'
+
+
+class CacheStats:
+    """
+        Hit and miss counters of the question feed cache, for the current process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+stats = CacheStats()
+
+
+def get_feed_cache():
+    return caches[getattr(settings, 'QUESTION_FEED_CACHE', DEFAULT_CACHE_ALIAS)]
+
+
+def page_key(classroom_id, etag):
+    # The ETag already covers the question version, the page and the format
+    return 'question-feed:%s:%s' % (classroom_id, etag.strip('"'))
+
+
+def get_page(classroom_id, etag):
+    """
+        The cached (content, headers) of a page, None if it is not cached.
+    """
+    page = get_feed_cache().get(page_key(classroom_id, etag))
+    stats.record(hit=page is not None)
+    return page
+
+
+def set_page(classroom_id, etag, content, headers):
+    get_feed_cache().set(page_key(classroom_id, etag), (content, headers))
+
+
+async def aget_page(classroom_id, etag):
+    page = await get_feed_cache().aget(page_key(classroom_id, etag))
+    stats.record(hit=page is not None)
+    return page
+
+
+async def aset_page(classroom_id, etag, content, headers):
+    await get_feed_cache().aset(page_key(classroom_id, etag), (content, headers))
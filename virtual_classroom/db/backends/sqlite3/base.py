@@ -0,0 +1,46 @@
+"""
+SQLite backend tuned for concurrent requests on a single node.
+
+Same as django.db.backends.sqlite3, plus:
+- the PRAGMAs of the `pragmas` OPTIONS entry are applied to every new
+  connection (WAL journal by default, so readers never wait for writers);
+- transactions opened with `virtual_classroom.db.transaction.immediate_atomic`
+  start with BEGIN IMMEDIATE, which takes the write lock up front and waits
+  for it with busy_timeout, instead of failing with "database is locked"
+  when a read transaction later tries to write.
+"""
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Durable at each checkpoint rather than at each commit, safe with WAL
+    'synchronous': 'NORMAL',
+    # Milliseconds to wait for a lock before giving up
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative values are in KiB
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Set by immediate_atomic around the start of its transaction
+        self.begin_immediate = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **kwargs.pop('pragmas', {})}
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute('PRAGMA %s = %s' % (name, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN')
@@ -0,0 +1,23 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def immediate_atomic(using=None):
+    """
+        `transaction.atomic` for write transactions.
+        On the tuned SQLite backend the outermost block starts with BEGIN IMMEDIATE,
+        on other databases it is a plain atomic block.
+    """
+    connection = transaction.get_connection(using)
+    immediate = hasattr(connection, 'begin_immediate') and not connection.in_atomic_block
+    if immediate:
+        connection.begin_immediate = True
+    try:
+        with transaction.atomic(using=using):
+            connection.begin_immediate = False
+            yield
+    finally:
+        if immediate:
+            connection.begin_immediate = False
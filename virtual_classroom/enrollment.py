@@ -0,0 +1,182 @@
+"""
+Enrollment of students in classrooms.
+
+Enrollments are written straight to the through table of
+Classroom.enrolled_students: the requested ids are checked and diffed
+against the existing enrollments without loading any User, then the new
+rows are inserted in batches.
+
+The classrooms a student is enrolled in are cached per student (see the
+ENROLLMENT_CACHE setting) so that checking a membership does not hit the
+database. The cache entry is dropped whenever the enrollments of the
+student change. A cached enrollment grants access without asking the
+database, so the cache must be shared by every worker: a process-local
+backend like LocMemCache is ignored, since a student removed on one worker
+would keep their access on the others until the entry expires.
+"""
+import csv
+import io
+import json
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .db.transaction import immediate_atomic
+from .models import Classroom, User, UserRole
+
+EnrollmentResult = namedtuple('EnrollmentResult', ['added', 'skipped', 'invalid'])
+
+# Ids looked up and rows inserted per query
+BATCH_SIZE = 1000
+
+
+class EnrollmentFileError(ValueError):
+    pass
+
+
+# Cache backends holding a copy per process, which the other workers cannot invalidate
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def get_enrollment_cache():
+    """
+        The cache of the enrollments, None when disabled or not shared by the workers.
+    """
+    alias = getattr(settings, 'ENROLLMENT_CACHE', None)
+    if not alias or settings.CACHES[alias]['BACKEND'] in LOCAL_CACHE_BACKENDS:
+        return None
+    return caches[alias]
+
+
+def enrollment_cache_key(user_id):
+    return 'enrolled-classrooms:%s' % user_id
+
+
+def forget_enrollments(user_ids):
+    """
+        Drop the cached enrollments of these users, to be called when they change.
+    """
+    enrollment_cache = get_enrollment_cache()
+    if enrollment_cache is not None:
+        enrollment_cache.delete_many([enrollment_cache_key(user_id) for user_id in user_ids])
+
+
+def is_enrolled(user_id, classroom_id):
+    """
+        Whether a user is enrolled in a classroom.
+        Answered from the user's cached classroom ids when the cache is enabled, otherwise
+        with a single EXISTS on the (classroom, user) unique index of the through table.
+    """
+    Enrollment = Classroom.enrolled_students.through
+    enrollment_cache = get_enrollment_cache()
+    if enrollment_cache is not None:
+        key = enrollment_cache_key(user_id)
+        classroom_ids = enrollment_cache.get(key)
+        if classroom_ids is None:
+            classroom_ids = frozenset(Enrollment.objects.filter(user_id=user_id).values_list('classroom_id', flat=True))
+            enrollment_cache.set(key, classroom_ids, getattr(settings, 'ENROLLMENT_CACHE_TIMEOUT', 300))
+        if int(classroom_id) in classroom_ids:
+            return True
+    # Not cached as enrolled, make sure with the database in case it just happened
+    return Enrollment.objects.filter(classroom_id=classroom_id, user_id=user_id).exists()
+
+
+async def ais_enrolled(user_id, classroom_id):
+    """
+        Same as `is_enrolled`, with the async ORM and cache API.
+    """
+    Enrollment = Classroom.enrolled_students.through
+    enrollment_cache = get_enrollment_cache()
+    if enrollment_cache is not None:
+        key = enrollment_cache_key(user_id)
+        classroom_ids = await enrollment_cache.aget(key)
+        if classroom_ids is None:
+            classroom_ids = frozenset([classroom_id async for classroom_id in
+                                       Enrollment.objects.filter(user_id=user_id).values_list('classroom_id', flat=True)])
+            await enrollment_cache.aset(key, classroom_ids, getattr(settings, 'ENROLLMENT_CACHE_TIMEOUT', 300))
+        if int(classroom_id) in classroom_ids:
+            return True
+    return await Enrollment.objects.filter(classroom_id=classroom_id, user_id=user_id).aexists()
+
+
+def enroll_students(classroom_id, student_ids, batch_size=BATCH_SIZE):
+    """
+        Enroll students in a classroom.
+        Returns how many were added, how many were already enrolled (skipped), and how many
+        ids do not belong to a student (invalid).
+    """
+    Enrollment = Classroom.enrolled_students.through
+    requested = list(OrderedDict.fromkeys(student_ids))
+    already_enrolled = Enrollment.objects.filter(classroom_id=classroom_id, user_id=OuterRef('pk'))
+
+    new_ids, skipped = [], 0
+    with immediate_atomic():
+        # The existing enrollments are read in the write transaction, so that two overlapping requests
+        # do not both add, and count, the same student. BEGIN IMMEDIATE serializes them on SQLite,
+        # the lock on the classroom row does on the other databases.
+        if transaction.get_connection(Classroom.objects.db).features.has_select_for_update:
+            list(Classroom.objects.select_for_update().filter(id=classroom_id).values_list('id', flat=True))
+        for start in range(0, len(requested), batch_size):
+            # Valid student ids of the batch, each flagged if already enrolled, in a single query
+            students = User.objects.filter(id__in=requested[start:start + batch_size], role=UserRole.STUDENT)
+            for student_id, enrolled in students.annotate(enrolled=Exists(already_enrolled)).values_list(
+                    'id', 'enrolled'):
+                if enrolled:
+                    skipped += 1
+                else:
+                    new_ids.append(student_id)
+
+        Enrollment.objects.bulk_create(
+            (Enrollment(classroom_id=classroom_id, user_id=student_id) for student_id in new_ids),
+            batch_size=batch_size, ignore_conflicts=True,
+        )
+        if new_ids:
+            Classroom.record_enrollments(classroom_id, len(new_ids))
+        # bulk_create sends no m2m_changed signal
+        transaction.on_commit(lambda: forget_enrollments(new_ids))
+
+    return EnrollmentResult(added=len(new_ids), skipped=skipped, invalid=len(requested) - len(new_ids) - skipped)
+
+
+def enroll_batch(teacher, enrollments):
+    """
+        Enroll students in several classrooms of a teacher.
+        `enrollments` maps classroom ids to student ids, returns one result per classroom.
+    """
+    owners = dict(Classroom.objects.filter(id__in=enrollments).values_list('id', 'teacher_id'))
+    results = []
+    for classroom_id, student_ids in enrollments.items():
+        if classroom_id not in owners:
+            results.append({'classroom_id': classroom_id, 'error': 'Classroom not found'})
+        elif owners[classroom_id] != teacher.id:
+            results.append({'classroom_id': classroom_id, 'error': 'Only the classroom teacher can add students'})
+        else:
+            result = enroll_students(classroom_id, student_ids)
+            results.append({'classroom_id': classroom_id, **result._asdict()})
+    return results
+
+
+def parse_enrollment_file(upload):
+    """
+        Read an uploaded enrollment file into {classroom id: [student ids]}.
+
+        Either a CSV file with `classroom_id` and `student_id` columns, one enrollment per row,
+        or a JSON file holding a list of {"classroom_id": ..., "student_ids": [...]} objects.
+    """
+    enrollments = OrderedDict()
+    try:
+        if upload.name.lower().endswith('.json'):
+            for item in json.load(upload):
+                enrollments.setdefault(int(item['classroom_id']), []).extend(int(i) for i in item['student_ids'])
+        else:
+            for row in csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig')):
+                enrollments.setdefault(int(row['classroom_id']), []).append(int(row['student_id']))
+    except (KeyError, TypeError, ValueError) as exc:
+        raise EnrollmentFileError('Invalid enrollment file: %s' % exc) from exc
+    return enrollments
@@ -0,0 +1,67 @@
+"""
+Fast serialization path for the read endpoints.
+
+The DRF serializers build every row field by field. For large lists that
+per-field machinery dominates, so when FAST_READ_SERIALIZERS is enabled the
+question feed and the roster pages fetch plain rows with `.values()` and
+format them here. The search and the exports always do. The output is the
+same as the one of the matching serializers in serializers.py.
+
+The classroom list and detail keep the serializers, they embed at most
+ROSTER_PREVIEW_SIZE students each.
+"""
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+
+from .serializers import QuestionSerializer, UserDetailSerializer
+
+# Same fields, in the same order, as the serializers
+QUESTION_FIELDS = tuple(QuestionSerializer.Meta.fields)
+STUDENT_FIELDS = tuple(UserDetailSerializer.Meta.fields)
+
+
+def datetime_field():
+    """
+        A field formatting datetimes exactly like the serializers do.
+        The current timezone is resolved once for the whole list instead of once per row.
+    """
+    if settings.USE_TZ:
+        return serializers.DateTimeField(default_timezone=timezone.get_current_timezone())
+    return serializers.DateTimeField()
+
+
+def question_formatter(fields=QUESTION_FIELDS):
+    """
+        A function formatting one question row fetched with `.values()`, keeping only `fields`.
+    """
+    to_representation = datetime_field().to_representation
+
+    format_timestamp = 'timestamp' in fields
+    # Rows may hold more columns than the fields, e.g. the pagination keys
+    copy = dict if tuple(fields) == QUESTION_FIELDS else lambda row: {field: row[field] for field in fields}
+
+    def format_question(row):
+        row = copy(row)
+        if format_timestamp:
+            row['timestamp'] = to_representation(row['timestamp'])
+        return row
+
+    return format_question
+
+
+def question_data(rows, fields=QUESTION_FIELDS):
+    """
+        Format question rows fetched with `.values()`, keeping only `fields`.
+    """
+    return list(map(question_formatter(fields), rows))
+
+
+def student_data(rows, fields=STUDENT_FIELDS):
+    """
+        Format student rows fetched with `.values()`, keeping only `fields`.
+        The student fields need no conversion, the rows may hold extra columns like the pagination key.
+    """
+    if tuple(fields) == STUDENT_FIELDS:
+        return list(rows)
+    return [{field: row[field] for field in fields} for row in rows]
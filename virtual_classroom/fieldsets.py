@@ -0,0 +1,42 @@
+"""
+Sparse fieldsets of the read endpoints.
+
+With `?fields=id,timestamp` a read endpoint returns only these fields of
+each item, and only fetches the matching columns: the list views select
+them with `.values()` or `.only()`, so large columns like the question
+texts are neither read from disk nor loaded in Python when not asked for.
+Without the parameter every field is returned, as before.
+"""
+from drf_yasg import openapi
+from rest_framework.exceptions import ValidationError
+
+FIELDS_QUERY_PARAM = 'fields'
+
+
+def requested_fields(request, available):
+    """
+        The fields asked for with `?fields=`, in the order of `available`, or all of them.
+        Raises ValidationError for unknown fields.
+    """
+    value = request.GET.get(FIELDS_QUERY_PARAM)
+    if value is None:
+        return tuple(available)
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = names.difference(available)
+    if unknown or not names:
+        raise ValidationError({FIELDS_QUERY_PARAM: ['Unknown fields: %s. Available fields: %s.' % (
+            ', '.join(sorted(unknown)) or '(none)', ', '.join(available))]})
+    return tuple(name for name in available if name in names)
+
+
+def query_fields(fields, required):
+    """
+        The columns to fetch for `fields`, plus the `required` ones, e.g. the pagination keys.
+    """
+    return tuple(fields) + tuple(name for name in required if name not in fields)
+
+
+def swagger_parameter(available):
+    return openapi.Parameter(FIELDS_QUERY_PARAM, openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                             description='Comma separated fields to return, among %s (default all)' % (
+                                 ', '.join(available)))
@@ -0,0 +1,123 @@
+"""
+Password hashing for the signup and login endpoints.
+
+The hashers below take their cost parameters from the PASSWORD_HASHER_COST
+setting, and the first entry of PASSWORD_HASHERS picks the one used for
+new passwords. Changing either makes Django rehash a password the next time
+its user logs in.
+
+Hashing runs on a bounded pool of worker threads (hashlib and argon2-cffi
+release the GIL while hashing). When more hashes are waiting than the pool
+accepts, HashingBusy is raised and the endpoint answers 503 with a
+Retry-After header instead of piling up CPU bound work in front of every
+other request.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+DEFAULT_HASHING_POOL = {
+    'WORKERS': os.cpu_count() or 1,
+    'MAX_PENDING': 32,
+    'QUEUE_TIMEOUT': 0.5,
+}
+
+
+def hasher_cost(algorithm, parameter, default):
+    return getattr(settings, 'PASSWORD_HASHER_COST', {}).get(algorithm, {}).get(parameter, default)
+
+
+class TunedScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return hasher_cost('scrypt', 'work_factor', hashers.ScryptPasswordHasher.work_factor)
+
+    @property
+    def block_size(self):
+        return hasher_cost('scrypt', 'block_size', hashers.ScryptPasswordHasher.block_size)
+
+    @property
+    def parallelism(self):
+        return hasher_cost('scrypt', 'parallelism', hashers.ScryptPasswordHasher.parallelism)
+
+
+class TunedArgon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return hasher_cost('argon2', 'time_cost', hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return hasher_cost('argon2', 'memory_cost', hashers.Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return hasher_cost('argon2', 'parallelism', hashers.Argon2PasswordHasher.parallelism)
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins and signups at the moment, try again shortly.'
+    default_code = 'hashing_busy'
+    # Seconds sent in the Retry-After header
+    wait = 1
+
+
+class HashingPool:
+    """
+        A thread pool accepting at most `workers + max_pending` hashes at a time.
+    """
+
+    def __init__(self, workers, max_pending, queue_timeout):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        self.slots = threading.BoundedSemaphore(workers + max_pending)
+        self.queue_timeout = queue_timeout
+
+    def run(self, function, *args):
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy
+        try:
+            future = self.executor.submit(function, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future.result()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            config = {**DEFAULT_HASHING_POOL, **getattr(settings, 'PASSWORD_HASHING_POOL', {})}
+            _pool = HashingPool(config['WORKERS'], config['MAX_PENDING'], config['QUEUE_TIMEOUT'])
+        return _pool
+
+
+def make_password(password):
+    """
+        Hash a password on the hashing pool.
+    """
+    return get_hashing_pool().run(hashers.make_password, password)
+
+
+def check_password(user, password):
+    """
+        Check the password of a user on the hashing pool, like `user.check_password`.
+        The hash is upgraded when the preferred hasher or its cost changed.
+    """
+    outdated = []
+    is_correct = get_hashing_pool().run(hashers.check_password, password, user.password, outdated.append)
+    if outdated:
+        user.password = make_password(password)
+        user.save(update_fields=['password'])
+    return is_correct
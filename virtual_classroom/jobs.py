@@ -0,0 +1,234 @@
+"""
+Background jobs, queued in the database and run by the `run_jobs` command.
+
+A function decorated with `@task` can be queued instead of being called in
+the request: `task.enqueue(*args, user=..., **kwargs)` inserts a Job row in
+the current transaction and returns it, so a client can poll its status.
+The arguments and the result must be JSON serializable.
+
+Workers poll the queued jobs whose `run_at` is due and claim each one with
+a conditional UPDATE, so any number of `run_jobs` processes can share the
+queue without locks. A job raising an exception is retried later with an
+exponential backoff, up to the `max_attempts` of its task, then marked as
+failed.
+
+While a job runs, its worker renews the job's `heartbeat_at` every
+JOB_QUEUE['HEARTBEAT_INTERVAL'] from a thread, so a long job is left alone.
+Jobs whose heartbeat stopped for JOB_QUEUE['TIMEOUT'], their worker died,
+are queued again.
+
+A job's result can name a file of the default storage under 'file', served
+by the `jobs/<id>/download` endpoint. The workers delete the files of the
+jobs finished for JOB_QUEUE['RESULT_FILE_MAX_AGE'] and drop them from the
+results.
+"""
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_QUEUE = {
+    # Seconds between two polls of an idle worker
+    'POLL_INTERVAL': 1.0,
+    # Jobs claimed per poll
+    'BATCH_SIZE': 10,
+    # Seconds between two heartbeats of a running job
+    'HEARTBEAT_INTERVAL': 30,
+    # Seconds without a heartbeat after which a running job is considered abandoned by its worker
+    'TIMEOUT': 120,
+    # Seconds the files written by the jobs are kept for download after they finished
+    'RESULT_FILE_MAX_AGE': 7 * 24 * 3600,
+}
+
+# Seconds between two deletions of the expired result files by a waiting worker
+EXPIRY_INTERVAL = 3600
+
+# Tasks by name
+TASKS = {}
+
+
+def job_queue_config():
+    return {**DEFAULT_JOB_QUEUE, **getattr(settings, 'JOB_QUEUE', {})}
+
+
+class Task:
+    def __init__(self, func, name, max_attempts, retry_delay):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, user=None, run_at=None, **kwargs):
+        """
+            Queue the task now, in the current transaction. Returns the job.
+        """
+        return Job.objects.create(name=self.name, args=list(args), kwargs=kwargs, user=user,
+                                  max_attempts=self.max_attempts, run_at=run_at or timezone.now())
+
+    def retry_at(self, attempts):
+        # 1, 2, 4... retry delays
+        return timezone.now() + timedelta(seconds=self.retry_delay * 2 ** (attempts - 1))
+
+
+def task(name=None, max_attempts=3, retry_delay=10):
+    """
+        Register a function as a task the workers can run.
+    """
+    def decorator(func):
+        registered = Task(func, name or '%s.%s' % (func.__module__, func.__name__), max_attempts, retry_delay)
+        TASKS[registered.name] = registered
+        return registered
+    return decorator
+
+
+class Heartbeat:
+    """
+        Renews the heartbeat of a running job every `interval` seconds from a thread, while in the block.
+    """
+    def __init__(self, job_id, interval):
+        self.job_id = job_id
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='job-%s-heartbeat' % job_id, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def beat(self):
+        Job.objects.filter(id=self.job_id, status=JobStatus.RUNNING).update(heartbeat_at=timezone.now())
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    self.beat()
+                except Exception:
+                    # Retried on the next beat, the job is only requeued after TIMEOUT without any
+                    logger.warning('Heartbeat of job %s failed', self.job_id, exc_info=True)
+        finally:
+            # The connections of this thread
+            connections.close_all()
+
+
+def requeue_abandoned(timeout):
+    """
+        Queue again, or fail for good, the running jobs without a heartbeat for longer than `timeout`.
+    """
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    abandoned = Job.objects.filter(Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+                                   status=JobStatus.RUNNING)
+    abandoned.filter(attempts__gte=F('max_attempts')).update(
+        status=JobStatus.FAILED, finished_at=timezone.now(), error='Timed out')
+    abandoned.update(status=JobStatus.QUEUED, run_at=timezone.now())
+
+
+def expire_result_files(max_age):
+    """
+        Delete the files of the jobs finished more than `max_age` seconds ago, and drop them from their results.
+        Returns the number of files deleted.
+    """
+    expired = Job.objects.filter(status=JobStatus.SUCCEEDED, finished_at__lt=timezone.now() - timedelta(
+        seconds=max_age), result__has_key='file')
+    count = 0
+    for job in expired.only('id', 'result'):
+        default_storage.delete(job.result.pop('file'))
+        Job.objects.filter(id=job.id).update(result={**job.result, 'expired': True})
+        count += 1
+    return count
+
+
+def claim(batch_size):
+    """
+        Claim up to `batch_size` due jobs for the current worker, oldest first.
+        A job claimed by another worker in the meantime is skipped.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(status=JobStatus.QUEUED, run_at__lte=now).order_by('run_at', 'id').values_list(
+        'id', flat=True)[:batch_size]
+    claimed = []
+    for job_id in list(candidates):
+        if Job.objects.filter(id=job_id, status=JobStatus.QUEUED).update(
+                status=JobStatus.RUNNING, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1):
+            claimed.append(job_id)
+    return list(Job.objects.filter(id__in=claimed).order_by('run_at', 'id'))
+
+
+def run_job(job, heartbeat_interval):
+    """
+        Run a claimed job and record its outcome.
+    """
+    registered = TASKS.get(job.name)
+    try:
+        if registered is None:
+            raise LookupError('Unknown task %s' % job.name)
+        with Heartbeat(job.id, heartbeat_interval):
+            result = registered.func(*job.args, **job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Job %s (%s) failed, attempt %d of %d', job.id, job.name, job.attempts, job.max_attempts,
+                       exc_info=True)
+        if registered is not None and job.attempts < job.max_attempts:
+            Job.objects.filter(id=job.id).update(status=JobStatus.QUEUED, run_at=registered.retry_at(job.attempts),
+                                                 error=error)
+        else:
+            Job.objects.filter(id=job.id).update(status=JobStatus.FAILED, finished_at=timezone.now(), error=error)
+        return False
+    Job.objects.filter(id=job.id).update(status=JobStatus.SUCCEEDED, finished_at=timezone.now(), result=result,
+                                         error='')
+    return True
+
+
+def run_pending(max_jobs=None):
+    """
+        Run the due jobs until none is left, or `max_jobs` were run. Returns the number of jobs run.
+    """
+    config = job_queue_config()
+    count = 0
+    requeue_abandoned(config['TIMEOUT'])
+    while max_jobs is None or count < max_jobs:
+        batch_size = config['BATCH_SIZE'] if max_jobs is None else min(config['BATCH_SIZE'], max_jobs - count)
+        jobs = claim(batch_size)
+        if not jobs:
+            break
+        for job in jobs:
+            run_job(job, config['HEARTBEAT_INTERVAL'])
+            count += 1
+    return count
+
+
+def work(stop, max_jobs=None):
+    """
+        Run the jobs as they are queued, until `stop` (a threading.Event) is set or `max_jobs` were run.
+    """
+    config = job_queue_config()
+    count = 0
+    expired_at = None
+    while not stop.is_set() and (max_jobs is None or count < max_jobs):
+        close_old_connections()
+        if expired_at is None or time.monotonic() - expired_at >= EXPIRY_INTERVAL:
+            expire_result_files(config['RESULT_FILE_MAX_AGE'])
+            expired_at = time.monotonic()
+        ran = run_pending(None if max_jobs is None else max_jobs - count)
+        count += ran
+        if not ran:
+            stop.wait(config['POLL_INTERVAL'])
+    return count
@@ -0,0 +1,321 @@
+"""
+Load testing of the API, used by the `seed_data` and `loadtest` commands.
+
+`seed` fills the database with synthetic teachers, students, classrooms,
+enrollments and questions, all named after SEED_PREFIX and logging in with
+SEED_PASSWORD, each user with a token. `run_scenario` then drives the endpoints with
+a fixed number of concurrent clients, either in-process with the Django
+test client or over HTTP against a running server using the same database,
+and measures the latency, throughput and queries of each endpoint. The
+queries are read from the Server-Timing header of InstrumentationMiddleware.
+Run the server (or the in-process load test) with RATE_LIMITING=0, the write
+endpoints would be throttled otherwise.
+"""
+import http.client
+import json
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlencode, urlsplit
+
+from django.contrib.auth import hashers
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .models import Classroom, Question, User, UserRole
+
+SEED_PREFIX = 'load-'
+SEED_PASSWORD = 'load-password'
+
+# Classrooms of each seeded teacher
+CLASSROOMS_PER_TEACHER = 4
+
+Response = namedtuple('Response', ['status', 'server_timing'])
+Request = namedtuple('Request', ['method', 'path', 'data', 'token'])
+
+
+def seed(users, classrooms, questions, roster_size, batch_size=5000, log=print):
+    """
+        Create `users` users (one teacher for CLASSROOMS_PER_TEACHER classrooms, the others
+        students), `classrooms` classrooms of `roster_size` students, and `questions` questions
+        spread over the classrooms. Returns the number of rows created per table.
+    """
+    rng = random.Random(0)
+    password = hashers.make_password(SEED_PASSWORD)
+    teacher_count = max(classrooms // CLASSROOMS_PER_TEACHER, 1)
+    student_count = max(users - teacher_count, 1)
+
+    log('Creating %d teachers and %d students...' % (teacher_count, student_count))
+    User.objects.bulk_create((
+        User(username='%steacher-%d' % (SEED_PREFIX, i), role=UserRole.TEACHER, password=password)
+        for i in range(teacher_count)), batch_size=batch_size)
+    User.objects.bulk_create((
+        User(username='%sstudent-%d' % (SEED_PREFIX, i), role=UserRole.STUDENT, password=password)
+        for i in range(student_count)), batch_size=batch_size)
+    seeded_users = User.objects.filter(username__startswith=SEED_PREFIX)
+    teacher_ids = list(seeded_users.filter(role=UserRole.TEACHER).values_list('id', flat=True))
+    student_ids = list(seeded_users.filter(role=UserRole.STUDENT).values_list('id', flat=True))
+    Token.objects.bulk_create((Token(key=Token.generate_key(), user_id=user_id)
+                               for user_id in teacher_ids + student_ids), batch_size=batch_size)
+
+    log('Creating %d classrooms of %d students...' % (classrooms, roster_size))
+    Classroom.objects.bulk_create((
+        Classroom(title='%sclass-%d' % (SEED_PREFIX, i), teacher_id=teacher_ids[i % len(teacher_ids)])
+        for i in range(classrooms)), batch_size=batch_size)
+    classroom_ids = list(Classroom.objects.filter(
+        title__startswith=SEED_PREFIX, teacher_id__in=teacher_ids).values_list('id', flat=True))
+    rosters = {classroom_id: rng.sample(student_ids, min(roster_size, len(student_ids)))
+               for classroom_id in classroom_ids}
+    Enrollment = Classroom.enrolled_students.through
+    Enrollment.objects.bulk_create((
+        Enrollment(classroom_id=classroom_id, user_id=student_id)
+        for classroom_id, roster in rosters.items() for student_id in roster), batch_size=batch_size)
+
+    log('Creating %d questions...' % questions)
+    for start in range(0, questions, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, questions)):
+            classroom_id = classroom_ids[i % len(classroom_ids)]
+            batch.append(Question(text='Question %d, could you explain it again?' % i,
+                                  student_id=rng.choice(rosters[classroom_id]), classroom_id=classroom_id))
+        Question.objects.bulk_create(batch)
+        if (start // batch_size) % 20 == 19:
+            log('  %d questions' % (start + len(batch)))
+
+    # The seeded rows skipped the code keeping the classroom counters
+    for start in range(0, len(classroom_ids), batch_size):
+        Classroom.refresh_counters(classroom_ids[start:start + batch_size])
+    Classroom.objects.filter(id__in=classroom_ids).update(last_question_at=timezone.now())
+    return {'users': len(teacher_ids) + len(student_ids), 'classrooms': len(classroom_ids),
+            'enrollments': sum(map(len, rosters.values())), 'questions': questions}
+
+
+def flush(log=print):
+    """
+        Delete the seeded data.
+    """
+    seeded_users = User.objects.filter(username__startswith=SEED_PREFIX)
+    log('Deleting the seeded data...')
+    Question.objects.filter(classroom__teacher__in=seeded_users).delete()
+    Classroom.objects.filter(teacher__in=seeded_users).delete()
+    Token.objects.filter(user__in=seeded_users).delete()
+    seeded_users.delete()
+
+
+class SeedData:
+    """
+        Ids and tokens of the seeded data, picked at random by the scenarios.
+    """
+
+    def __init__(self, sample_size=1000):
+        classrooms = list(Classroom.objects.filter(title__startswith=SEED_PREFIX).values_list(
+            'id', 'teacher_id')[:sample_size])
+        if not classrooms:
+            raise ValueError('No seeded data, run the seed_data command first')
+        enrollments = list(Classroom.enrolled_students.through.objects.filter(
+            classroom_id__in=[classroom_id for classroom_id, _ in classrooms]).values_list(
+            'classroom_id', 'user_id')[:sample_size])
+        user_ids = {teacher_id for _, teacher_id in classrooms} | {user_id for _, user_id in enrollments}
+        tokens = dict(Token.objects.filter(user_id__in=user_ids).values_list('user_id', 'key'))
+
+        self.classrooms = [(classroom_id, tokens[teacher_id]) for classroom_id, teacher_id in classrooms]
+        self.enrollments = [(classroom_id, tokens[user_id]) for classroom_id, user_id in enrollments]
+        self.students = list(User.objects.filter(username__startswith=SEED_PREFIX, role=UserRole.STUDENT)
+                             .values_list('id', 'username')[:sample_size])
+
+
+def question_feed(rng, data):
+    classroom_id, _ = rng.choice(data.classrooms)
+    return Request('GET', reverse('get-questions', args=[classroom_id]), None, None)
+
+
+def question_feed_page(rng, data):
+    classroom_id, _ = rng.choice(data.classrooms)
+    return Request('GET', '%s?%s' % (reverse('get-questions', args=[classroom_id]), urlencode({'page_size': 200})),
+                   None, None)
+
+
+def post_question(rng, data):
+    classroom_id, token = rng.choice(data.enrollments)
+    return Request('POST', reverse('post-question', args=[classroom_id]), {'text': 'Load test question?'}, token)
+
+
+def post_questions(rng, data):
+    classroom_id, token = rng.choice(data.enrollments)
+    questions = [{'text': 'Load test question %d?' % i} for i in range(10)]
+    return Request('POST', reverse('post-questions', args=[classroom_id]), {'questions': questions}, token)
+
+
+def add_students(rng, data):
+    classroom_id, token = rng.choice(data.classrooms)
+    student_ids = [student_id for student_id, _ in rng.sample(data.students, min(10, len(data.students)))]
+    return Request('POST', reverse('add-students-to-classroom', args=[classroom_id]),
+                   {'student_ids': student_ids}, token)
+
+
+def list_classrooms(rng, data):
+    _, token = rng.choice(data.classrooms)
+    return Request('GET', reverse('list-classrooms'), None, token)
+
+
+def get_classroom(rng, data):
+    classroom_id, token = rng.choice(data.classrooms)
+    return Request('GET', reverse('get-classroom', args=[classroom_id]), None, token)
+
+
+def get_classroom_students(rng, data):
+    classroom_id, token = rng.choice(data.classrooms)
+    return Request('GET', reverse('get-classroom-students', args=[classroom_id]), None, token)
+
+
+def classroom_summary(rng, data):
+    _, token = rng.choice(data.classrooms)
+    return Request('GET', reverse('classroom-summary'), None, token)
+
+
+def login(rng, data):
+    _, username = rng.choice(data.students)
+    return Request('POST', reverse('login'), {'username': username, 'password': SEED_PASSWORD}, None)
+
+
+SCENARIOS = {
+    'get-questions': question_feed,
+    'get-questions-200': question_feed_page,
+    'post-question': post_question,
+    'post-questions': post_questions,
+    'add-students': add_students,
+    'list-classrooms': list_classrooms,
+    'get-classroom': get_classroom,
+    'get-classroom-students': get_classroom_students,
+    'classroom-summary': classroom_summary,
+    'login': login,
+}
+
+
+class InProcessClient:
+    def __init__(self):
+        from django.test import Client
+        self.client = Client(raise_request_exception=False)
+
+    def send(self, request):
+        headers = {'HTTP_AUTHORIZATION': 'Token ' + request.token} if request.token else {}
+        if request.method == 'GET':
+            response = self.client.get(request.path, **headers)
+        else:
+            response = self.client.post(request.path, request.data, content_type='application/json', **headers)
+        # Consume streamed responses like a remote client would
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return Response(response.status_code, response.get('Server-Timing', ''))
+
+    def close(self):
+        connection.close()
+
+
+class HTTPClient:
+    """
+        A client keeping one connection alive to the server.
+    """
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.netloc, timeout=30)
+        self.prefix = parts.path.rstrip('/')
+
+    def send(self, request):
+        headers = {'Authorization': 'Token ' + request.token} if request.token else {}
+        body = None
+        if request.data is not None:
+            body = json.dumps(request.data)
+            headers['Content-Type'] = 'application/json'
+        try:
+            self.connection.request(request.method, self.prefix + request.path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            return Response(0, '')
+        return Response(response.status, response.getheader('Server-Timing', ''))
+
+    def close(self):
+        self.connection.close()
+
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def run_scenario(make_request, data, make_client, concurrency, duration):
+    """
+        Send the requests of a scenario from `concurrency` clients for `duration` seconds.
+    """
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def work(seed):
+        rng = random.Random(seed)
+        client = make_client()
+        own_latencies, own_queries, own_errors = [], [], 0
+        try:
+            while time.monotonic() < deadline:
+                request = make_request(rng, data)
+                start = time.perf_counter()
+                response = client.send(request)
+                elapsed = time.perf_counter() - start
+                if 200 <= response.status < 400:
+                    own_latencies.append(elapsed)
+                    match = SERVER_TIMING_QUERIES.search(response.server_timing)
+                    if match:
+                        own_queries.append(int(match.group(1)))
+                else:
+                    own_errors += 1
+        finally:
+            client.close()
+        with lock:
+            latencies.extend(own_latencies)
+            queries.extend(own_queries)
+            errors.append(own_errors)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=work, args=(seed,)) for seed in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, queries, sum(errors), time.monotonic() - started)
+
+
+def percentile(values, percent):
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+def summarize(latencies, queries, errors, elapsed):
+    latencies = sorted(latencies)
+    result = {'requests': len(latencies), 'errors': errors, 'throughput': len(latencies) / elapsed,
+              'queries_per_request': sum(queries) / len(queries) if queries else None}
+    for percent in (50, 95, 99):
+        result['p%d_ms' % percent] = percentile(latencies, percent) * 1000 if latencies else None
+    return result
+
+
+def compare(results, baseline):
+    """
+        Relative change of each measure against a baseline run, per scenario.
+        Positive is slower for the latencies, and faster for the throughput.
+    """
+    changes = {}
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        changes[name] = {
+            measure: (result[measure] - previous[measure]) / previous[measure] * 100
+            for measure in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput')
+            if result.get(measure) is not None and previous.get(measure)
+        }
+    return changes
@@ -0,0 +1,42 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from virtual_classroom.archive import archive_questions
+
+
+class Command(BaseCommand):
+    help = ('Move the questions posted before a cutoff to the archive table. '
+            'The question feeds keep returning them, see virtual_classroom/archive.py.')
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group(required=True)
+        cutoff.add_argument('--before', help='Archive the questions posted before this date or datetime (ISO 8601)')
+        cutoff.add_argument('--older-than-days', type=int, help='Archive the questions older than this many days')
+        parser.add_argument('--classroom', type=int, action='append', dest='classroom_ids',
+                            help='Only archive this classroom, can be repeated')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Questions moved per transaction')
+
+    def handle(self, *args, **options):
+        # The live questions must all be newer than the archived ones, see virtual_classroom/archive.py
+        if options['older_than_days'] is not None:
+            if options['older_than_days'] < 1:
+                raise CommandError('--older-than-days must be at least 1')
+            before = timezone.now() - timedelta(days=options['older_than_days'])
+        else:
+            before = parse_datetime(options['before'])
+            if before is None:
+                date = parse_date(options['before'])
+                if date is None:
+                    raise CommandError('Invalid date: %s' % options['before'])
+                before = datetime.combine(date, time.min)
+            if timezone.is_naive(before):
+                before = timezone.make_aware(before)
+            if before > timezone.now():
+                raise CommandError('Cannot archive the questions posted before a future date: %s' % options['before'])
+
+        total = archive_questions(before, options['classroom_ids'], batch_size=options['batch_size'],
+                                  log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS('Archived %d questions posted before %s' % (total, before.isoformat())))
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+from rest_framework.renderers import JSONRenderer
+
+from virtual_classroom.fast_serializers import QUESTION_FIELDS, STUDENT_FIELDS, question_data
+from virtual_classroom.middleware import DEFAULT_RESPONSE_COMPRESSION, compress
+from virtual_classroom.models import Classroom, Question, User, UserRole
+from virtual_classroom.renderers import MessagePackRenderer, ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = ('Compare the CPU time and size of the response renderers and compressions '
+            'for large question pages and rosters, on a throwaway test database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000],
+                            help='Number of rows to render')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measure, the best one is kept')
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.run(options['sizes'], options['repeat'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def run(self, sizes, repeat):
+        self.seed(max(sizes))
+        renderers = [('json', JSONRenderer()), ('orjson', ORJSONRenderer()), ('msgpack', MessagePackRenderer())]
+        encodings = ['gzip', 'br']
+
+        self.stdout.write('%-10s %8s %-8s %10s %12s' % ('payload', 'rows', 'format', 'render ms', 'bytes') + ''.join(
+            ' %10s %12s' % ('%s ms' % encoding, '%s bytes' % encoding) for encoding in encodings))
+        for size in sizes:
+            payloads = [
+                ('questions', question_data(Question.objects.order_by('-timestamp', '-id').values(
+                    *QUESTION_FIELDS)[:size])),
+                ('roster', list(User.objects.filter(role=UserRole.STUDENT).order_by('id').values(
+                    *STUDENT_FIELDS)[:size])),
+            ]
+            for payload, data in payloads:
+                for name, renderer in renderers:
+                    render_time, content = self.measure(repeat, lambda: renderer.render(data))
+                    line = '%-10s %8d %-8s %10.1f %12d' % (payload, len(data), name, render_time, len(content))
+                    for encoding in encodings:
+                        compress_time, compressed = self.measure(
+                            repeat, lambda: compress(encoding, content, DEFAULT_RESPONSE_COMPRESSION))
+                        line += ' %10.1f %12d' % (compress_time, len(compressed))
+                    self.stdout.write(line)
+
+    def seed(self, size):
+        self.stdout.write('Seeding %d questions and %d students...' % (size, size))
+        teacher = User.objects.create_user(username='bench-teacher', role=UserRole.TEACHER)
+        User.objects.bulk_create((User(username='bench-student-%d' % i, first_name='First %d' % i,
+                                       last_name='Last %d' % i, role=UserRole.STUDENT) for i in range(size)),
+                                 batch_size=5000)
+        student = User.objects.filter(role=UserRole.STUDENT).first()
+        classroom = Classroom.objects.create(title='bench-class', teacher=teacher)
+        Question.objects.bulk_create(
+            (Question(text='Question number %d, could you explain it again?' % i, student=student,
+                      classroom=classroom) for i in range(size)), batch_size=5000)
+
+    def measure(self, repeat, render):
+        best, output = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = render()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000, output
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+from rest_framework.renderers import JSONRenderer
+
+from virtual_classroom.fast_serializers import QUESTION_FIELDS, STUDENT_FIELDS, question_data, student_data
+from virtual_classroom.models import Classroom, Question, User, UserRole
+from virtual_classroom.serializers import QuestionSerializer, UserDetailSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare the DRF serializers with the fast serialization path on a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000],
+                            help='Number of rows to serialize')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measure, the best one is kept')
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.run(options['sizes'], options['repeat'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def run(self, sizes, repeat):
+        classroom = self.seed(max(sizes))
+        questions = Question.objects.filter(classroom=classroom).order_by('-timestamp', '-id')
+        students = User.objects.filter(enrolled_classrooms=classroom).order_by('id')
+
+        self.stdout.write('%-10s %8s %12s %12s %9s %s' % ('endpoint', 'rows', 'drf (ms)', 'fast (ms)', 'speedup', 'same output'))
+        for size in sizes:
+            drf_time, drf_output = self.measure(repeat, lambda: JSONRenderer().render(
+                QuestionSerializer(questions[:size], many=True).data))
+            fast_time, fast_output = self.measure(repeat, lambda: JSONRenderer().render(
+                question_data(questions.values(*QUESTION_FIELDS)[:size])))
+            self.report('questions', size, drf_time, fast_time, drf_output == fast_output)
+
+            drf_time, drf_output = self.measure(repeat, lambda: JSONRenderer().render(
+                UserDetailSerializer(students[:size], many=True).data))
+            fast_time, fast_output = self.measure(repeat, lambda: JSONRenderer().render(
+                student_data(students.values(*STUDENT_FIELDS)[:size])))
+            self.report('students', size, drf_time, fast_time, drf_output == fast_output)
+
+    def seed(self, size):
+        self.stdout.write('Seeding %d questions and %d enrolled students...' % (size, size))
+        teacher = User.objects.create_user(username='bench-teacher', role=UserRole.TEACHER)
+        User.objects.bulk_create((User(username='bench-student-%d' % i, first_name='First %d' % i,
+                                       last_name='Last %d' % i, role=UserRole.STUDENT) for i in range(size)),
+                                 batch_size=5000)
+        students = list(User.objects.filter(role=UserRole.STUDENT).order_by('id'))
+        classroom = Classroom.objects.create(title='bench-class', teacher=teacher)
+        Classroom.enrolled_students.through.objects.bulk_create(
+            (Classroom.enrolled_students.through(classroom=classroom, user=student) for student in students),
+            batch_size=5000)
+        Question.objects.bulk_create(
+            (Question(text='Question number %d, could you explain it again?' % i, student=students[i % len(students)],
+                      classroom=classroom) for i in range(size)), batch_size=5000)
+        return classroom
+
+    def measure(self, repeat, render):
+        best, output = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = render()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000, output
+
+    def report(self, endpoint, rows, drf_time, fast_time, same):
+        self.stdout.write('%-10s %8d %12.1f %12.1f %8.1fx %s' % (
+            endpoint, rows, drf_time, fast_time, drf_time / fast_time, 'yes' if same else 'NO'))
@@ -0,0 +1,99 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from virtual_classroom.models import Classroom, User, UserRole
+
+# Environment of the worker processes of every mode, the rate limits would
+# refuse most of the posts and measure themselves instead of the database
+BASE_ENV = {'RATE_LIMITING': '0'}
+
+# Environment of the worker processes for each mode
+MODES = {
+    'stock sqlite3': {**BASE_ENV, 'DB_SQLITE_TUNING': '0'},
+    'tuned (WAL)': {**BASE_ENV, 'DB_SQLITE_TUNING': '1'},
+    'tuned + coalescing': {**BASE_ENV, 'DB_SQLITE_TUNING': '1', 'QUESTION_WRITE_COALESCING': '1'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Measure post_question throughput with parallel writers on a SQLite file, '
+            'with the stock backend and with the tuned one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Number of concurrent writer threads')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds of posting per mode')
+        parser.add_argument('--worker', action='store_true', help='Internal: run one measure and print it as JSON')
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(json.dumps(self.run_writers(options['writers'], options['duration'])))
+            return
+
+        self.stdout.write('%-20s %8s %10s %8s %10s  %s' % ('mode', 'posted', 'posts/s', 'errors', 'p99 (ms)',
+                                                           'error statuses'))
+        for mode, env in MODES.items():
+            with tempfile.TemporaryDirectory() as directory:
+                # Each mode runs in a fresh process, the database settings are read at startup
+                output = subprocess.run(
+                    [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_sqlite_writers', '--worker',
+                     '--writers', str(options['writers']), '--duration', str(options['duration'])],
+                    env={**os.environ, **env, 'DB_NAME': os.path.join(directory, 'bench.sqlite3')},
+                    check=True, capture_output=True, text=True,
+                ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            self.stdout.write('%-20s %8d %10.1f %8d %10.1f  %s' % (
+                mode, result['posted'], result['posted'] / result['duration'], sum(result['errors'].values()),
+                result['p99'], ', '.join('%s x%d' % item for item in sorted(result['errors'].items())) or '-'))
+
+    def run_writers(self, writers, duration):
+        setup_test_environment()
+        call_command('migrate', verbosity=0)
+        teacher = User.objects.create(username='bench-teacher', role=UserRole.TEACHER)
+        classroom = Classroom.objects.create(title='bench-class', teacher=teacher)
+        students = [User.objects.create(username='bench-student-%d' % i, role=UserRole.STUDENT)
+                    for i in range(writers)]
+        classroom.enrolled_students.add(*students)
+        tokens = [Token.objects.create(user=student).key for student in students]
+        url = reverse('post-question', args=[classroom.id])
+
+        latencies, errors = [], []
+        deadline = time.monotonic() + duration
+
+        def write(token):
+            client = APIClient(raise_request_exception=False)
+            client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                response = client.post(url, {'text': 'Could you go over that again?'})
+                if response.status_code == 201:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors.append(response.status_code)
+            connection.close()
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=write, args=(token,)) for token in tokens]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+        return {'posted': len(latencies), 'errors': Counter(errors), 'duration': elapsed, 'p99': p99}
@@ -0,0 +1,74 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Run in a fresh interpreter per measure: boots the WSGI application like a
+# worker does, then serves requests to it, and prints the timings as JSON
+PROBE = '''
+import json, sys, time
+from wsgiref.util import setup_testing_defaults
+
+start = time.perf_counter()
+from funclass_test.wsgi import application
+timings = {'boot': time.perf_counter() - start}
+
+
+def get(path, query=''):
+    environ = {'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_HOST': 'localhost', 'REMOTE_ADDR': '127.0.0.1'}
+    setup_testing_defaults(environ)
+    statuses = []
+    start = time.perf_counter()
+    response = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b''.join(response)
+    response.close()
+    elapsed = time.perf_counter() - start
+    assert statuses[0].startswith('200'), (path, statuses[0])
+    return elapsed
+
+
+timings['first request'] = get('/metrics')
+timings['docs loaded'] = 'drf_yasg.views' in sys.modules or 'rest_framework.documentation' in sys.modules
+if sys.argv[1] == '1':
+    timings['first schema'] = get('/swagger/', 'format=openapi')
+    timings['next schema'] = get('/swagger/', 'format=openapi')
+print(json.dumps(timings))
+'''
+
+COLUMNS = ('boot', 'first request', 'first schema', 'next schema')
+
+
+class Command(BaseCommand):
+    help = ('Measure the boot time of a WSGI worker, the latency of its first request and of its '
+            'OpenAPI schema requests, with and without the API docs.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Workers started per configuration, the median is kept')
+        parser.add_argument('--schema-file', help='Also measure serving this pre-generated schema')
+
+    def handle(self, *args, **options):
+        configurations = [('docs off', {'API_DOCS': '0'}), ('docs on', {'API_DOCS': '1'})]
+        if options['schema_file']:
+            configurations.append(('schema file', {'API_DOCS': '1',
+                                                   'API_SCHEMA_FILE': os.path.abspath(options['schema_file'])}))
+
+        self.stdout.write('%-12s' % 'workers' + ''.join(' %15s' % ('%s ms' % column) for column in COLUMNS)
+                          + ' %12s' % 'docs loaded')
+        for name, environ in configurations:
+            runs = [self.probe(environ) for _ in range(options['runs'])]
+            line = '%-12s' % name
+            for column in COLUMNS:
+                values = [run[column] for run in runs if column in run]
+                line += ' %15s' % ('%.1f' % (statistics.median(values) * 1000) if values else '-')
+            self.stdout.write(line + ' %12s' % ('yes' if any(run['docs loaded'] for run in runs) else 'no'))
+
+    def probe(self, environ):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'funclass_test.settings'),
+               'API_SCHEMA_FILE': '', **environ}
+        output = subprocess.run([sys.executable, '-c', PROBE, environ['API_DOCS']], cwd=settings.BASE_DIR, env=env,
+                                check=True, capture_output=True, text=True).stdout
+        return json.loads(output.splitlines()[-1])
@@ -0,0 +1,79 @@
+import json
+import platform
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment
+
+from virtual_classroom.loadtest import SCENARIOS, HTTPClient, InProcessClient, SeedData, compare, run_scenario
+
+
+class Command(BaseCommand):
+    help = ('Drive the API endpoints with concurrent clients on the data of the seed_data command, '
+            'and report the latency, throughput and queries per request of each endpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of a running server using the same database, '
+                                          'e.g. http://127.0.0.1:8000. In-process when not given')
+        parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS),
+                            help='Endpoints to drive, all of them by default')
+        parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent clients')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per scenario')
+        parser.add_argument('--output', help='Save the results to this JSON file')
+        parser.add_argument('--compare', help='JSON file of a previous run to compare the results with')
+
+    def handle(self, *args, **options):
+        try:
+            data = SeedData()
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        if options['url']:
+            url = options['url']
+            make_client = lambda: HTTPClient(url)  # noqa: E731
+        else:
+            setup_test_environment()
+            make_client = InProcessClient
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)['results']
+
+        self.stdout.write('%-24s %9s %7s %9s %9s %9s %9s %8s' % (
+            'scenario', 'requests', 'errors', 'req/s', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)', 'queries'))
+        results = {}
+        for name in options['scenarios']:
+            result = results[name] = run_scenario(
+                SCENARIOS[name], data, make_client, options['concurrency'], options['duration'])
+            self.stdout.write('%-24s %9d %7d %9.1f %9s %9s %9s %8s' % (
+                name, result['requests'], result['errors'], result['throughput'],
+                *(self.format(result[measure]) for measure in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'))))
+
+        if baseline is not None:
+            self.stdout.write('\nChange against %s (latencies: + is slower, req/s: + is faster)' % options['compare'])
+            for name, changes in compare(results, baseline).items():
+                self.stdout.write('%-24s %s' % (name, '  '.join(
+                    '%s %+.1f%%' % (measure, change) for measure, change in changes.items())))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'meta': self.meta(options), 'results': results}, output, indent=2)
+            self.stdout.write('Results saved to %s' % options['output'])
+
+    def format(self, value):
+        return '-' if value is None else '%.1f' % value
+
+    def meta(self, options):
+        return {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'target': options['url'] or 'in-process',
+            'concurrency': options['concurrency'],
+            'duration': options['duration'],
+            'database': settings.DATABASES['default']['ENGINE'],
+            'async_question_views': settings.ASYNC_QUESTION_VIEWS,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        }
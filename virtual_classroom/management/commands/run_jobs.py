@@ -0,0 +1,28 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from virtual_classroom.jobs import expire_result_files, job_queue_config, run_pending, work
+
+
+class Command(BaseCommand):
+    help = ('Run the queued background jobs. Start one process per worker, '
+            'they share the queue and delete the expired export files. '
+            'Stops after the current job on SIGINT or SIGTERM.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the due jobs, then exit instead of waiting')
+        parser.add_argument('--max-jobs', type=int, help='Exit after running this many jobs')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            expire_result_files(job_queue_config()['RESULT_FILE_MAX_AGE'])
+            count = run_pending(options['max_jobs'])
+        else:
+            stop = threading.Event()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: stop.set())
+            self.stdout.write('Waiting for jobs...')
+            count = work(stop, options['max_jobs'])
+        self.stdout.write(self.style.SUCCESS('Ran %d jobs' % count))
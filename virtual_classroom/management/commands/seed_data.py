@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from virtual_classroom.loadtest import flush, seed
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with synthetic users, classrooms and questions for the loadtest command.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5000, help='Number of users, teachers and students')
+        parser.add_argument('--classrooms', type=int, default=1000, help='Number of classrooms')
+        parser.add_argument('--questions', type=int, default=1000000, help='Number of questions')
+        parser.add_argument('--roster-size', type=int, default=30, help='Students enrolled in each classroom')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows inserted per query')
+        parser.add_argument('--flush', action='store_true', help='Delete the previously seeded data first')
+
+    def handle(self, *args, **options):
+        log = self.stdout.write
+        if options['flush']:
+            flush(log=log)
+        counts = seed(options['users'], options['classrooms'], options['questions'], options['roster_size'],
+                      batch_size=options['batch_size'], log=log)
+        self.stdout.write(self.style.SUCCESS('Seeded %s' % ', '.join(
+            '%d %s' % (count, table) for table, count in counts.items())))
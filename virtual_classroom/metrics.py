@@ -0,0 +1,170 @@
+"""
+Request metrics, recorded by InstrumentationMiddleware and exported on
+/metrics in the Prometheus text format.
+
+For every URL name the middleware records a latency histogram, a histogram
+of the SQL queries run per request, the time spent in the database and the
+responses by status. Queries are counted by an execute wrapper installed on
+every database connection: it only measures while a request recorder is set
+in the current context, so async views, whose queries run on other threads,
+are counted too.
+
+The metrics live in the worker process, like the question cache stats.
+With REQUEST_METRICS['SAMPLE_RATE'] below 1 only that share of the requests
+is measured, the others skip the instrumentation entirely.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from . import cache
+
+DEFAULT_REQUEST_METRICS = {
+    'SAMPLE_RATE': 1.0,
+    'SERVER_TIMING': True,
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+}
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def metrics_config():
+    return {**DEFAULT_REQUEST_METRICS, **getattr(settings, 'REQUEST_METRICS', {})}
+
+
+class QueryRecorder:
+    """
+        Queries run while serving one request.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.queries += 1
+        recorder.duration += time.perf_counter() - start
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One more count for the values above the last bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield '%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative)
+        yield '%s_sum{%s} %s' % (name, labels, self.sum)
+        yield '%s_count{%s} %d' % (name, labels, self.count)
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_time = 0.0
+        self.responses = Counter()
+
+
+class RequestMetrics:
+    """
+        Metrics of the requests served by the process, per URL name and method.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view, method, status_code, duration, recorder):
+        with self.lock:
+            metrics = self.views.get((view, method))
+            if metrics is None:
+                metrics = self.views[(view, method)] = ViewMetrics()
+            metrics.latency.observe(duration)
+            metrics.queries.observe(recorder.queries)
+            metrics.db_time += recorder.duration
+            metrics.responses[status_code] += 1
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+    def render(self):
+        """
+            The metrics in the Prometheus text format.
+        """
+        lines = [
+            '# HELP http_request_duration_seconds Time spent serving requests, until the response is returned.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        with self.lock:
+            views = sorted(self.views.items())
+            for (view, method), metrics in views:
+                lines.extend(metrics.latency.samples('http_request_duration_seconds', labels(view, method)))
+
+            lines += ['# HELP http_request_db_queries SQL queries run per request.',
+                      '# TYPE http_request_db_queries histogram']
+            for (view, method), metrics in views:
+                lines.extend(metrics.queries.samples('http_request_db_queries', labels(view, method)))
+
+            lines += ['# HELP http_request_db_seconds_total Time spent in SQL queries.',
+                      '# TYPE http_request_db_seconds_total counter']
+            for (view, method), metrics in views:
+                lines.append('http_request_db_seconds_total{%s} %s' % (labels(view, method), metrics.db_time))
+
+            lines += ['# HELP http_responses_total Responses by status code.',
+                      '# TYPE http_responses_total counter']
+            for (view, method), metrics in views:
+                for status_code, count in sorted(metrics.responses.items()):
+                    lines.append('http_responses_total{%s,status="%s"} %d' % (
+                        labels(view, method), status_code, count))
+
+        feed_cache = cache.stats.as_dict()
+        lines += ['# HELP question_feed_cache_hits_total Question feed pages served from the cache.',
+                  '# TYPE question_feed_cache_hits_total counter',
+                  'question_feed_cache_hits_total %d' % feed_cache['hits'],
+                  '# HELP question_feed_cache_misses_total Question feed pages rendered and cached.',
+                  '# TYPE question_feed_cache_misses_total counter',
+                  'question_feed_cache_misses_total %d' % feed_cache['misses']]
+        return '\n'.join(lines) + '\n'
+
+
+def labels(view, method):
+    return 'view="%s",method="%s"' % (view, method)
+
+
+request_metrics = RequestMetrics()
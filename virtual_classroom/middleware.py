@@ -0,0 +1,308 @@
+import asyncio
+import hashlib
+import random
+import threading
+import time
+import zlib
+
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .metrics import QueryRecorder, current_recorder, metrics_config, request_metrics
+from .routers import use_primary
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class PrimaryPinningMiddleware(MiddlewareMixin):
+    """
+        Read-your-writes for the read replica.
+
+        Unsafe requests run against the primary database. After one, the client is pinned
+        to the primary for DATABASE_REPLICA_PIN_SECONDS, long enough for the replica to catch up.
+        Clients are told apart by their Authorization header or session cookie, the pins are
+        kept in the default cache, which must be shared when running several workers.
+    """
+
+    def process_request(self, request):
+        request.primary_pin_key = self.pin_key(request)
+        pinned = request.method not in SAFE_METHODS or (
+            request.primary_pin_key is not None and cache.get(request.primary_pin_key) is not None)
+        use_primary.set(pinned)
+
+    def process_response(self, request, response):
+        key = getattr(request, 'primary_pin_key', None)
+        if key is not None and request.method not in SAFE_METHODS and response.status_code < 400:
+            cache.set(key, True, getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5))
+        use_primary.set(False)
+        return response
+
+    def pin_key(self, request):
+        client = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not client:
+            return None
+        return 'primary-pin:%s' % hashlib.sha256(client.encode()).hexdigest()
+
+
+class InstrumentationMiddleware:
+    """
+        Record the latency and the SQL queries of a sample of the requests per URL name,
+        see metrics.py. The measures are also sent back in a Server-Timing header.
+        Should come first in MIDDLEWARE, to measure the whole request.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = metrics_config()
+        self.sample_rate = config['SAMPLE_RATE']
+        self.server_timing = config['SERVER_TIMING']
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        recorder, context, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_recorder.reset(context)
+        return self.finish(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        recorder, context, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_recorder.reset(context)
+        return self.finish(request, response, recorder, start)
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def start(self):
+        recorder = QueryRecorder()
+        return recorder, current_recorder.set(recorder), time.perf_counter()
+
+    def finish(self, request, response, recorder, start):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match is not None else 'unmatched'
+        request_metrics.record(view, request.method, response.status_code, duration, recorder)
+        if self.server_timing:
+            response['Server-Timing'] = 'app;dur=%.1f, db;dur=%.1f;desc="%d queries"' % (
+                duration * 1000, recorder.duration * 1000, recorder.queries)
+        return response
+
+
+DEFAULT_ADMISSION_CONTROL = {
+    'MAX_CONCURRENT': 64,
+    'QUEUE_TIMEOUT': 0.1,
+    'RETRY_AFTER': 1,
+    'EXEMPT_PATHS': [],
+}
+
+
+class ConcurrencyLimitMiddleware:
+    """
+        Admission control: the process serves at most MAX_CONCURRENT requests at a time.
+        Others wait up to QUEUE_TIMEOUT seconds for a slot, then get a 503 with a Retry-After
+        header instead of queueing up behind the busy workers and dragging the latency of
+        every request. A slot is held until the view returns, streamed bodies do not hold one.
+        Not used when ADMISSION_CONTROL is None.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = getattr(settings, 'ADMISSION_CONTROL', None)
+        if options is None:
+            raise MiddlewareNotUsed
+        config = {**DEFAULT_ADMISSION_CONTROL, **options}
+        self.get_response = get_response
+        self.queue_timeout = config['QUEUE_TIMEOUT']
+        self.retry_after = config['RETRY_AFTER']
+        self.exempt_paths = tuple(config['EXEMPT_PATHS'])
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            self.slots = asyncio.Semaphore(config['MAX_CONCURRENT'])
+        else:
+            self.slots = threading.BoundedSemaphore(config['MAX_CONCURRENT'])
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path.startswith(self.exempt_paths):
+            return self.get_response(request)
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            return self.busy_response()
+        try:
+            return self.get_response(request)
+        finally:
+            self.slots.release()
+
+    async def __acall__(self, request):
+        if request.path.startswith(self.exempt_paths):
+            return await self.get_response(request)
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            return self.busy_response()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.slots.release()
+
+    def busy_response(self):
+        response = JsonResponse({'detail': 'Server busy, try again shortly.'}, status=503)
+        response['Retry-After'] = str(self.retry_after)
+        return response
+
+
+DEFAULT_RESPONSE_COMPRESSION = {
+    # Smaller bodies are sent as they are
+    'MIN_SIZE': 1024,
+    # In order of preference
+    'ENCODINGS': ['br', 'gzip'],
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+    # Streamed as they are, compressing them would hold the events back
+    'EXEMPT_CONTENT_TYPES': ['text/event-stream'],
+}
+
+
+def compressor(encoding, config):
+    """
+        The (compress, flush) functions of a new stream compressed with `encoding`.
+    """
+    if encoding == 'br':
+        stream = brotli.Compressor(quality=config['BROTLI_QUALITY'])
+        return stream.process, stream.finish
+    # wbits=31 writes the gzip header and trailer
+    stream = zlib.compressobj(config['GZIP_LEVEL'], zlib.DEFLATED, 31)
+    return stream.compress, stream.flush
+
+
+def compress(encoding, content, config):
+    compress_chunk, flush = compressor(encoding, config)
+    return compress_chunk(content) + flush()
+
+
+def accepted_encodings(header):
+    """
+        The encodings of an Accept-Encoding header, with their quality.
+    """
+    encodings = {}
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+
+class CompressionMiddleware:
+    """
+        Compress the responses of at least MIN_SIZE bytes with brotli or gzip, whichever the
+        client accepts with the higher quality, the first of ENCODINGS on a tie. Streamed
+        responses are compressed on the fly. Not used when RESPONSE_COMPRESSION is None.
+        Should come before any middleware reading the content, e.g. right after the
+        instrumentation, which then accounts for the compression time.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = getattr(settings, 'RESPONSE_COMPRESSION', None)
+        if options is None:
+            raise MiddlewareNotUsed
+        self.config = {**DEFAULT_RESPONSE_COMPRESSION, **options}
+        self.encodings = self.config['ENCODINGS']
+        self.exempt_content_types = tuple(self.config['EXEMPT_CONTENT_TYPES'])
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def negotiate(self, request):
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = accepted.get(encoding, accepted.get('*', 0))
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or response.get('Content-Type', '').startswith(
+                self.exempt_content_types):
+            return response
+        if not response.streaming and len(response.content) < self.config['MIN_SIZE']:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = self.negotiate(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = self.compress_stream(encoding, response)
+            del response['Content-Length']
+        else:
+            content = compress(encoding, response.content, self.config)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+
+        # The compressed body differs byte for byte, the ETag can only be weak (RFC 9110 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    def compress_stream(self, encoding, response):
+        compress_chunk, flush = compressor(encoding, self.config)
+        chunks = response.streaming_content
+
+        if response.is_async:
+            async def compressed():
+                async for chunk in chunks:
+                    data = compress_chunk(chunk)
+                    if data:
+                        yield data
+                yield flush()
+        else:
+            def compressed():
+                for chunk in chunks:
+                    data = compress_chunk(chunk)
+                    if data:
+                        yield data
+                yield flush()
+        return compressed()
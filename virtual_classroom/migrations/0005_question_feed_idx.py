@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('virtual_classroom', '0004_alter_user_role'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['classroom', 'timestamp', 'id'], name='question_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:01
+
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def set_last_question_at(apps, schema_editor):
+    Classroom = apps.get_model('virtual_classroom', 'Classroom')
+    Question = apps.get_model('virtual_classroom', 'Question')
+    latest = Question.objects.filter(classroom=OuterRef('pk')).values('classroom').annotate(
+        latest=Max('timestamp')).values('latest')
+    Classroom.objects.update(last_question_at=Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('virtual_classroom', '0005_question_feed_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classroom',
+            name='last_question_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='classroom',
+            name='question_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(set_last_question_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_questions_and_students(apps, schema_editor):
+    Classroom = apps.get_model('virtual_classroom', 'Classroom')
+    Question = apps.get_model('virtual_classroom', 'Question')
+    questions = Question.objects.filter(classroom=OuterRef('pk')).values('classroom').annotate(
+        count=Count('*')).values('count')
+    students = Classroom.enrolled_students.through.objects.filter(classroom=OuterRef('pk')).values(
+        'classroom').annotate(count=Count('*')).values('count')
+    Classroom.objects.update(
+        question_count=Coalesce(Subquery(questions), 0),
+        student_count=Coalesce(Subquery(students), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('virtual_classroom', '0006_classroom_question_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classroom',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='classroom',
+            name='student_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_questions_and_students, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.7 on 2026-10-18 16:20
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# Kept in sync with virtual_classroom/search.py
+FTS_TABLE = 'virtual_classroom_question_fts'
+SEARCH_CONFIG = 'english'
+
+SQLITE_FORWARD = [
+    # External content table: the text stays in the question table, only the index is stored
+    "CREATE VIRTUAL TABLE {fts} USING fts5(text, content='virtual_classroom_question', content_rowid='id', "
+    "tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER {fts}_insert AFTER INSERT ON virtual_classroom_question BEGIN "
+    "INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER {fts}_delete AFTER DELETE ON virtual_classroom_question BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER {fts}_update AFTER UPDATE OF text ON virtual_classroom_question BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END",
+    "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS {fts}_insert',
+    'DROP TRIGGER IF EXISTS {fts}_delete',
+    'DROP TRIGGER IF EXISTS {fts}_update',
+    'DROP TABLE IF EXISTS {fts}',
+]
+
+# Same expression as SearchVector('text', config=SEARCH_CONFIG), so that the planner uses the index
+POSTGRESQL_FORWARD = [
+    "CREATE INDEX question_search_idx ON virtual_classroom_question "
+    "USING GIN (to_tsvector('{config}'::regconfig, COALESCE(text, '')))",
+]
+
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS question_search_idx',
+]
+
+
+def run(statements, schema_editor):
+    for statement in statements:
+        schema_editor.execute(statement.format(fts=FTS_TABLE, config=SEARCH_CONFIG))
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            run(SQLITE_FORWARD, schema_editor)
+        except OperationalError:
+            # SQLite built without FTS5, search falls back to scanning the questions
+            run(SQLITE_BACKWARD, schema_editor)
+    elif vendor == 'postgresql':
+        run(POSTGRESQL_FORWARD, schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        run(SQLITE_BACKWARD, schema_editor)
+    elif vendor == 'postgresql':
+        run(POSTGRESQL_BACKWARD, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('virtual_classroom', '0007_classroom_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
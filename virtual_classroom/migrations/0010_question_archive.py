@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('virtual_classroom', '0009_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classroom',
+            name='archived_before',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedQuestion',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('text', models.TextField()),
+                ('timestamp', models.DateTimeField()),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_questions', to='virtual_classroom.classroom')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['classroom', 'timestamp', 'id'], name='archived_question_feed_idx')],
+            },
+        ),
+    ]
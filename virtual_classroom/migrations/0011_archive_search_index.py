@@ -0,0 +1,106 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:05
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# Kept in sync with virtual_classroom/search.py
+FTS_TABLE = 'virtual_classroom_question_fts'
+SEARCH_CONFIG = 'english'
+SEARCHED_TABLES = ['virtual_classroom_question', 'virtual_classroom_archivedquestion']
+
+# 0008 indexed the live questions only, as an external content table
+SQLITE_DROP_LIVE_INDEX = [
+    'DROP TRIGGER IF EXISTS {fts}_insert',
+    'DROP TRIGGER IF EXISTS {fts}_delete',
+    'DROP TRIGGER IF EXISTS {fts}_update',
+    'DROP TABLE IF EXISTS {fts}',
+]
+
+SQLITE_CREATE_LIVE_INDEX = [
+    "CREATE VIRTUAL TABLE {fts} USING fts5(text, content='virtual_classroom_question', content_rowid='id', "
+    "tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER {fts}_insert AFTER INSERT ON virtual_classroom_question BEGIN "
+    "INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER {fts}_delete AFTER DELETE ON virtual_classroom_question BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER {fts}_update AFTER UPDATE OF text ON virtual_classroom_question BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END",
+    "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+]
+
+# A contentless table indexing the live and the archived questions by id, an archived
+# question keeps its id. The texts stay in the question tables.
+SQLITE_CREATE_INDEX = [
+    "CREATE VIRTUAL TABLE {fts} USING fts5(text, content='', tokenize='porter unicode61 remove_diacritics 2')",
+] + [statement for table in SEARCHED_TABLES for statement in [
+    "CREATE TRIGGER %s_search_insert AFTER INSERT ON %s BEGIN "
+    "INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END" % (table, table),
+    "CREATE TRIGGER %s_search_delete AFTER DELETE ON %s BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); END" % (table, table),
+    "CREATE TRIGGER %s_search_update AFTER UPDATE OF text ON %s BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END" % (table, table),
+]] + [
+    'INSERT INTO {fts}(rowid, text) ' + ' UNION ALL '.join('SELECT id, text FROM %s' % table
+                                                          for table in SEARCHED_TABLES),
+]
+
+SQLITE_DROP_INDEX = [
+    'DROP TRIGGER IF EXISTS %s_search_%s' % (table, event)
+    for table in SEARCHED_TABLES for event in ('insert', 'delete', 'update')
+] + [
+    'DROP TABLE IF EXISTS {fts}',
+]
+
+POSTGRESQL_FORWARD = [
+    "CREATE INDEX archived_question_search_idx ON virtual_classroom_archivedquestion "
+    "USING GIN (to_tsvector('{config}'::regconfig, COALESCE(text, '')))",
+]
+
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS archived_question_search_idx',
+]
+
+
+def run(statements, schema_editor):
+    for statement in statements:
+        schema_editor.execute(statement.format(fts=FTS_TABLE, config=SEARCH_CONFIG))
+
+
+def has_fts_table(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        return FTS_TABLE in schema_editor.connection.introspection.table_names(cursor)
+
+
+def index_archive(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    # Without FTS5, 0008 created no index and search scans the questions
+    if vendor == 'sqlite' and has_fts_table(schema_editor):
+        run(SQLITE_DROP_LIVE_INDEX, schema_editor)
+        try:
+            run(SQLITE_CREATE_INDEX, schema_editor)
+        except OperationalError:
+            run(SQLITE_DROP_INDEX, schema_editor)
+    elif vendor == 'postgresql':
+        run(POSTGRESQL_FORWARD, schema_editor)
+
+
+def unindex_archive(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite' and has_fts_table(schema_editor):
+        run(SQLITE_DROP_INDEX, schema_editor)
+        run(SQLITE_CREATE_LIVE_INDEX, schema_editor)
+    elif vendor == 'postgresql':
+        run(POSTGRESQL_BACKWARD, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('virtual_classroom', '0010_question_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_archive, unindex_archive),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 
 
 class UserRole(models.TextChoices):
@@ -21,6 +23,60 @@ class Classroom(models.Model):
     title = models.CharField(max_length=255)
     teacher = models.ForeignKey('User', on_delete=models.CASCADE, related_name='teacher_classrooms')
     enrolled_students = models.ManyToManyField(User, related_name='enrolled_classrooms')
+    # Bumped every time questions are posted, it versions the question feed
+    question_version = models.PositiveBigIntegerField(default=0)
+    last_question_at = models.DateTimeField(null=True, blank=True)
+    # Kept up to date by the writes, read by the teacher summary. The questions moved to
+    # ArchivedQuestion are still counted, archiving leaves question_count unchanged.
+    question_count = models.PositiveIntegerField(default=0)
+    student_count = models.PositiveIntegerField(default=0)
+    # The questions posted before then may have been moved to ArchivedQuestion, see archive.py
+    archived_before = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def record_questions(cls, classroom_id, last_question_at, count=1):
+        """
+            Bump the question feed version and count of a classroom after questions were posted in it.
+            `last_question_at` only moves forward, the transactions may commit out of order.
+        """
+        last_question_at = models.Value(last_question_at, output_field=models.DateTimeField())
+        cls.objects.filter(pk=classroom_id).update(
+            question_version=models.F('question_version') + 1,
+            question_count=models.F('question_count') + count,
+            last_question_at=Greatest(Coalesce('last_question_at', last_question_at), last_question_at),
+        )
+
+    @classmethod
+    def record_question_deleted(cls, classroom_id):
+        """
+            Bump the question feed version and lower the count of a classroom after one of its questions was deleted.
+        """
+        cls.objects.filter(pk=classroom_id).update(
+            question_version=models.F('question_version') + 1,
+            # Never below 0, e.g. for the questions inserted without being counted
+            question_count=Greatest(models.F('question_count') - 1, 0),
+        )
+
+    @classmethod
+    def record_enrollments(cls, classroom_id, count):
+        cls.objects.filter(pk=classroom_id).update(student_count=models.F('student_count') + count)
+
+    @classmethod
+    def refresh_counters(cls, classroom_ids):
+        """
+            Recount the questions and students of classrooms, for changes made outside of
+            `record_questions` and `record_enrollments`.
+        """
+        questions = Question.objects.filter(classroom=models.OuterRef('pk')).values('classroom').annotate(
+            count=models.Count('*')).values('count')
+        archived_questions = ArchivedQuestion.objects.filter(classroom=models.OuterRef('pk')).values(
+            'classroom').annotate(count=models.Count('*')).values('count')
+        students = cls.enrolled_students.through.objects.filter(classroom=models.OuterRef('pk')).values(
+            'classroom').annotate(count=models.Count('*')).values('count')
+        cls.objects.filter(pk__in=classroom_ids).update(
+            question_count=Coalesce(models.Subquery(questions), 0) + Coalesce(models.Subquery(archived_questions), 0),
+            student_count=Coalesce(models.Subquery(students), 0),
+        )
 
 
 # Question model
@@ -29,3 +85,58 @@ class Question(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE)
     timestamp = models.DateTimeField(auto_now_add=True)
     classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='questions')
+
+    class Meta:
+        indexes = [
+            # Backs the keyset pagination of the question feed
+            models.Index(fields=['classroom', 'timestamp', 'id'], name='question_feed_idx'),
+        ]
+
+
+# Question moved out of the live table by the archive_questions command, see archive.py
+class ArchivedQuestion(models.Model):
+    # Same id as the question had, cursors and `since` keep pointing to it
+    id = models.BigIntegerField(primary_key=True)
+    text = models.TextField()
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    timestamp = models.DateTimeField()
+    classroom = models.ForeignKey(Classroom, on_delete=models.CASCADE, related_name='archived_questions')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['classroom', 'timestamp', 'id'], name='archived_question_feed_idx'),
+        ]
+
+
+class JobStatus(models.TextChoices):
+    QUEUED = 'queued', 'Queued'
+    RUNNING = 'running', 'Running'
+    SUCCEEDED = 'succeeded', 'Succeeded'
+    FAILED = 'failed', 'Failed'
+
+
+# Background job, see virtual_classroom/jobs.py
+class Job(models.Model):
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=JobStatus.choices, default=JobStatus.QUEUED)
+    # The user who started the job, the only one allowed to poll it
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.CASCADE, related_name='jobs')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    # Not picked by the workers before then, pushed back after a failed attempt
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Renewed by the worker while the job runs, a stale one means the worker died
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Backs the polling of the workers for the next jobs to run
+            models.Index(fields=['status', 'run_at'], name='job_queue_idx'),
+        ]
@@ -0,0 +1,308 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import namedtuple
+from urllib import parse
+
+from django.db.models import BooleanField, DateTimeField, F, Func, IntegerField, Value
+from django.utils.dateparse import parse_datetime
+from drf_yasg import openapi
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# A position in the question feed. `reverse` tells whether the page starts
+# after this position (older questions) or before it (newer questions).
+Position = namedtuple('Position', ['timestamp', 'id', 'reverse'])
+
+# Columns the pages are cut on, to fetch whatever fields are returned
+POSITION_FIELDS = ('timestamp', 'id')
+
+# Archived questions of a feed, all posted `before` the live ones, see archive.py
+Archive = namedtuple('Archive', ['queryset', 'before'])
+
+
+def encode_cursor(position):
+    """
+        Turn a feed position into an opaque cursor string.
+    """
+    querystring = parse.urlencode({
+        't': position.timestamp.isoformat(),
+        'i': position.id,
+        'r': int(position.reverse),
+    })
+    return urlsafe_b64encode(querystring.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(encoded):
+    """
+        Turn a cursor string back into a feed position.
+        Raises ValueError if the cursor was not produced by `encode_cursor`.
+    """
+    try:
+        querystring = urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+        tokens = parse.parse_qs(querystring, keep_blank_values=True)
+        timestamp = parse_datetime(tokens['t'][0])
+        if timestamp is None:
+            raise ValueError
+        return Position(timestamp=timestamp, id=int(tokens['i'][0]), reverse=bool(int(tokens['r'][0])))
+    except (TypeError, KeyError, IndexError, UnicodeError, ValueError) as exc:
+        raise ValueError('Invalid cursor') from exc
+
+
+def item_position(item, reverse=False):
+    """
+        Position of a question, given either as a model instance or as a `.values()` row.
+    """
+    if isinstance(item, dict):
+        return Position(timestamp=item['timestamp'], id=item['id'], reverse=reverse)
+    return Position(timestamp=item.timestamp, id=item.id, reverse=reverse)
+
+
+class PositionComparison(Func):
+    """
+        `(timestamp, id) < (%s, %s)`, or `>`, as a single SQL row value comparison.
+        Unlike the equivalent `timestamp < t OR (timestamp = t AND id < i)`, the
+        databases bound an index range scan on (timestamp, id) with it.
+    """
+    conditional = True
+    output_field = BooleanField()
+
+    def __init__(self, operator, position):
+        self.operator = operator
+        super().__init__(F('timestamp'), F('id'), Value(position.timestamp, output_field=DateTimeField()),
+                         Value(position.id, output_field=IntegerField()))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sqls, params = [], []
+        for expression in self.get_source_expressions():
+            sql, expression_params = compiler.compile(expression)
+            sqls.append(sql)
+            params.extend(expression_params)
+        return '(%s, %s) %s (%s, %s)' % (sqls[0], sqls[1], self.operator, sqls[2], sqls[3]), params
+
+
+def seek(queryset, position):
+    """
+        Restrict a question queryset to the rows that come after `position`.
+
+        The filter is a row value comparison on (timestamp, id), so with the
+        (classroom, timestamp, id) index every page is a single range scan,
+        however deep the client has scrolled.
+    """
+    if position is None:
+        return queryset.order_by('-timestamp', '-id')
+    if position.reverse:
+        return queryset.filter(PositionComparison('>', position)).order_by('timestamp', 'id')
+    return queryset.filter(PositionComparison('<', position)).order_by('-timestamp', '-id')
+
+
+def seek_parts(queryset, archive, position):
+    """
+        The querysets to read one after the other for the rows after `position`, across the live
+        questions and their `archive`. The archive comes after the live questions towards the older
+        ones, and before them towards the newer ones only when the position is in the archived period.
+    """
+    live = seek(queryset, position)
+    if archive is None:
+        return [live]
+    if position is not None and position.reverse:
+        return [seek(archive.queryset, position), live] if position.timestamp < archive.before else [live]
+    return [live, seek(archive.queryset, position)]
+
+
+def read_parts(parts, limit):
+    """
+        The first `limit` rows of the parts, a part is only queried when the previous ones fall short.
+    """
+    rows = []
+    for part in parts:
+        rows.extend(part[:limit - len(rows)])
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+async def aread_parts(parts, limit):
+    rows = []
+    for part in parts:
+        rows.extend([row async for row in part[:limit - len(rows)]])
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def build_page(rows, position, page_size):
+    """
+        Cut the rows fetched by `seek` (page_size + 1 of them) into a page.
+        Returns the page, newest question first, with the next and previous positions.
+    """
+    has_more = len(rows) > page_size
+    page = list(rows[:page_size])
+    next_position = previous_position = None
+
+    if position is not None and position.reverse:
+        # We walked towards newer questions, put the page back in feed order
+        page.reverse()
+        if has_more:
+            previous_position = item_position(page[0], reverse=True)
+        next_position = item_position(page[-1]) if page else position._replace(reverse=False)
+    else:
+        if has_more:
+            next_position = item_position(page[-1])
+        if position is not None:
+            previous_position = item_position(page[0], reverse=True) if page else position._replace(reverse=True)
+
+    return page, next_position, previous_position
+
+
+class QuestionCursorPagination(BasePagination):
+    """
+        Keyset pagination of a classroom's questions, newest first, reading on into their
+        `archive` (see archive.py) past the oldest live question.
+        The cursors are sent back in the `Link` header so the body stays a plain list.
+    """
+    cursor_query_param = 'cursor'
+    since_query_param = 'since'
+    page_size_query_param = 'page_size'
+    page_size = 50
+    max_page_size = 200
+    invalid_cursor_message = 'Invalid cursor'
+    invalid_since_message = 'Unknown question'
+
+    # Query parameters documented on the paginated endpoints
+    swagger_parameters = [
+        openapi.Parameter(cursor_query_param, openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description='Opaque cursor taken from the Link header of a previous page'),
+        openapi.Parameter(page_size_query_param, openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description='Number of questions per page (max %d)' % max_page_size),
+        openapi.Parameter(since_query_param, openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description='Only return the questions posted after the question with this id'),
+    ]
+
+    def __init__(self, archive=None):
+        self.archive = archive
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.setup(request)
+        self.position = self.get_position(request, queryset)
+
+        rows = read_parts(seek_parts(queryset, self.archive, self.position), self.page_size + 1)
+        page, self.next_position, self.previous_position = build_page(rows, self.position, self.page_size)
+        return page
+
+    async def apaginate_queryset(self, queryset, request):
+        """
+            Same as `paginate_queryset`, with the async ORM.
+            Takes a plain Django request, the query parameters are read from `request.GET`.
+        """
+        self.setup(request)
+        self.position = await self.aget_position(request, queryset)
+
+        rows = await aread_parts(seek_parts(queryset, self.archive, self.position), self.page_size + 1)
+        page, self.next_position, self.previous_position = build_page(rows, self.position, self.page_size)
+        return page
+
+    def setup(self, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_position(self, request, queryset):
+        position, since = self.parse_position(request)
+        if since is None:
+            return position
+        # Start right after the last question the client has seen, towards the newer ones
+        timestamp = queryset.filter(pk=since).values_list('timestamp', flat=True).first()
+        if timestamp is None and self.archive is not None:
+            timestamp = self.archive.queryset.filter(pk=since).values_list('timestamp', flat=True).first()
+        return self.since_position(since, timestamp)
+
+    async def aget_position(self, request, queryset):
+        position, since = self.parse_position(request)
+        if since is None:
+            return position
+        timestamp = await queryset.filter(pk=since).values_list('timestamp', flat=True).afirst()
+        if timestamp is None and self.archive is not None:
+            timestamp = await self.archive.queryset.filter(pk=since).values_list('timestamp', flat=True).afirst()
+        return self.since_position(since, timestamp)
+
+    def parse_position(self, request):
+        """
+            The position given by the cursor, or the question id given by `since` that
+            still has to be looked up.
+        """
+        encoded = request.GET.get(self.cursor_query_param)
+        if encoded:
+            try:
+                return decode_cursor(encoded), None
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+
+        since = request.GET.get(self.since_query_param)
+        if since:
+            try:
+                return None, int(since)
+            except ValueError:
+                raise NotFound(self.invalid_since_message)
+
+        return None, None
+
+    def since_position(self, since, timestamp):
+        if timestamp is None:
+            raise NotFound(self.invalid_since_message)
+        return Position(timestamp=timestamp, id=since, reverse=True)
+
+    def get_link(self, position):
+        if position is None:
+            return None
+        url = remove_query_param(self.base_url, self.since_query_param)
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(position))
+
+    def get_link_header(self):
+        return link_header(self.get_link(self.next_position), self.get_link(self.previous_position))
+
+    def get_paginated_response(self, data):
+        return paginated_response(data, self.get_link_header())
+
+
+class StudentCursorPagination(CursorPagination):
+    """
+        Pages of a classroom roster, by student id.
+        Like the question feed, the cursors are sent in the `Link` header so the body stays a plain list.
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    swagger_parameters = [
+        openapi.Parameter(CursorPagination.cursor_query_param, openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                          description='Opaque cursor taken from the Link header of a previous page'),
+        openapi.Parameter(page_size_query_param, openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                          description='Number of students per page (max %d)' % max_page_size),
+    ]
+
+    def get_paginated_response(self, data):
+        return paginated_response(data, link_header(self.get_next_link(), self.get_previous_link()))
+
+
+def link_header(next_url, previous_url):
+    links = []
+    for url, rel in ((next_url, 'next'), (previous_url, 'prev')):
+        if url is not None:
+            links.append('<%s>; rel="%s"' % (url, rel))
+    return ', '.join(links)
+
+
+def paginated_response(data, link_header):
+    headers = {'Link': link_header} if link_header else {}
+    return Response(data, headers=headers)
@@ -0,0 +1,151 @@
+"""
+Writing questions.
+
+Every write goes through `create_questions`: the questions are inserted with
+a single bulk INSERT, the feed version of their classrooms is bumped, and
+they are published to the live streams once the transaction commits. The
+questions are saved by then: a broker failure is logged, the live streams
+miss them but the feed still returns them.
+
+With QUESTION_WRITE_COALESCING set, the questions posted one by one at the
+same time are gathered for a few milliseconds and written together: the
+first request of a batch waits for the others, then writes the whole batch
+in one transaction while the others wait for their own result. Bursts of
+posts then cost one transaction instead of one each.
+"""
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from .broker import classroom_channel, get_broker
+from .db.transaction import immediate_atomic
+from .models import Classroom, Question
+from .renderers import json_renderer
+from .serializers import QuestionSerializer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WRITE_COALESCING = {
+    # Seconds the first question of a batch waits for others
+    'WINDOW': 0.005,
+    'MAX_BATCH': 200,
+}
+
+
+def create_questions(questions):
+    """
+        Insert unsaved questions in one transaction, bump the feed version of their classrooms
+        and publish them once committed. Returns the questions, with their ids.
+    """
+    with immediate_atomic():
+        questions = Question.objects.bulk_create(questions)
+        latest, counts = {}, Counter()
+        for question in questions:
+            latest[question.classroom_id] = max(latest.get(question.classroom_id, question.timestamp),
+                                                question.timestamp)
+            counts[question.classroom_id] += 1
+        for classroom_id, timestamp in latest.items():
+            Classroom.record_questions(classroom_id, timestamp, counts[classroom_id])
+
+        # bulk_create sends no signal, push the questions to the live streams ourselves
+        renderer = json_renderer()
+        messages = [(classroom_channel(question.classroom_id),
+                     '%s:%s' % (question.id, renderer.render(QuestionSerializer(question).data).decode()))
+                    for question in questions]
+        transaction.on_commit(lambda: publish(messages))
+    return questions
+
+
+def publish(messages):
+    try:
+        broker = get_broker()
+        for channel, message in messages:
+            broker.publish(channel, message)
+    except Exception:
+        # Failing here would answer 500 for committed questions, which the clients would post again
+        logger.warning('Could not publish %d questions to the live streams', len(messages), exc_info=True)
+
+
+class Batch:
+    def __init__(self):
+        self.questions = []
+        self.futures = []
+        self.full = threading.Event()
+
+
+class QuestionCoalescer:
+    """
+        Gathers the questions submitted by concurrent threads into batches written together.
+    """
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self.lock = threading.Lock()
+        self.batch = None
+
+    def submit(self, question):
+        """
+            Save an unsaved question along with the ones submitted at the same time.
+            Blocks until it is committed and returns it with its id.
+        """
+        future = Future()
+        with self.lock:
+            batch = self.batch
+            leader = batch is None
+            if leader:
+                batch = self.batch = Batch()
+            batch.questions.append(question)
+            batch.futures.append(future)
+            if len(batch.questions) >= self.max_batch:
+                # Later questions start a new batch
+                self.batch = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self.lock:
+                if self.batch is batch:
+                    self.batch = None
+            self.flush(batch)
+        return future.result()
+
+    def flush(self, batch):
+        try:
+            questions = create_questions(batch.questions)
+        except DatabaseError:
+            # Write them one by one, so that a failing question only fails its own request
+            for question, future in zip(batch.questions, batch.futures):
+                try:
+                    future.set_result(create_questions([question])[0])
+                except Exception as exc:
+                    future.set_exception(exc)
+        except Exception as exc:
+            for future in batch.futures:
+                future.set_exception(exc)
+        else:
+            for question, future in zip(questions, batch.futures):
+                future.set_result(question)
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer():
+    """
+        The coalescer of the process, None when QUESTION_WRITE_COALESCING is not set.
+    """
+    global _coalescer
+    options = getattr(settings, 'QUESTION_WRITE_COALESCING', None)
+    if options is None:
+        return None
+    with _coalescer_lock:
+        if _coalescer is None:
+            config = {**DEFAULT_WRITE_COALESCING, **options}
+            _coalescer = QuestionCoalescer(config['WINDOW'], config['MAX_BATCH'])
+        return _coalescer
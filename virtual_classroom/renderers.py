@@ -0,0 +1,85 @@
+"""
+Renderers of the API responses.
+
+ORJSONRenderer gives the same bytes as DRF's JSONRenderer, several times
+faster, with the `orjson` package. MessagePackRenderer renders the same data
+as MessagePack, a compact binary format, for the clients sending
+`Accept: application/msgpack` or `?format=msgpack`. Both are enabled in
+REST_FRAMEWORK in the settings.
+"""
+import json
+
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import encoders
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+        Render a list as newline delimited JSON, one item per line.
+        Used to stream large exports, see `render_item`.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        return b''.join(self.render_item(item) for item in items)
+
+    def render_item(self, item):
+        # JSON strings never contain raw newlines, so one item is always one line
+        return json.dumps(item, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode() + b'\n'
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+        JSONRenderer rendering with orjson. Falls back to JSONRenderer for the outputs orjson
+        cannot produce: indented by other than 2 spaces, ASCII only or not compact.
+    """
+    # Types orjson does not render like the encoder of DRF, e.g. datetimes ending with 'Z', are left to it
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if data is None or indent not in (None, 2) or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        options = self.options | orjson.OPT_INDENT_2 if indent else self.options
+        try:
+            ret = orjson.dumps(data, default=encoders.JSONEncoder().default, option=options)
+        except TypeError:
+            # e.g. integers too large for orjson
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer, for the responses embedded in JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+        Render the data as MessagePack. Dates, decimals and other types without a
+        MessagePack equivalent are rendered as in JSON.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encoders.JSONEncoder().default, use_bin_type=True)
+
+
+def json_renderer():
+    """
+        The JSON renderer of REST_FRAMEWORK, for the responses rendered outside of the API views.
+    """
+    for renderer_class in api_settings.DEFAULT_RENDERER_CLASSES:
+        if issubclass(renderer_class, JSONRenderer):
+            return renderer_class()
+    return JSONRenderer()
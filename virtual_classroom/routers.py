@@ -0,0 +1,37 @@
+"""
+Routing of the queries between the primary database and its read replica.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Whether the queries of the current request must go to the primary,
+# set by PrimaryPinningMiddleware and by any write
+use_primary = ContextVar('use_primary', default=False)
+
+
+class PrimaryReplicaRouter:
+    """
+        Send the reads to the 'replica' database when there is one, the writes to 'default'.
+
+        A request that writes, that is not a GET/HEAD, or that comes from a client who
+        wrote a few seconds ago reads from the primary, so clients always see their own writes.
+    """
+    primary_alias = 'default'
+    replica_alias = 'replica'
+
+    def has_replica(self):
+        return self.replica_alias in settings.DATABASES
+
+    def db_for_read(self, model, **hints):
+        if use_primary.get() or not self.has_replica():
+            return self.primary_alias
+        return self.replica_alias
+
+    def db_for_write(self, model, **hints):
+        use_primary.set(True)
+        return self.primary_alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same data
+        return True
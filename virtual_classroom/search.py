@@ -0,0 +1,174 @@
+"""
+Full-text search over the question texts, live and archived.
+
+The index is created by the 0008_question_search_index and
+0011_archive_search_index migrations and kept in sync by the database
+itself, whatever writes the questions:
+
+- on SQLite, a contentless FTS5 table over the text of both question
+  tables, keyed by question id (a question keeps its id when archived),
+  maintained by triggers, with the porter stemmer so that "explain" also
+  finds "explained";
+- on PostgreSQL, a GIN index on the english `tsvector` of the text of each
+  table, used by the same `SearchVector` expression as the one below.
+
+The SQLite schema editor drops the triggers of a table it remakes, as some
+later migrations altering the question tables would do, so they are checked
+after every `migrate` and recreated with the index by `ensure_search_triggers`.
+
+Every word of the search must appear in a question for it to match. Other
+databases, and SQLite builds without FTS5, fall back to a scan of the
+classroom's questions with `icontains` on each word.
+"""
+import re
+
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+from .models import ArchivedQuestion, Question
+
+FTS_TABLE = 'virtual_classroom_question_fts'
+SEARCH_CONFIG = 'english'
+
+# The migration creating the current index and its triggers
+INDEX_MIGRATION = ('virtual_classroom', '0011_archive_search_index')
+
+WORD = re.compile(r'\w+')
+
+# Whether the FTS5 table exists, per database alias
+_fts_tables = {}
+
+
+# Bodies of the triggers keeping the FTS5 index in sync with each question table, by event
+TRIGGER_BODIES = {
+    'insert': 'AFTER INSERT ON {table} BEGIN INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END',
+    'delete': ("AFTER DELETE ON {table} BEGIN "
+               "INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); END"),
+    'update': ("AFTER UPDATE OF text ON {table} BEGIN "
+               "INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.id, old.text); "
+               "INSERT INTO {fts}(rowid, text) VALUES (new.id, new.text); END"),
+}
+
+
+def sqlite_triggers():
+    """
+        The statements creating the FTS5 triggers, by trigger name. Same as in the 0011 migration.
+    """
+    triggers = {}
+    for model in (Question, ArchivedQuestion):
+        table = model._meta.db_table
+        for event, body in TRIGGER_BODIES.items():
+            name = '%s_search_%s' % (table, event)
+            triggers[name] = 'CREATE TRIGGER %s %s' % (name, body.format(table=table, fts=FTS_TABLE))
+    return triggers
+
+
+def ensure_search_triggers(using='default'):
+    """
+        Recreate the missing FTS5 triggers, then rebuild the index that missed their updates.
+        Returns the names of the recreated triggers.
+    """
+    _fts_tables.pop(using, None)
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not has_fts_table(using) or \
+            INDEX_MIGRATION not in MigrationRecorder(connection).applied_migrations():
+        return []
+    triggers = sqlite_triggers()
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s)" % ', '.join(
+            ['%s'] * len(triggers)), list(triggers))
+        missing = sorted(set(triggers).difference(row[0] for row in cursor.fetchall()))
+        for name in missing:
+            cursor.execute(triggers[name])
+        if missing:
+            # A contentless table cannot be rebuilt from its content, index every question again
+            cursor.execute("INSERT INTO {fts}({fts}) VALUES ('delete-all')".format(fts=FTS_TABLE))
+            cursor.execute('INSERT INTO {fts}(rowid, text) SELECT id, text FROM {live} '
+                           'UNION ALL SELECT id, text FROM {archive}'.format(
+                               fts=FTS_TABLE, live=Question._meta.db_table, archive=ArchivedQuestion._meta.db_table))
+    return missing
+
+
+def search_words(text):
+    return WORD.findall(text or '')[:32]
+
+
+def has_fts_table(alias):
+    if alias not in _fts_tables:
+        with connections[alias].cursor() as cursor:
+            _fts_tables[alias] = FTS_TABLE in connections[alias].introspection.table_names(cursor)
+    return _fts_tables[alias]
+
+
+def fts_query(words):
+    """
+        An FTS5 query matching the rows containing every word.
+        The words are quoted so that the FTS5 operators typed in a search are taken literally.
+    """
+    return ' '.join('"%s"' % word for word in words)
+
+
+def backend(alias):
+    vendor = connections[alias].vendor
+    if vendor == 'sqlite' and has_fts_table(alias):
+        return 'fts5'
+    if vendor == 'postgresql':
+        return 'postgresql'
+    return None
+
+
+def matching(queryset, text):
+    """
+        Restrict a live or archived question queryset to the questions matching the search.
+    """
+    words = search_words(text)
+    if not words:
+        return queryset.none()
+
+    engine = backend(queryset.db)
+    if engine == 'fts5':
+        return queryset.filter(id__in=RawSQL(
+            'SELECT rowid FROM %s WHERE %s MATCH %%s' % (FTS_TABLE, FTS_TABLE), (fts_query(words),)))
+    if engine == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchVector
+        return queryset.annotate(search=SearchVector('text', config=SEARCH_CONFIG)).filter(
+            search=SearchQuery(' '.join(words), config=SEARCH_CONFIG))
+
+    condition = Q()
+    for word in words:
+        condition &= Q(text__icontains=word)
+    return queryset.filter(condition)
+
+
+def ranked_ids(classroom_id, text, limit, using='default'):
+    """
+        Ids of the `limit` questions of a classroom, live or archived, matching the search best, best first.
+        Without a full-text index every match ranks the same and the newest come first.
+    """
+    words = search_words(text)
+    if not words:
+        return []
+
+    engine = backend(using)
+    if engine == 'fts5':
+        # Rank in the FTS5 table itself, bm25 needs the full-text query context
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM {fts} WHERE {fts} MATCH %s AND rowid IN ('
+                'SELECT id FROM {live} WHERE classroom_id = %s UNION ALL SELECT id FROM {archive} WHERE classroom_id = %s'
+                ') ORDER BY rank, rowid DESC LIMIT %s'.format(
+                    fts=FTS_TABLE, live=Question._meta.db_table, archive=ArchivedQuestion._meta.db_table),
+                [fts_query(words), classroom_id, classroom_id, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    parts = [matching(model.objects.using(using).filter(classroom_id=classroom_id), text)
+             for model in (Question, ArchivedQuestion)]
+    if engine == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+        order = SearchRank(SearchVector('text', config=SEARCH_CONFIG), SearchQuery(' '.join(words), config=SEARCH_CONFIG))
+    else:
+        order = F('timestamp')
+    parts = [part.annotate(order=order).values('id', 'order') for part in parts]
+    return [row['id'] for row in parts[0].union(parts[1], all=True).order_by('-order', '-id')[:limit]]
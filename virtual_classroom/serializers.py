@@ -1,5 +1,18 @@
 from rest_framework import serializers
-from .models import Classroom, Question, User
+from .hashers import make_password
+from .models import Classroom, Job, Question, User
+
+
+class SparseFieldsMixin:
+    """
+        Takes a `fields` argument restricting the output to these fields, see fieldsets.py.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields).difference(fields):
+                self.fields.pop(name)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -7,9 +20,15 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'first_name', 'last_name', 'role', 'password']
 
+    def create(self, validated_data):
+        # Hash the password before saving, so the user is written once
+        validated_data['password'] = make_password(validated_data['password'])
+        validated_data['username'] = User.normalize_username(validated_data['username'])
+        return super().create(validated_data)
+
 
 # Used for returning users we shall not return the password
-class UserDetailSerializer(serializers.ModelSerializer):
+class UserDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'first_name', 'last_name', 'role')
@@ -24,14 +43,52 @@ class ClassroomSerializer(serializers.ModelSerializer):
         extra_kwargs = {'teacher': {'read_only': True}}
 
 
+class ClassroomDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Only the first students, prefetched into `roster_preview`, the whole roster is paginated separately
+    enrolled_students = UserDetailSerializer(many=True, read_only=True, source='roster_preview')
+
+    class Meta:
+        model = Classroom
+        fields = ['id', 'title', 'teacher', 'student_count', 'question_count', 'last_question_at',
+                  'enrolled_students']
+        read_only_fields = fields
+
+
+class ClassroomSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Classroom
+        fields = ['id', 'title', 'question_count', 'student_count', 'last_question_at']
+        read_only_fields = fields
+
+
 class EnrollStudentSerializer(serializers.Serializer):
     student_ids = serializers.ListField(
         child=serializers.IntegerField()
     )
 
 
-class QuestionSerializer(serializers.ModelSerializer):
+class ClassroomEnrollmentSerializer(EnrollStudentSerializer):
+    classroom_id = serializers.IntegerField()
+
+
+class BulkEnrollmentSerializer(serializers.Serializer):
+    enrollments = ClassroomEnrollmentSerializer(many=True)
+
+
+class QuestionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Question
         fields = ['id', 'text', 'student_id', 'classroom_id', 'timestamp']
         read_only_fields = ('student', 'classroom', 'timestamp')
+
+
+class QuestionBatchSerializer(serializers.Serializer):
+    # Each question is validated on its own with QuestionSerializer
+    questions = serializers.ListField(child=serializers.DictField(), min_length=1, max_length=500)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'name', 'status', 'attempts', 'created_at', 'started_at', 'finished_at', 'result', 'error']
+        read_only_fields = fields
@@ -0,0 +1,83 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import search
+from .authentication import token_cache
+from .enrollment import forget_enrollments
+from .metrics import install_query_recorder
+from .models import Classroom, Question, User
+
+
+@receiver(m2m_changed, sender=Classroom.enrolled_students.through)
+def enrollments_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+        Drop the cached enrollments of the students whose classrooms changed.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # user.enrolled_classrooms was changed
+        forget_enrollments([instance.pk])
+    elif action == 'pre_clear':
+        forget_enrollments(instance.enrolled_students.values_list('pk', flat=True))
+    else:
+        forget_enrollments(pk_set)
+
+
+@receiver(m2m_changed, sender=Classroom.enrolled_students.through)
+def enrollment_counts_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+        Recount the students of the classrooms whose enrollments were changed through the ORM.
+        The enrollment endpoints write the through table directly and count as they go.
+    """
+    if action == 'pre_clear' and reverse:
+        # The classrooms of the user are unknown once cleared
+        instance._cleared_classroom_ids = list(instance.enrolled_classrooms.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            classroom_ids = [instance.pk]
+        elif action == 'post_clear':
+            classroom_ids = instance.__dict__.pop('_cleared_classroom_ids', [])
+        else:
+            classroom_ids = pk_set
+        Classroom.refresh_counters(classroom_ids)
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted(sender, instance, **kwargs):
+    """
+        Uncount a deleted question and change the feed version, so that no cached page keeps serving it.
+        Also sent for the questions deleted along with their student or classroom.
+    """
+    Classroom.record_question_deleted(instance.classroom_id)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.forget_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    """
+        Drop the cached tokens of a user when it changes, e.g. its password, role or active flag.
+    """
+    if not created:
+        token_cache.forget_user(instance.pk)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    # Count the queries of the instrumented requests, see metrics.py
+    install_query_recorder(connection)
+
+
+@receiver(post_migrate)
+def migrated(sender, using, **kwargs):
+    """
+        Recreate the FTS5 triggers dropped when a migration remade a question table, see search.py.
+    """
+    if sender.name == 'virtual_classroom':
+        search.ensure_search_triggers(using)
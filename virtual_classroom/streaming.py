@@ -0,0 +1,84 @@
+"""
+Server-Sent Events support for the live question stream.
+"""
+import asyncio
+import time
+
+from django.conf import settings
+
+# Seconds between two keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+# Streams are closed after this many seconds and the browser reconnects,
+# this bounds the life of a stream whose client vanished without notice
+MAX_STREAM_DURATION = 300
+
+
+def format_event(data, event=None, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append('id: %s' % event_id)
+    if event is not None:
+        lines.append('event: %s' % event)
+    lines.extend('data: %s' % line for line in data.splitlines())
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+async def event_stream(subscription):
+    """
+        Turn the messages of a broker subscription into Server-Sent Events.
+        Each message is a (question id, JSON) pair.
+    """
+    heartbeat = getattr(settings, 'QUESTION_STREAM_HEARTBEAT', HEARTBEAT_INTERVAL)
+    deadline = time.monotonic() + getattr(settings, 'QUESTION_STREAM_MAX_DURATION', MAX_STREAM_DURATION)
+    try:
+        yield ('retry: %d\n\n' % (heartbeat * 1000)).encode()
+        while time.monotonic() < deadline:
+            try:
+                message = await asyncio.wait_for(subscription.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield b': keep-alive\n\n'
+                continue
+            question_id, data = message.split(':', 1)
+            yield format_event(data, event='question', event_id=question_id)
+    finally:
+        subscription.close()
+
+
+def cancel_on_disconnect(application):
+    """
+        ASGI middleware cancelling the response of a client that disconnected.
+
+        Django only listens to the client while it reads the request body, so
+        without this an abandoned event stream would wait on its subscription
+        until MAX_STREAM_DURATION.
+    """
+
+    async def app(scope, receive, send):
+        if scope['type'] != 'http':
+            return await application(scope, receive, send)
+
+        body_read = asyncio.Event()
+
+        async def receive_body():
+            message = await receive()
+            if message['type'] != 'http.request' or not message.get('more_body', False):
+                body_read.set()
+            return message
+
+        async def wait_for_disconnect():
+            await body_read.wait()
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        response = asyncio.ensure_future(application(scope, receive_body, send))
+        disconnect = asyncio.ensure_future(wait_for_disconnect())
+        await asyncio.wait([response, disconnect], return_when=asyncio.FIRST_COMPLETED)
+        for task in (response, disconnect):
+            if not task.done():
+                task.cancel()
+        try:
+            await response
+        except asyncio.CancelledError:
+            pass
+
+    return app
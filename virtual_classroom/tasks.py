@@ -0,0 +1,50 @@
+"""
+Background tasks run by the workers of jobs.py.
+"""
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from . import fast_serializers
+from .enrollment import enroll_batch
+from .jobs import task
+from .models import ArchivedQuestion, Question, User
+from .renderers import NDJSONRenderer
+
+# Rows read per query while exporting
+EXPORT_CHUNK_SIZE = 2000
+
+
+@task(max_attempts=3)
+def export_classroom_questions(classroom_id):
+    """
+        Write every question of a classroom, oldest first, to an NDJSON file of the default storage.
+        The archived questions come first, they are older than the live ones.
+    """
+    parts = [model.objects.filter(classroom_id=classroom_id).order_by('timestamp', 'id').values(
+        *fast_serializers.QUESTION_FIELDS) for model in (ArchivedQuestion, Question)]
+    format_question = fast_serializers.question_formatter()
+    render_item = NDJSONRenderer().render_item
+    count = 0
+    # Spool to a local file first, the storage may not support appending
+    with tempfile.TemporaryFile() as spool:
+        for rows in parts:
+            for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+                spool.write(render_item(format_question(row)))
+                count += 1
+        spool.seek(0)
+        name = default_storage.save('exports/classroom-%s-%s.ndjson' % (
+            classroom_id, timezone.now().strftime('%Y%m%d%H%M%S')), File(spool))
+    return {'file': name, 'questions': count}
+
+
+@task(max_attempts=1)
+def enroll_students_batch(teacher_id, enrollments):
+    """
+        `enroll_batch` for a teacher, with the enrollments given as [classroom id, student ids] pairs.
+        Not retried: the enrollments already written by a failed attempt would be reported as skipped.
+    """
+    teacher = User.objects.get(id=teacher_id)
+    return enroll_batch(teacher, {classroom_id: student_ids for classroom_id, student_ids in enrollments})
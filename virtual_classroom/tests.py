@@ -1,15 +1,73 @@
+import asyncio
+import gzip
+import io
+import json
+import logging
+import random
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+import fakeredis.aioredis
+import msgpack
+import redis
 from rest_framework.test import APITestCase
 from rest_framework import status
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
-from .models import Classroom, Question
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from . import async_views, search
+from .archive import archive_questions
+from .authentication import token_cache
+from .broker import RedisBroker, classroom_channel, get_broker
+from .hashers import HashingBusy
+from .jobs import Heartbeat, requeue_abandoned, run_pending, task
+from .models import ArchivedQuestion, Classroom, Job, JobStatus, Question
+from .questions import QuestionCoalescer
+from .loadtest import SCENARIOS, SeedData, compare, seed, summarize
+from .metrics import request_metrics
+from .middleware import ConcurrencyLimitMiddleware, PrimaryPinningMiddleware
+from .routers import PrimaryReplicaRouter, use_primary
+from .views import ROSTER_PREVIEW_SIZE
 
 User = get_user_model()
 
 
+class FlakyFakeRedis(fakeredis.aioredis.FakeRedis):
+    # Refuses the first `failures` connections, like a Redis server restarting
+    failures = 0
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        if cls.failures:
+            cls.failures -= 1
+            raise redis.ConnectionError('Connection refused')
+        return super().from_url(url, **kwargs)
+
+
 class VirtualClassroomTestCase(APITestCase):
 
     def setUp(self):
+        # Start from empty caches, ids are reused between tests
+        caches['question_feed'].clear()
+        caches['default'].clear()
+        token_cache.clear()
+        request_metrics.clear()
+
         # Create test users
         self.teacher = User.objects.create_user(username='teacher', password='password', role='teacher')
         self.student = User.objects.create_user(username='student', password='password', role='student')
@@ -35,6 +93,26 @@ class VirtualClassroomTestCase(APITestCase):
         response = self.client.post(url, data)
         return response
 
+    def assertConstantQueries(self, request, grow):
+        # Fail when the queries made by `request` grow along with the rows added by `grow`
+        # The first request fills the caches, e.g. of the token
+        request()
+        with CaptureQueriesContext(connection) as before:
+            request()
+        grow()
+        with CaptureQueriesContext(connection) as after:
+            request()
+        self.assertEqual(len(after), len(before), 'Queries went from %d to %d:\n%s' % (
+            len(before), len(after), '\n'.join(query['sql'] for query in after.captured_queries)))
+
+    def page_links(self, response):
+        # Parse the Link header of a paginated response into {rel: url}
+        links = {}
+        for link in filter(None, response.get('Link', '').split(', ')):
+            url, rel = link.split('; ')
+            links[rel[len('rel="'):-1]] = url[1:-1]
+        return links
+
     # Test User Registration
     def test_registration(self):
         url = reverse('signup')
@@ -42,6 +120,35 @@ class VirtualClassroomTestCase(APITestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    # Test that signing up writes the user once, with a hashed password
+    def test_registration_single_write(self):
+        url = reverse('signup')
+        data = {'username': 'new-student', 'password': 'password', 'role': 'student'}
+        # The username check, the user and the token
+        with self.assertNumQueries(3):
+            response = self.client.post(url, data)
+        self.assertIn('token', response.data)
+        self.assertTrue(User.objects.get(username='new-student').check_password('password'))
+
+    # Test that logins are refused with a Retry-After when the hashing pool is full
+    def test_login_hashing_busy(self):
+        url = reverse('login')
+        with mock.patch('virtual_classroom.hashers.HashingPool.run', side_effect=HashingBusy):
+            response = self.client.post(url, {'username': 'student', 'password': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+    # Test that logging in rehashes passwords hashed with an older hasher
+    @override_settings(PASSWORD_HASHERS=['virtual_classroom.hashers.TunedScryptPasswordHasher',
+                                         'django.contrib.auth.hashers.PBKDF2PasswordHasher'],
+                       PASSWORD_HASHER_COST={'scrypt': {'work_factor': 2 ** 10}})
+    def test_login_upgrades_password_hash(self):
+        url = reverse('login')
+        response = self.client.post(url, {'username': 'student', 'password': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.student.refresh_from_db()
+        self.assertTrue(self.student.password.startswith('scrypt$'))
+
     # Test user login
     def test_login(self):
         url = reverse('login')
@@ -50,6 +157,31 @@ class VirtualClassroomTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('token', response.data)
 
+    # Test that authenticated requests reuse the cached token until it is deleted
+    def test_token_authentication_cache(self):
+        token = self.login_and_get_token('teacher', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        url = reverse('create-classroom')
+        self.client.post(url, {'title': 'first-class'})
+        # Only the insert and the (empty) roster of the response, no token lookup
+        with self.assertNumQueries(2):
+            response = self.client.post(url, {'title': 'second-class'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        Token.objects.filter(key=token).delete()
+        response = self.client.post(url, {'title': 'third-class'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    # Test that deactivated users can no longer use their token
+    def test_token_authentication_deactivated_user(self):
+        token = self.login_and_get_token('teacher', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.client.post(reverse('create-classroom'), {'title': 'first-class'})
+        self.teacher.is_active = False
+        self.teacher.save()
+        response = self.client.post(reverse('create-classroom'), {'title': 'second-class'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     # Test Classroom Creation
     def test_classroom_creation(self):
         token = self.login_and_get_token('teacher', 'password')
@@ -65,12 +197,223 @@ class VirtualClassroomTestCase(APITestCase):
         response = self.enroll_students(token, [self.student.id])
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    # Test the counts returned when enrolling students
+    def test_enroll_student_counts(self):
+        new_student = User.objects.create_user(username='new-student', password='password', role='student')
+        token = self.login_and_get_token('teacher', 'password')
+        response = self.enroll_students(token, [self.student.id, new_student.id, new_student.id, self.other_teacher.id])
+        self.assertEqual((response.data['added'], response.data['skipped'], response.data['invalid']), (1, 1, 1))
+        self.assertEqual(set(self.classroom.enrolled_students.values_list('id', flat=True)),
+                         {self.student.id, new_student.id})
+
+        # The enrolled students are read in the write transaction, so overlapping requests cannot both add them
+        with CaptureQueriesContext(connection) as queries:
+            response = self.enroll_students(token, [new_student.id])
+        self.assertEqual((response.data['added'], response.data['skipped']), (0, 1))
+        statements = [query['sql'] for query in queries]
+        write_transaction = next(i for i, sql in enumerate(statements) if sql.startswith('SAVEPOINT'))
+        self.assertGreater(next(i for i, sql in enumerate(statements) if 'EXISTS' in sql), write_transaction)
+        student_count = Classroom.objects.get(id=self.classroom.id).student_count
+        Classroom.refresh_counters([self.classroom.id])
+        self.assertEqual(Classroom.objects.get(id=self.classroom.id).student_count, student_count)
+
+    # Test enrolling students in several classrooms from a CSV file
+    def test_bulk_enroll_csv(self):
+        classroom = Classroom.objects.create(title='second-class', teacher=self.teacher)
+        other_classroom = Classroom.objects.create(title='other-class', teacher=self.other_teacher)
+        rows = ['classroom_id,student_id'] + ['%d,%d' % (c.id, self.student.id)
+                                              for c in (self.classroom, classroom, other_classroom)]
+        upload = SimpleUploadedFile('enrollments.csv', '\n'.join(rows).encode(), content_type='text/csv')
+
+        token = self.login_and_get_token('teacher', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        response = self.client.post(reverse('bulk-enroll'), {'file': upload})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = {result['classroom_id']: result for result in response.data}
+        self.assertEqual(results[self.classroom.id]['skipped'], 1)
+        self.assertEqual(results[classroom.id]['added'], 1)
+        self.assertIn('error', results[other_classroom.id])
+        self.assertFalse(other_classroom.enrolled_students.exists())
+
+    # Test exporting a classroom and enrolling students in background jobs
+    def test_background_jobs(self):
+        Question.objects.create(text='First?', student=self.student, classroom=self.classroom)
+        Question.objects.create(text='Second?', student=self.student, classroom=self.classroom)
+        other_student = User.objects.create_user(username='other-student', password='password', role='student')
+        token = self.login_and_get_token('teacher', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+
+        export = self.client.post(reverse('export-classroom', args=[self.classroom.id]))
+        self.assertEqual(export.status_code, status.HTTP_202_ACCEPTED)
+        enroll = self.client.post(reverse('bulk-enroll-job'), {'enrollments': [
+            {'classroom_id': self.classroom.id, 'student_ids': [self.student.id, other_student.id]}]}, format='json')
+        self.assertEqual(enroll.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.client.get(enroll['Location']).data['status'], JobStatus.QUEUED)
+        self.assertFalse(self.classroom.enrolled_students.filter(id=other_student.id).exists())
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            self.assertEqual(run_pending(), 2)
+            response = self.client.get(reverse('get-job', args=[export.data['id']]))
+            self.assertEqual(response.data['status'], JobStatus.SUCCEEDED)
+            self.assertEqual(response.data['result']['questions'], 2)
+            response = self.client.get(reverse('download-job-result', args=[export.data['id']]))
+            lines = b''.join(response.streaming_content).splitlines()
+            self.assertEqual([json.loads(line)['text'] for line in lines], ['First?', 'Second?'])
+            response.close()
+
+            # The export files expire
+            name = Job.objects.get(id=export.data['id']).result['file']
+            call_command('run_jobs', '--once', stdout=io.StringIO())
+            self.assertTrue(default_storage.exists(name))
+            Job.objects.filter(id=export.data['id']).update(finished_at=timezone.now() - timedelta(days=8))
+            call_command('run_jobs', '--once', stdout=io.StringIO())
+            self.assertFalse(default_storage.exists(name))
+            self.assertEqual(Job.objects.get(id=export.data['id']).result, {'questions': 2, 'expired': True})
+            response = self.client.get(reverse('download-job-result', args=[export.data['id']]))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get(reverse('get-job', args=[enroll.data['id']]))
+        self.assertEqual(response.data['result'], [{'classroom_id': self.classroom.id, 'added': 1, 'skipped': 1,
+                                                    'invalid': 0}])
+        self.assertTrue(self.classroom.enrolled_students.filter(id=other_student.id).exists())
+
+        # Jobs are private to the user who started them
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.login_and_get_token('other-teacher', 'password'))
+        response = self.client.get(reverse('get-job', args=[export.data['id']]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # Test that failing jobs are retried with a backoff
+    def test_job_retries(self):
+        attempts = []
+
+        @task(name='test-flaky', max_attempts=2, retry_delay=0)
+        def flaky(value):
+            attempts.append(value)
+            raise ValueError('Failed')
+
+        flaky.enqueue(1)
+        with self.assertLogs('virtual_classroom.jobs', 'WARNING'):
+            self.assertEqual(run_pending(), 2)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts, attempts), (JobStatus.FAILED, 2, [1, 1]))
+        self.assertIn('ValueError: Failed', job.error)
+
+    # Test that a running job is only queued again once its heartbeat stopped
+    def test_job_heartbeat(self):
+        @task(name='test-slow')
+        def slow():
+            time.sleep(0.3)
+
+        job = slow.enqueue()
+        # The heartbeats are written from their thread, which the test transaction would lock out
+        with override_settings(JOB_QUEUE={**settings.JOB_QUEUE, 'HEARTBEAT_INTERVAL': 0.05}), \
+                mock.patch.object(Heartbeat, 'beat') as beat:
+            self.assertEqual(run_pending(), 1)
+        self.assertGreaterEqual(beat.call_count, 3)
+        self.assertEqual(Job.objects.get(id=job.id).status, JobStatus.SUCCEEDED)
+
+        # Running for longer than the timeout, with a recent heartbeat
+        long_ago = timezone.now() - timedelta(hours=1)
+        Job.objects.filter(id=job.id).update(status=JobStatus.RUNNING, started_at=long_ago, heartbeat_at=long_ago)
+        Heartbeat(job.id, 30).beat()
+        requeue_abandoned(120)
+        self.assertEqual(Job.objects.get(id=job.id).status, JobStatus.RUNNING)
+        Job.objects.filter(id=job.id).update(heartbeat_at=long_ago)
+        requeue_abandoned(120)
+        self.assertEqual(Job.objects.get(id=job.id).status, JobStatus.QUEUED)
+
     # Test enrolling students in other teacher's classroom
     def test_enroll_student_in_other_teacher_classroom(self):
         token = self.login_and_get_token('other-teacher', 'password')
         response = self.enroll_students(token, [self.student.id])
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    # Test the counters of the teacher summary
+    def test_classroom_summary(self):
+        other_student = User.objects.create_user(username='other-student', password='password', role='student')
+        Classroom.objects.create(title='other class', teacher=self.other_teacher)
+        teacher_token = self.login_and_get_token('teacher', 'password')
+        self.enroll_students(teacher_token, [self.student.id, other_student.id])
+
+        student_token = self.login_and_get_token('student', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + student_token)
+        self.client.post(reverse('post-question', args=[self.classroom.id]), {'text': 'One?'})
+        self.client.post(reverse('post-questions', args=[self.classroom.id]),
+                         {'questions': [{'text': 'Two?'}, {'text': 'Three?'}]}, format='json')
+        self.classroom.enrolled_students.remove(other_student)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + teacher_token)
+        self.client.get(reverse('classroom-summary'))
+        # The token is cached by now
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('classroom-summary'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        summary = response.data[0]
+        self.assertEqual((summary['id'], summary['question_count'], summary['student_count']),
+                         (self.classroom.id, 3, 1))
+        self.assertIsNotNone(summary['last_question_at'])
+
+    # Test that listing classrooms takes the same queries whatever the number of classrooms and students
+    def test_list_classrooms(self):
+        token = self.login_and_get_token('teacher', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        url = reverse('list-classrooms')
+
+        def add_classrooms():
+            students = User.objects.bulk_create(
+                User(username='student-%d' % i, role='student') for i in range(ROSTER_PREVIEW_SIZE + 5))
+            for i in range(3):
+                classroom = Classroom.objects.create(title='class %d' % i, teacher=self.teacher)
+                classroom.enrolled_students.add(*students)
+
+        self.assertConstantQueries(lambda: self.client.get(url), add_classrooms)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(len(response.data[1]['enrolled_students']), ROSTER_PREVIEW_SIZE)
+        self.assertEqual(response.data[1]['student_count'], ROSTER_PREVIEW_SIZE + 5)
+
+        # Students see the classrooms they are enrolled in
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.login_and_get_token('student', 'password'))
+        response = self.client.get(url)
+        self.assertEqual([classroom['id'] for classroom in response.data], [self.classroom.id])
+
+    # Test retrieving a classroom and paging through its roster
+    def test_get_classroom_and_students(self):
+        students = User.objects.bulk_create(User(username='student-%d' % i, role='student') for i in range(5))
+        self.classroom.enrolled_students.add(*students)
+        token = self.login_and_get_token('teacher', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+
+        response = self.client.get(reverse('get-classroom', args=[self.classroom.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['student_count'], 6)
+
+        for fast in (False, True):
+            with self.subTest(fast=fast), override_settings(FAST_READ_SERIALIZERS=fast):
+                url = reverse('get-classroom-students', args=[self.classroom.id])
+                pages = []
+                while url:
+                    response = self.client.get(url, {'page_size': 4} if not pages else None)
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    pages.append(response.json())
+                    url = self.page_links(response).get('next')
+                self.assertEqual([student['id'] for page in pages for student in page],
+                                 sorted([self.student.id] + [student.id for student in students]))
+                self.assertEqual(pages[0][0], {'id': self.student.id, 'username': 'student', 'first_name': '',
+                                               'last_name': '', 'role': 'student'})
+                response = self.client.get(reverse('get-classroom-students', args=[self.classroom.id]),
+                                           {'fields': 'username', 'page_size': 1})
+                self.assertEqual(response.json(), [{'username': 'student'}])
+
+        # Other teachers cannot see it
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.login_and_get_token('other-teacher', 'password'))
+        response = self.client.get(reverse('get-classroom', args=[self.classroom.id]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse('get-classroom-students', args=[self.classroom.id]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
     # Test Posting Questions in enrolled classroom
     def test_post_question_in_classroom(self):
         token = self.login_and_get_token('student', 'password')
@@ -80,6 +423,305 @@ class VirtualClassroomTestCase(APITestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    # Test that large responses are compressed, and rendered the same by every JSON renderer
+    def test_response_compression(self):
+        Question.objects.bulk_create(Question(text='Could you explain part %d again?' % i, student=self.student,
+                                              classroom=self.classroom) for i in range(100))
+        Classroom.record_questions(self.classroom.id, timezone.now(), 100)
+        url = reverse('get-questions', args=[self.classroom.id])
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertEqual(plain.content, JSONRenderer().render(plain.json()))
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0.5, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        self.assertLess(len(response.content), len(plain.content) // 4)
+        # The weak ETag still matches
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Streamed exports are compressed on the fly
+        response = self.client.get(url, {'format': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(len(gzip.decompress(b''.join(response.streaming_content)).splitlines()), 100)
+
+        # Small responses are left alone
+        response = self.client.post(reverse('login'), {'username': 'student', 'password': 'password'},
+                                    HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+    # Test that the API schema is generated once per worker, or served from a pre-generated file
+    def test_api_docs(self):
+        url = reverse('schema-swagger-ui')
+        response = self.client.get(url, {'format': 'openapi'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('/classroom/{classroom_id}/questions/search', response.json()['paths'])
+        with mock.patch('drf_yasg.generators.OpenAPISchemaGenerator.get_schema', side_effect=AssertionError):
+            self.assertEqual(self.client.get(url, {'format': 'openapi'}).content, response.content)
+
+        with tempfile.NamedTemporaryFile(suffix='.json') as schema_file:
+            # generate_swagger turns the warnings off for good
+            self.addCleanup(logging.disable, logging.NOTSET)
+            call_command('generate_swagger', '--format', 'json', '--overwrite', schema_file.name, stdout=io.StringIO())
+            with override_settings(API_DOCS={'SCHEMA_FILE': schema_file.name}):
+                response = self.client.get(url, {'format': 'openapi'})
+            self.assertEqual(response.content, schema_file.read())
+        self.assertEqual(response.json()['info']['title'], 'Virtual Classroom API for Funclass')
+
+        self.assertEqual(self.client.get(reverse('api-docs:docs-index')).status_code, status.HTTP_200_OK)
+
+    # Test returning and reading only the requested fields
+    def test_sparse_fieldsets(self):
+        questions = [Question.objects.create(text='Question %d?' % i, student=self.student, classroom=self.classroom)
+                     for i in range(3)]
+        url = reverse('get-questions', args=[self.classroom.id])
+        for fast in (False, True):
+            with self.subTest(fast=fast), override_settings(FAST_READ_SERIALIZERS=fast):
+                caches['question_feed'].clear()
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, {'fields': 'id,student_id', 'page_size': 2})
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.json()[0], {'id': questions[2].id, 'student_id': self.student.id})
+                self.assertNotIn('"text"', queries[-1]['sql'])
+                # The pages are still cut on the timestamps
+                response = self.client.get(self.page_links(response)['next'])
+                self.assertEqual(response.json(), [{'id': questions[0].id, 'student_id': self.student.id}])
+
+        response = self.client.get(url, {'fields': 'text', 'format': 'ndjson'})
+        self.assertEqual(b''.join(response.streaming_content).splitlines()[0], b'{"text":"Question 2?"}')
+        response = self.client.get(url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('password', response.json()['fields'][0])
+
+        token = self.login_and_get_token('teacher', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        response = self.client.get(reverse('list-classrooms'), {'fields': 'title,question_count'})
+        self.assertEqual(response.json(), [{'title': 'class', 'question_count': 0}])
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('get-classroom', args=[self.classroom.id]), {'fields': 'id'})
+        self.assertEqual(response.json(), {'id': self.classroom.id})
+        response = self.client.get(reverse('get-classroom-students', args=[self.classroom.id]), {'fields': 'username'})
+        self.assertEqual(response.json(), [{'username': 'student'}])
+
+    # Test that the question feed reads on into the archive, and only past the live questions
+    def test_archived_questions(self):
+        now = timezone.now()
+        questions = Question.objects.bulk_create(Question(text='Question %d?' % i, student=self.student,
+                                                          classroom=self.classroom) for i in range(6))
+        for i, question in enumerate(questions):
+            Question.objects.filter(id=question.id).update(timestamp=now - timedelta(days=6 - i, hours=-12))
+        ids = [question.id for question in reversed(questions)]
+        Classroom.refresh_counters([self.classroom.id])
+
+        out = io.StringIO()
+        call_command('archive_questions', '--older-than-days', '3', stdout=out)
+        self.assertIn('Archived 3 questions', out.getvalue())
+        self.assertEqual(ArchivedQuestion.objects.count(), 3)
+        self.assertEqual(list(Question.objects.values_list('id', flat=True).order_by('-id')), ids[:3])
+
+        # The first page only reads the live questions
+        url = reverse('get-questions', args=[self.classroom.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'page_size': 2})
+        self.assertFalse(any('archivedquestion' in query['sql'] for query in queries))
+
+        # Paging through the whole feed both ways
+        pages = [[question['id'] for question in response.data]]
+        while 'next' in self.page_links(response):
+            response = self.client.get(self.page_links(response)['next'])
+            pages.append([question['id'] for question in response.data])
+        self.assertEqual(pages, [ids[0:2], ids[2:4], ids[4:6]])
+        response = self.client.get(self.page_links(response)['prev'])
+        self.assertEqual([question['id'] for question in response.data], ids[2:4])
+        response = self.client.get(url, {'since': ids[4]})
+        self.assertEqual([question['id'] for question in response.data], ids[:4])
+
+        response = self.client.get(url, {'format': 'ndjson'})
+        self.assertEqual([json.loads(line)['id'] for line in b''.join(response.streaming_content).splitlines()], ids)
+
+        # The cutoff cannot reach past the questions being posted
+        for arguments in (['--older-than-days', '0'], ['--before', (timezone.now() + timedelta(days=1)).isoformat()]):
+            with self.assertRaises(CommandError):
+                call_command('archive_questions', *arguments, stdout=io.StringIO())
+        self.assertEqual(ArchivedQuestion.objects.count(), 3)
+
+        # The archived questions are still counted, by the counter as by a recount
+        self.assertEqual(archive_questions(timezone.now()), 3)
+        self.assertEqual(Classroom.objects.get(id=self.classroom.id).question_count, 6)
+        Classroom.refresh_counters([self.classroom.id])
+        self.assertEqual(Classroom.objects.get(id=self.classroom.id).question_count, 6)
+
+    # Test searching the questions of a classroom, kept in sync with the posted questions
+    def test_search_questions(self):
+        token = self.login_and_get_token('student', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        for text in ['How are integrals explained?', 'What is a derivative?',
+                     'Could you explain integrals again, integrals are hard', 'When is the exam?']:
+            self.client.post(reverse('post-question', args=[self.classroom.id]), {'text': text})
+        other_classroom = Classroom.objects.create(title='other', teacher=self.teacher)
+        Question.objects.create(text='Integrals?', student=self.student, classroom=other_classroom)
+
+        # Every word must match, stemmed, newest first and paginated
+        url = reverse('search-questions', args=[self.classroom.id])
+        response = self.client.get(url, {'q': 'explain integral', 'page_size': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([question['text'] for question in response.data],
+                         ['Could you explain integrals again, integrals are hard'])
+        response = self.client.get(self.page_links(response)['next'])
+        self.assertEqual([question['text'] for question in response.data], ['How are integrals explained?'])
+        self.assertNotIn('next', self.page_links(response))
+
+        # Best matches first
+        response = self.client.get(url, {'q': 'integrals', 'order': 'rank'})
+        self.assertEqual([question['text'] for question in response.data],
+                         ['Could you explain integrals again, integrals are hard', 'How are integrals explained?'])
+
+        # The index follows edits and deletions, and search operators are taken literally
+        Question.objects.filter(text='When is the exam?').update(text='When is the integral exam?')
+        Question.objects.filter(text='What is a derivative?').delete()
+        self.assertEqual(len(self.client.get(url, {'q': 'integral'}).data), 3)
+        self.assertEqual(self.client.get(url, {'q': 'derivative'}).data, [])
+        self.assertEqual(self.client.get(url, {'q': 'exam OR "derivative'}).data, [])
+        self.assertEqual(self.client.get(url, {'q': '  '}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    # Test that the search finds the archived questions, in both orders
+    def test_search_archived_questions(self):
+        questions = Question.objects.bulk_create(Question(text='Integrals %d?' % i, student=self.student,
+                                                          classroom=self.classroom) for i in range(4))
+        for i, question in enumerate(questions):
+            Question.objects.filter(id=question.id).update(timestamp=timezone.now() - timedelta(days=4 - i, hours=-12))
+        ids = [question.id for question in reversed(questions)]
+        call_command('archive_questions', '--older-than-days', '2', '--batch-size', '1', stdout=io.StringIO())
+        self.assertEqual(ArchivedQuestion.objects.count(), 2)
+
+        url = reverse('search-questions', args=[self.classroom.id])
+        response = self.client.get(url, {'q': 'integrals', 'page_size': 3})
+        self.assertEqual([question['id'] for question in response.data], ids[:3])
+        response = self.client.get(self.page_links(response)['next'])
+        self.assertEqual([question['id'] for question in response.data], ids[3:])
+        response = self.client.get(url, {'q': 'integrals', 'order': 'rank'})
+        self.assertEqual(sorted(question['id'] for question in response.data), sorted(ids))
+        response = self.client.get(url, {'q': 'integrals 0'})
+        self.assertEqual([question['id'] for question in response.data], [ids[3]])
+
+    # Test that the FTS5 triggers dropped by a table remake are recreated after migrate, with the index
+    def test_search_triggers_restored(self):
+        if not search.has_fts_table(connection.alias):
+            self.skipTest('SQLite without FTS5')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER virtual_classroom_question_search_insert')
+        Question.objects.create(text='Unindexed integrals?', student=self.student, classroom=self.classroom)
+        url = reverse('search-questions', args=[self.classroom.id])
+        self.assertEqual(self.client.get(url, {'q': 'unindexed'}).data, [])
+
+        emit_post_migrate_signal(0, False, connection.alias)
+        self.assertEqual([question['text'] for question in self.client.get(url, {'q': 'unindexed'}).data],
+                         ['Unindexed integrals?'])
+        self.assertEqual(search.ensure_search_triggers(connection.alias), [])
+
+    # Test that the last question time of a classroom never goes backwards
+    def test_record_questions_out_of_order(self):
+        now = timezone.now()
+        Classroom.record_questions(self.classroom.id, now)
+        Classroom.record_questions(self.classroom.id, now - timedelta(seconds=1), count=2)
+        classroom = Classroom.objects.get(id=self.classroom.id)
+        self.assertEqual((classroom.last_question_at, classroom.question_count, classroom.question_version),
+                         (now, 3, 2))
+
+    # Test posting several questions at once, with per question errors
+    def test_post_questions_batch(self):
+        token = self.login_and_get_token('student', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        url = reverse('post-questions', args=[self.classroom.id])
+        data = {'questions': [{'text': 'First?'}, {'text': ''}, {'text': 'Third?'}]}
+        with self.assertNumQueries(7):
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item.get('text') for item in response.data], ['First?', None, 'Third?'])
+        self.assertIn('text', response.data[1]['errors'])
+        self.assertEqual(Question.objects.filter(classroom=self.classroom).count(), 2)
+        self.assertEqual(Question.objects.get(id=response.data[2]['id']).text, 'Third?')
+        self.classroom.refresh_from_db()
+        self.assertEqual(self.classroom.question_version, 1)
+
+        response = self.client.post(url, {'questions': [{'text': ''}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    # Test that questions submitted together are written in one batch
+    def test_question_write_coalescing(self):
+        batches = []
+
+        def create_questions(questions):
+            batches.append(list(questions))
+            for question_id, question in enumerate(questions, 1):
+                question.id = question_id
+            return questions
+
+        coalescer = QuestionCoalescer(window=0.5, max_batch=3)
+        results = []
+        with mock.patch('virtual_classroom.questions.create_questions', create_questions):
+            threads = [threading.Thread(target=lambda text=text: results.append(
+                coalescer.submit(Question(text=text)))) for text in ('a', 'b', 'c')]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(sorted(question.text for question in results), ['a', 'b', 'c'])
+        self.assertEqual(sorted(question.id for question in results), [1, 2, 3])
+
+    # Test that the enrollment check does not load the classroom roster
+    def test_post_question_enrollment_check(self):
+        token = self.login_and_get_token('student', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        url = reverse('post-question', args=[self.classroom.id])
+        with tempfile.TemporaryDirectory() as location, override_settings(
+                CACHES={**settings.CACHES, 'shared': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}},
+                ENROLLMENT_CACHE='shared'):
+            self.client.post(url, {'text': 'First question'})
+            with mock.patch('django.db.models.query.QuerySet.exists') as exists:
+                response = self.client.post(url, {'text': 'Second question'})
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            # The cached enrollments answered, not the database
+            exists.assert_not_called()
+
+            # Enrolling the student somewhere else drops the cached enrollments
+            other_classroom = Classroom.objects.create(title='new-class', teacher=self.teacher)
+            other_classroom.enrolled_students.add(self.student)
+            self.assertIsNone(caches['shared'].get('enrolled-classrooms:%s' % self.student.id))
+
+    # Test that a student removed from a classroom loses access at once with a per-process cache
+    def test_enrollment_check_local_cache(self):
+        token = self.login_and_get_token('student', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        url = reverse('post-question', args=[self.classroom.id])
+        self.assertEqual(self.client.post(url, {'text': 'First question'}).status_code, status.HTTP_201_CREATED)
+        self.assertIsNone(caches['default'].get('enrolled-classrooms:%s' % self.student.id))
+        # Removed by another worker, whose signal cannot clear this worker's LocMemCache
+        Classroom.enrolled_students.through.objects.filter(user_id=self.student.id).delete()
+        self.assertEqual(self.client.post(url, {'text': 'Second question'}).status_code, status.HTTP_403_FORBIDDEN)
+
+    # Test that the SQLite writer benchmark measures the database, not the rate limits
+    def test_bench_sqlite_writers(self):
+        out = io.StringIO()
+        call_command('bench_sqlite_writers', '--writers', '2', '--duration', '0.3', stdout=out)
+        rows = out.getvalue().splitlines()[1:]
+        self.assertEqual(len(rows), 3)
+        for row in rows:
+            self.assertNotIn('429', row.split('  ')[-1], row)
+            self.assertGreater(int(row[20:].split()[0]), 0, row)
+
+    # Test that the SQLite connections are opened with the tuned PRAGMAs
+    def test_sqlite_pragmas(self):
+        if connection.vendor != 'sqlite' or not hasattr(connection, 'begin_immediate'):
+            self.skipTest('Not running on the tuned SQLite backend')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
     # Test Posting Questions in a not enrolled classroom
     def test_post_question_in_not_enrolled_classroom(self):
         token = self.login_and_get_token('student', 'password')
@@ -98,3 +740,404 @@ class VirtualClassroomTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)  # Expecting 1 question
         self.assertEqual(response.data[0]['text'], "What is this?")
+
+    # Test walking the question feed page by page
+    def test_get_classroom_questions_pages(self):
+        questions = [Question.objects.create(text=str(i), student=self.student, classroom=self.classroom)
+                     for i in range(5)]
+        # Same timestamp for some of them, the id breaks the tie
+        Question.objects.filter(id__in=[q.id for q in questions[1:4]]).update(timestamp=questions[1].timestamp)
+        url = reverse('get-questions', args=[self.classroom.id])
+
+        seen = []
+        response = self.client.get(url, {'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [question['text'] for question in response.data]
+            links = self.page_links(response)
+            if 'next' not in links:
+                break
+            response = self.client.get(links['next'])
+        self.assertEqual(seen, ['4', '3', '2', '1', '0'])
+
+        # Going back from the last page gives the previous one
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(links['prev'])
+        self.assertEqual([question['text'] for question in response.data], ['2', '1'])
+        # The page is cut with a row value comparison, which bounds the feed index range
+        self.assertIn('"timestamp", "virtual_classroom_question"."id") > (', queries[-1]['sql'])
+
+    # Test getting questions with a broken cursor
+    def test_get_classroom_questions_invalid_cursor(self):
+        url = reverse('get-questions', args=[self.classroom.id])
+        response = self.client.get(url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # Test polling the questions posted since the last one seen
+    def test_get_classroom_questions_since(self):
+        first = Question.objects.create(text='first', student=self.student, classroom=self.classroom)
+        Question.objects.create(text='second', student=self.student, classroom=self.classroom)
+        url = reverse('get-questions', args=[self.classroom.id])
+        response = self.client.get(url, {'since': first.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([question['text'] for question in response.data], ['second'])
+
+    # Test conditional requests on the question feed
+    def test_get_classroom_questions_not_modified(self):
+        url = reverse('get-questions', args=[self.classroom.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Posting a question changes the feed version
+        token = self.login_and_get_token('student', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.client.post(reverse('post-question', args=[self.classroom.id]), {'text': 'New question'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Last-Modified', response)
+
+    # Test that posted questions are pushed to the live streams once committed
+    def test_post_question_publishes_to_stream(self):
+        token = self.login_and_get_token('student', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        url = reverse('post-question', args=[self.classroom.id])
+        with mock.patch('virtual_classroom.questions.get_broker') as get_broker_mock:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(url, {'text': 'Live question'})
+        channel, message = get_broker_mock.return_value.publish.call_args.args
+        self.assertEqual(channel, classroom_channel(self.classroom.id))
+        self.assertTrue(message.startswith('%s:' % response.data['id']))
+
+    # Test streaming the questions of a classroom as Server-Sent Events
+    async def test_stream_classroom_questions(self):
+        url = reverse('stream-questions', args=[self.classroom.id])
+        response = await self.async_client.get(url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        self.assertTrue((await anext(events)).startswith(b'retry:'))
+
+        get_broker().publish(classroom_channel(self.classroom.id), '42:{"text":"Live question"}')
+        event = await anext(events)
+        self.assertEqual(event, b'id: 42\nevent: question\ndata: {"text":"Live question"}\n\n')
+        await events.aclose()
+
+    # Test that the Redis broker relays the questions posted on one worker to the subscribers of another
+    async def test_redis_broker(self):
+        # One broker per worker, sharing the same server
+        streaming_worker, posting_worker = [RedisBroker(
+            'redis://broker-test:6379/0', client_class='fakeredis.FakeRedis',
+            async_client_class='fakeredis.aioredis.FakeRedis') for _ in range(2)]
+        channel = classroom_channel(self.classroom.id)
+        subscription = streaming_worker.subscribe(channel)
+        other_subscription = streaming_worker.subscribe(classroom_channel(self.classroom.id + 1))
+        try:
+            # Wait for the listener's pattern subscription
+            for _ in range(100):
+                if posting_worker.client.pubsub_numpat():
+                    break
+                await asyncio.sleep(0.01)
+            posting_worker.publish(channel, '42:{"text":"Live question"}')
+            self.assertEqual(await asyncio.wait_for(subscription.get(), 1), '42:{"text":"Live question"}')
+            self.assertTrue(other_subscription.queue.empty())
+        finally:
+            subscription.close()
+            other_subscription.close()
+            streaming_worker.listener.cancel()
+
+    # Test that the Redis broker reconnects when its pub/sub connection fails
+    async def test_redis_broker_reconnects(self):
+        FlakyFakeRedis.failures = 2
+        streaming_worker, posting_worker = [RedisBroker(
+            'redis://broker-reconnect-test:6379/0', client_class='fakeredis.FakeRedis',
+            async_client_class='virtual_classroom.tests.FlakyFakeRedis', reconnect_delay=0.01) for _ in range(2)]
+        channel = classroom_channel(self.classroom.id)
+        with self.assertLogs('virtual_classroom.broker', 'WARNING') as logs:
+            subscription = streaming_worker.subscribe(channel)
+            try:
+                for _ in range(100):
+                    if posting_worker.client.pubsub_numpat():
+                        break
+                    await asyncio.sleep(0.01)
+                posting_worker.publish(channel, '42:{"text":"Live question"}')
+                self.assertEqual(await asyncio.wait_for(subscription.get(), 1), '42:{"text":"Live question"}')
+            finally:
+                subscription.close()
+                streaming_worker.listener.cancel()
+        self.assertEqual(len(logs.records), 2)
+
+    # Test that a question is saved and answered when the broker fails to publish it
+    def test_post_question_broker_down(self):
+        token = self.login_and_get_token('student', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        with mock.patch.object(get_broker(), 'publish', side_effect=ConnectionError('Broker down')), \
+                self.assertLogs('virtual_classroom.questions', 'WARNING'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('post-question', args=[self.classroom.id]), {'text': 'Saved?'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Question.objects.filter(text='Saved?').exists())
+
+    # Test serving the question feed from the cache until a question is posted
+    def test_get_classroom_questions_cached(self):
+        for text in ('What is this?', 'And that?'):
+            Question.objects.create(text=text, student=self.student, classroom=self.classroom)
+        url = reverse('get-questions', args=[self.classroom.id])
+        response = self.client.get(url, {'page_size': 1})
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        # The question table is not read for a cached page
+        with self.assertNumQueries(1):
+            cached_response = self.client.get(url, {'page_size': 1})
+        self.assertEqual(cached_response['X-Cache'], 'HIT')
+        self.assertEqual(cached_response.content, response.content)
+        self.assertEqual(cached_response['Link'], response['Link'])
+
+        token = self.login_and_get_token('student', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.client.post(reverse('post-question', args=[self.classroom.id]), {'text': 'New question'})
+        response = self.client.get(url, {'page_size': 1})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()[0]['text'], 'New question')
+
+    # Test that deleting questions, directly or along with their student, uncounts them and changes the feed
+    def test_delete_questions(self):
+        token = self.login_and_get_token('student', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        for text in ('What is this?', 'And that?'):
+            self.client.post(reverse('post-question', args=[self.classroom.id]), {'text': text})
+        url = reverse('get-questions', args=[self.classroom.id])
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        Question.objects.get(text='And that?').delete()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([question['text'] for question in response.json()], ['What is this?'])
+        self.assertEqual(Classroom.objects.get(id=self.classroom.id).question_count, 1)
+
+        self.student.delete()
+        self.assertEqual(Classroom.objects.get(id=self.classroom.id).question_count, 0)
+
+    # Test that the fast serialization path gives the same output as the serializers
+    def test_get_classroom_questions_fast_path(self):
+        for text in ('What is this?', 'Qu\'est-ce que c\'est ? \u2028 \U0001f914'):
+            Question.objects.create(text=text, student=self.student, classroom=self.classroom)
+        url = reverse('get-questions', args=[self.classroom.id])
+        response = self.client.get(url, {'page_size': 1})
+
+        caches['question_feed'].clear()
+        with override_settings(FAST_READ_SERIALIZERS=True):
+            fast_response = self.client.get(url, {'page_size': 1})
+        self.assertEqual(fast_response.content, response.content)
+        self.assertEqual(fast_response['Link'], response['Link'])
+
+    # Test streaming every question of a classroom as newline delimited JSON
+    def test_export_classroom_questions_ndjson(self):
+        for i in range(3):
+            Question.objects.create(text='Question %d' % i, student=self.student, classroom=self.classroom)
+        url = reverse('get-questions', args=[self.classroom.id])
+
+        response = self.client.get(url, {'format': 'ndjson', 'page_size': 1})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['text'] for line in lines], ['Question 2', 'Question 1', 'Question 0'])
+
+        response = self.client.get(url, HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 3)
+
+    # Test that exports served over ASGI are streamed from an asynchronous iterator
+    async def test_export_classroom_questions_ndjson_asgi(self):
+        await Question.objects.acreate(text='Question', student=self.student, classroom=self.classroom)
+        url = reverse('get-questions', args=[self.classroom.id])
+        response = await self.async_client.get(url, {'format': 'ndjson'})
+        self.assertTrue(response.is_async)
+        lines = [line async for line in response.streaming_content]
+        self.assertEqual(json.loads(lines[0])['text'], 'Question')
+
+    # Test that the async question feed answers like the API view
+    async def test_get_classroom_questions_async(self):
+        for text in ('What is this?', 'And that?'):
+            await Question.objects.acreate(text=text, student=self.student, classroom=self.classroom)
+        url = reverse('get-questions', args=[self.classroom.id])
+        response = await self.async_client.get(url, {'page_size': 1}, headers={'Accept': 'application/json'})
+
+        await caches['question_feed'].aclear()
+        request = AsyncRequestFactory().get(url, {'page_size': 1}, headers={'Accept': 'application/json'})
+        async_response = await async_views.get_questions(request, str(self.classroom.id))
+        self.assertEqual(async_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(async_response.content, response.content)
+        self.assertEqual(async_response['Link'], response['Link'])
+        self.assertEqual(async_response['ETag'], response['ETag'])
+
+        request = AsyncRequestFactory().get(url, {'page_size': 1}, headers={
+            'Accept': 'application/json', 'If-None-Match': response['ETag']})
+        async_response = await async_views.get_questions(request, str(self.classroom.id))
+        self.assertEqual(async_response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # The format is negotiated like in the API view
+        response = await self.async_client.get(url, {'format': 'msgpack'})
+        request = AsyncRequestFactory().get(url, {'format': 'msgpack'})
+        async_response = await async_views.get_questions(request, str(self.classroom.id))
+        self.assertEqual(async_response['Content-Type'], 'application/msgpack')
+        self.assertEqual(async_response.content, response.content)
+        self.assertEqual([question['text'] for question in msgpack.unpackb(async_response.content)],
+                         ['And that?', 'What is this?'])
+        request = AsyncRequestFactory().get(url, {'format': 'yaml'})
+        async_response = await async_views.get_questions(request, str(self.classroom.id))
+        self.assertEqual(async_response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # Test posting a question with the async view
+    async def test_post_question_async(self):
+        token = await Token.objects.acreate(user=self.student)
+        url = reverse('post-question', args=[self.classroom.id])
+
+        request = AsyncRequestFactory().post(url, {'text': 'Async question?'}, content_type='application/json',
+                                             headers={'Authorization': 'Token ' + token.key})
+        response = await async_views.post_question(request, str(self.classroom.id))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        question = await Question.objects.aget(id=json.loads(response.content)['id'])
+        self.assertEqual(question.student_id, self.student.id)
+        self.assertEqual((await Classroom.objects.aget(id=self.classroom.id)).question_version, 1)
+
+        request = AsyncRequestFactory().post(url, {'text': 'In MessagePack?'}, content_type='application/json',
+                                             headers={'Authorization': 'Token ' + token.key,
+                                                      'Accept': 'application/msgpack'})
+        response = await async_views.post_question(request, str(self.classroom.id))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(msgpack.unpackb(response.content)['text'], 'In MessagePack?')
+        request = AsyncRequestFactory().post(url, {'text': 'In XML?'}, content_type='application/json',
+                                             headers={'Authorization': 'Token ' + token.key,
+                                                      'Accept': 'application/xml'})
+        response = await async_views.post_question(request, str(self.classroom.id))
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+
+        # Anonymous users, teachers and students not enrolled are refused
+        other_student = await User.objects.acreate(username='other-student', role='student')
+        for user in (None, self.teacher, other_student):
+            headers = {}
+            if user is not None:
+                headers['Authorization'] = 'Token ' + (await Token.objects.acreate(user=user)).key
+            request = AsyncRequestFactory().post(url, {'text': 'Refused?'}, headers=headers)
+            response = await async_views.post_question(request, str(self.classroom.id))
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        request = AsyncRequestFactory().post(url, {'text': 'Invalid token?'},
+                                             headers={'Authorization': 'Token nope'})
+        response = await async_views.post_question(request, str(self.classroom.id))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(json.loads(response.content), {'detail': 'Invalid token.'})
+
+    # Test the latency and query metrics recorded per view
+    def test_request_metrics(self):
+        url = reverse('get-questions', args=[self.classroom.id])
+        response = self.client.get(url)
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="2 queries"$')
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        metrics = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count{view="get-questions",method="GET"} 1', metrics)
+        self.assertIn('http_request_db_queries_bucket{view="get-questions",method="GET",le="2"} 1', metrics)
+        self.assertIn('http_request_db_queries_sum{view="get-questions",method="GET"} 2', metrics)
+        self.assertIn('http_responses_total{view="get-questions",method="GET",status="200"} 1', metrics)
+        self.assertIn('question_feed_cache_misses_total', metrics)
+
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    # Test that requests left out of the sample are not instrumented
+    @override_settings(REQUEST_METRICS={'SAMPLE_RATE': 0})
+    def test_request_metrics_sampled_out(self):
+        response = self.client.get(reverse('get-questions', args=[self.classroom.id]))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(request_metrics.views, {})
+
+    # Test the seeded load test data and the requests of every scenario
+    def test_loadtest_scenarios(self):
+        counts = seed(users=20, classrooms=4, questions=50, roster_size=5, batch_size=20, log=lambda message: None)
+        self.assertEqual(counts, {'users': 20, 'classrooms': 4, 'enrollments': 20, 'questions': 50})
+        self.assertEqual(sum(Classroom.objects.filter(title__startswith='load-').values_list(
+            'question_count', flat=True)), 50)
+
+        data = SeedData()
+        rng = random.Random(0)
+        for name, make_request in SCENARIOS.items():
+            request = make_request(rng, data)
+            self.client.credentials(**({'HTTP_AUTHORIZATION': 'Token ' + request.token} if request.token else {}))
+            if request.method == 'GET':
+                response = self.client.get(request.path)
+            else:
+                response = self.client.post(request.path, request.data, format='json')
+            self.assertLess(response.status_code, 400, name)
+
+        result = summarize([0.002, 0.001, 0.004], [1, 1, 2], errors=0, elapsed=1)
+        self.assertEqual((result['p50_ms'], result['throughput']), (2, 3))
+        changes = compare({'get-questions': result}, {'get-questions': {**result, 'p50_ms': 1}})
+        self.assertEqual(changes['get-questions']['p50_ms'], 100)
+
+    # Test the per user and per address token buckets
+    @override_settings(RATE_LIMITS={'post-question': {'user': '2/min'}, 'login': {'ip': '2/min'}})
+    def test_rate_limits(self):
+        token = self.login_and_get_token('student', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        url = reverse('post-question', args=[self.classroom.id])
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, {'text': 'Again?'}).status_code, status.HTTP_201_CREATED)
+        response = self.client.post(url, {'text': 'Again?'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+
+        # Another user has its own bucket, logins share the one of the address
+        other_student = User.objects.create_user(username='other-student', password='password', role='student')
+        self.classroom.enrolled_students.add(other_student)
+        token = self.login_and_get_token('other-student', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        self.assertEqual(self.client.post(url, {'text': 'Me?'}).status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('login'), {'username': 'student', 'password': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    # Test shedding the requests that find no free slot
+    @override_settings(ADMISSION_CONTROL={'MAX_CONCURRENT': 1, 'QUEUE_TIMEOUT': 0, 'RETRY_AFTER': 2})
+    def test_concurrency_limit(self):
+        middleware = ConcurrencyLimitMiddleware(lambda request: HttpResponse())
+        request = RequestFactory().get('/api/signup')
+        middleware.slots.acquire()
+        response = middleware(request)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '2')
+        middleware.slots.release()
+        self.assertEqual(middleware(request).status_code, status.HTTP_200_OK)
+
+
+class PrimaryReplicaRouterTestCase(APITestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        use_primary.set(False)
+        self.router = PrimaryReplicaRouter()
+        self.router.has_replica = lambda: True
+
+    def request_database(self, method, **headers):
+        # The database the router picks for the reads of a request
+        databases = []
+        middleware = PrimaryPinningMiddleware(
+            lambda request: databases.append(self.router.db_for_read(Question)) or HttpResponse())
+        middleware(getattr(RequestFactory(), method)('/', **headers))
+        return databases[0]
+
+    # Test that reads go to the replica and writes to the primary
+    def test_routing(self):
+        self.assertEqual(self.router.db_for_read(Question), 'replica')
+        self.assertEqual(self.router.db_for_write(Question), 'default')
+        # Once something was written, the reads go to the primary too
+        self.assertEqual(self.router.db_for_read(Question), 'default')
+
+    # Test that a client who wrote reads from the primary for a while
+    def test_read_your_writes(self):
+        self.assertEqual(self.request_database('get', HTTP_AUTHORIZATION='Token student'), 'replica')
+        self.assertEqual(self.request_database('post', HTTP_AUTHORIZATION='Token student'), 'default')
+        self.assertEqual(self.request_database('get', HTTP_AUTHORIZATION='Token student'), 'default')
+        self.assertEqual(self.request_database('get', HTTP_AUTHORIZATION='Token other-student'), 'replica')
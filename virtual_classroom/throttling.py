@@ -0,0 +1,82 @@
+"""
+Rate limiting of the API endpoints.
+
+RATE_LIMITS maps URL names to token bucket limits: a 'user' limit for each
+authenticated user, an 'ip' limit for each client address, or both. A rate
+of '30/min' holds up to 30 requests and refills 30 of them per minute, so a
+client can burst up to the whole bucket and then keeps to the rate. A
+request is admitted only when every bucket it falls in has a token left,
+otherwise it is answered 429 with a Retry-After header.
+
+The buckets are kept in the RATE_LIMIT_CACHE cache, which must be shared
+(e.g. Redis) for the limits to hold across worker processes. They are read
+and written with one round trip each; two requests of the same client
+racing on different workers may both be admitted.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+        Turn '30/min' into (capacity, tokens refilled per second).
+    """
+    count, period = rate.split('/')
+    return int(count), int(count) / DURATIONS[period[0]]
+
+
+def get_rate_limit_cache():
+    return caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+        Applies the RATE_LIMITS of the URL name of the request.
+    """
+
+    def __init__(self):
+        self.wait_time = None
+
+    def get_limits(self, request):
+        match = request.resolver_match
+        return getattr(settings, 'RATE_LIMITS', {}).get(match.url_name) if match is not None else None
+
+    def allow_request(self, request, view):
+        limits = self.get_limits(request)
+        if not limits:
+            return True
+        match = request.resolver_match
+
+        buckets = {}
+        if 'user' in limits and request.user and request.user.is_authenticated:
+            buckets['rate-limit:%s:user:%s' % (match.url_name, request.user.pk)] = parse_rate(limits['user'])
+        if 'ip' in limits:
+            buckets['rate-limit:%s:ip:%s' % (match.url_name, self.get_ident(request))] = parse_rate(limits['ip'])
+
+        # Take a token from every bucket, or from none of them
+        cache = get_rate_limit_cache()
+        now = time.time()
+        states = cache.get_many(buckets.keys())
+        updates, waits = {}, []
+        for key, (capacity, refill) in buckets.items():
+            tokens, updated = states.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill)
+            if tokens < 1:
+                waits.append((1 - tokens) / refill)
+            else:
+                updates[key] = (tokens - 1, now)
+
+        if waits:
+            self.wait_time = max(waits)
+            return False
+        # An idle bucket is full again after capacity / refill seconds, it can expire by then
+        cache.set_many(updates, timeout=max(int(capacity / refill) + 1 for capacity, refill in buckets.values()))
+        return True
+
+    def wait(self):
+        return self.wait_time
@@ -1,11 +1,32 @@
+from django.conf import settings
 from django.urls import path
-from .views import post_question, get_questions, signup, login, create_classroom, add_to_classroom
+from .views import post_question, get_questions, signup, login, create_classroom, add_to_classroom, \
+    stream_questions, question_cache_stats, bulk_enroll, post_questions, \
+    classroom_summary, list_classrooms, get_classroom, get_classroom_students, search_questions, \
+    bulk_enroll_job, export_classroom, get_job, download_job_result
+
+# Serve the question feed with the async views, see async_views.py
+if settings.ASYNC_QUESTION_VIEWS:
+    from .async_views import post_question, get_questions
 
 urlpatterns = [
     path('classroom/<str:classroom_id>/questions', get_questions, name='get-questions'),
     path('classroom/<str:classroom_id>/question', post_question, name='post-question'),
+    path('classroom/<str:classroom_id>/questions/batch', post_questions, name='post-questions'),
+    path('classroom/<str:classroom_id>/questions/search', search_questions, name='search-questions'),
+    path('classroom/<str:classroom_id>/questions/stream', stream_questions, name='stream-questions'),
     path('signup', signup, name='signup'),
     path('login', login, name='login'),
     path('classroom/create', create_classroom, name='create-classroom'),
+    path('classroom/summary', classroom_summary, name='classroom-summary'),
+    path('classrooms', list_classrooms, name='list-classrooms'),
+    path('classroom/<int:classroom_id>', get_classroom, name='get-classroom'),
+    path('classroom/<int:classroom_id>/students', get_classroom_students, name='get-classroom-students'),
     path('classroom/<str:classroom_id>/add_students', add_to_classroom, name='add-students-to-classroom'),
+    path('classroom/enroll', bulk_enroll, name='bulk-enroll'),
+    path('classroom/enroll/job', bulk_enroll_job, name='bulk-enroll-job'),
+    path('classroom/<int:classroom_id>/export', export_classroom, name='export-classroom'),
+    path('jobs/<int:job_id>', get_job, name='get-job'),
+    path('jobs/<int:job_id>/download', download_job_result, name='download-job-result'),
+    path('stats/question-cache', question_cache_stats, name='question-cache-stats'),
 ]
@@ -1,14 +1,39 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status, permissions
-from rest_framework.authentication import SessionAuthentication, TokenAuthentication
-from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.decorators import api_view, permission_classes, authentication_classes, renderer_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from .models import Classroom, Question, User, UserRole
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.settings import api_settings
+from . import cache, fast_serializers, fieldsets, search, tasks
+from .archive import feed_archive
+from .authentication import CachedTokenAuthentication
+from .broker import classroom_channel, get_broker
+from .enrollment import EnrollmentFileError, enroll_batch, enroll_students, is_enrolled, parse_enrollment_file
+from .hashers import check_password
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, metrics_config, request_metrics
+from .models import ArchivedQuestion, Classroom, Job, JobStatus, Question, User
+from .questions import create_questions, get_coalescer
+from .pagination import POSITION_FIELDS, QuestionCursorPagination, StudentCursorPagination, seek_parts
+from .renderers import NDJSONRenderer
+from .streaming import event_stream
 from .serializers import QuestionSerializer, UserSerializer, ClassroomSerializer, EnrollStudentSerializer, \
-    UserDetailSerializer
+    UserDetailSerializer, BulkEnrollmentSerializer, QuestionBatchSerializer, ClassroomSummarySerializer, \
+    ClassroomDetailSerializer, JobSerializer
 from rest_framework.authtoken.models import Token
 
 
@@ -39,11 +64,8 @@ def signup(request):
     """
     serializer = UserSerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save()
-        user = User.objects.get(username=request.data['username'])
-        # Save the password as hash
-        user.set_password(request.data['password'])
-        user.save()
+        # Save the user, the serializer stores the password as hash
+        user = serializer.save()
         # Create the token and return it
         token = Token.objects.create(user=user)
         return Response({'token': token.key})
@@ -65,8 +87,8 @@ def login(request):
     """
     user = get_object_or_404(User, username=request.data['username'])
 
-    # Check password
-    if not user.check_password(request.data['password']):
+    # Check password, on the hashing pool
+    if not check_password(user, request.data['password']):
         return Response("wrong password", status=status.HTTP_404_NOT_FOUND)
 
     # return the token and user details
@@ -76,7 +98,7 @@ def login(request):
 
 @swagger_auto_schema(method='post', request_body=ClassroomSerializer, responses={201: ClassroomSerializer})
 @api_view(['POST'])
-@authentication_classes([SessionAuthentication, TokenAuthentication])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
 @permission_classes([IsAuthenticated, IsTeacher])
 def create_classroom(request):
     """
@@ -97,6 +119,135 @@ def create_classroom(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@swagger_auto_schema(method='get', manual_parameters=[
+    fieldsets.swagger_parameter(ClassroomSummarySerializer.Meta.fields),
+], responses={200: ClassroomSummarySerializer(many=True)})
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
+@permission_classes([IsAuthenticated, IsTeacher])
+def classroom_summary(request):
+    """
+        Question count, student count and last question time of each classroom of the teacher.
+        With `?fields=`, returns and reads only these fields.
+        Only accessible by teachers.
+    """
+    fields = fieldsets.requested_fields(request, ClassroomSummarySerializer.Meta.fields)
+
+    # The counters are kept on the classroom rows, a single query on the teacher index
+    classrooms = Classroom.objects.filter(teacher=request.user).only(*fields).order_by('id')
+    return Response(ClassroomSummarySerializer(classrooms, many=True, fields=fields).data)
+
+
+# Students embedded in the classroom list and detail, the whole roster is paginated
+ROSTER_PREVIEW_SIZE = 20
+
+
+def roster_preview():
+    """
+        Prefetch the first students of classrooms into `roster_preview`, with only the fields
+        that are returned. The students of all the classrooms are fetched by a single query.
+    """
+    students = User.objects.only(*UserDetailSerializer.Meta.fields).order_by('id')[:ROSTER_PREVIEW_SIZE]
+    return Prefetch('enrolled_students', queryset=students, to_attr='roster_preview')
+
+
+def can_view_classroom(user, classroom):
+    return classroom.teacher_id == user.id or (user.role == 'student' and is_enrolled(user.id, classroom.id))
+
+
+def classroom_columns(fields):
+    """
+        The classroom columns to load for these ClassroomDetailSerializer fields.
+        The roster preview is prefetched separately, and only when asked for.
+    """
+    return fieldsets.query_fields([field for field in fields if field != 'enrolled_students'], ['teacher'])
+
+
+@swagger_auto_schema(method='get', manual_parameters=[
+    fieldsets.swagger_parameter(ClassroomDetailSerializer.Meta.fields),
+], responses={200: ClassroomDetailSerializer(many=True)})
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def list_classrooms(request):
+    """
+        List the classrooms of a teacher, or the ones a student is enrolled in,
+        each with its first students.
+        With `?fields=`, returns and reads only these fields.
+    """
+    fields = fieldsets.requested_fields(request, ClassroomDetailSerializer.Meta.fields)
+    if request.user.role == 'teacher':
+        classrooms = Classroom.objects.filter(teacher=request.user)
+    else:
+        classrooms = Classroom.objects.filter(enrolled_students=request.user)
+    classrooms = classrooms.only(*classroom_columns(fields)).order_by('id')
+    if 'enrolled_students' in fields:
+        classrooms = classrooms.prefetch_related(roster_preview())
+    return Response(ClassroomDetailSerializer(classrooms, many=True, fields=fields).data)
+
+
+@swagger_auto_schema(method='get', manual_parameters=[
+    fieldsets.swagger_parameter(ClassroomDetailSerializer.Meta.fields),
+], responses={200: ClassroomDetailSerializer})
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_classroom(request, classroom_id):
+    """
+        Retrieve a classroom with its first students.
+        With `?fields=`, returns and reads only these fields.
+        Only accessible by the classroom's teacher and enrolled students.
+    """
+    fields = fieldsets.requested_fields(request, ClassroomDetailSerializer.Meta.fields)
+    classroom = get_object_or_404(Classroom.objects.only(*classroom_columns(fields)), id=classroom_id)
+    if not can_view_classroom(request.user, classroom):
+        return Response(status=status.HTTP_403_FORBIDDEN)
+
+    if 'enrolled_students' in fields:
+        prefetch_related_objects([classroom], roster_preview())
+    return Response(ClassroomDetailSerializer(classroom, fields=fields).data)
+
+
+@swagger_auto_schema(method='get', manual_parameters=StudentCursorPagination.swagger_parameters + [
+    fieldsets.swagger_parameter(UserDetailSerializer.Meta.fields),
+], responses={200: UserDetailSerializer(many=True)})
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_classroom_students(request, classroom_id):
+    """
+        Retrieve the students of a classroom, one page at a time, by id.
+        The next and previous pages are given in the Link header.
+        With `?fields=`, returns and reads only these fields of the students.
+        Only accessible by the classroom's teacher and enrolled students.
+    """
+    fields = fieldsets.requested_fields(request, UserDetailSerializer.Meta.fields)
+    classroom = get_object_or_404(Classroom.objects.only('id', 'teacher_id'), id=classroom_id)
+    if not can_view_classroom(request.user, classroom):
+        return Response(status=status.HTTP_403_FORBIDDEN)
+
+    paginator = StudentCursorPagination()
+    students = User.objects.filter(enrolled_classrooms=classroom.id)
+    if settings.FAST_READ_SERIALIZERS:
+        page = paginator.paginate_queryset(students.values(*fieldsets.query_fields(fields, ['id'])), request)
+        data = fast_serializers.student_data(page, fields)
+    else:
+        page = paginator.paginate_queryset(students.only(*fields), request)
+        data = UserDetailSerializer(page, many=True, fields=fields).data
+    return paginator.get_paginated_response(data)
+
+
+# Used to specify return type for the enrollment endpoints
+enrollment_result = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        'added': openapi.Schema(type=openapi.TYPE_INTEGER, description='Students newly enrolled'),
+        'skipped': openapi.Schema(type=openapi.TYPE_INTEGER, description='Students already enrolled'),
+        'invalid': openapi.Schema(type=openapi.TYPE_INTEGER, description='Ids that are not students'),
+    }
+)
+
+
 @swagger_auto_schema(method='post', request_body=openapi.Schema(
     type=openapi.TYPE_OBJECT,
     properties={
@@ -106,9 +257,9 @@ def create_classroom(request):
             description='List of student IDs'
         )
     }
-),responses={200: ClassroomSerializer})
+),responses={200: enrollment_result})
 @api_view(['POST'])
-@authentication_classes([SessionAuthentication, TokenAuthentication])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
 @permission_classes([IsAuthenticated, IsTeacher])
 def add_to_classroom(request, classroom_id):
     """
@@ -122,19 +273,133 @@ def add_to_classroom(request, classroom_id):
         return Response({'error': 'Only the classroom teacher can add students'}, status=status.HTTP_403_FORBIDDEN)
 
     # Get the student ids from the request
-    student_ids = request.data.get('student_ids', [])
+    serializer = EnrollStudentSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    # Enroll the ones that are actually students and not enrolled yet
+    result = enroll_students(classroom.id, serializer.validated_data['student_ids'])
+    return Response({"message": "Students added successfully", **result._asdict()}, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(method='post', request_body=BulkEnrollmentSerializer, responses={200: openapi.Schema(
+    type=openapi.TYPE_ARRAY,
+    items=enrollment_result,
+)})
+@api_view(['POST'])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
+@permission_classes([IsAuthenticated, IsTeacher])
+def bulk_enroll(request):
+    """
+        Enroll students in several classrooms at once.
+        Takes either a JSON body, or a `file` upload: a CSV file with classroom_id and student_id
+        columns, or a JSON file with the same content as the body.
+        Returns the result for each classroom. Only the teacher's own classrooms are updated.
+    """
+    enrollments, errors = read_enrollments(request)
+    if errors is not None:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(enroll_batch(request.user, enrollments), status=status.HTTP_200_OK)
+
+
+def read_enrollments(request):
+    """
+        The {classroom id: [student ids]} of a bulk enrollment request, or the errors of the request.
+    """
+    if 'file' in request.FILES:
+        try:
+            return parse_enrollment_file(request.FILES['file']), None
+        except EnrollmentFileError as exc:
+            return None, {'error': str(exc)}
+    serializer = BulkEnrollmentSerializer(data=request.data)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    enrollments = {}
+    for item in serializer.validated_data['enrollments']:
+        enrollments.setdefault(item['classroom_id'], []).extend(item['student_ids'])
+    return enrollments, None
+
+
+def job_response(request, job):
+    # 202 pointing to the status of a queued job
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED,
+                    headers={'Location': request.build_absolute_uri(reverse('get-job', args=[job.id]))})
+
+
+@swagger_auto_schema(method='post', request_body=BulkEnrollmentSerializer, responses={202: JobSerializer})
+@api_view(['POST'])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
+@permission_classes([IsAuthenticated, IsTeacher])
+def bulk_enroll_job(request):
+    """
+        Same as `bulk_enroll`, run as a background job.
+        Returns the job, its result is the one `bulk_enroll` would have returned.
+    """
+    enrollments, errors = read_enrollments(request)
+    if errors is not None:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    job = tasks.enroll_students_batch.enqueue(request.user.id, list(enrollments.items()), user=request.user)
+    return job_response(request, job)
+
+
+@swagger_auto_schema(method='post', responses={202: JobSerializer})
+@api_view(['POST'])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
+@permission_classes([IsAuthenticated, IsTeacher])
+def export_classroom(request, classroom_id):
+    """
+        Export all the questions of a classroom to an NDJSON file, in a background job.
+        The file can be downloaded from `jobs/<id>/download` once the job succeeded.
+        Only accessible by the classroom's teacher.
+    """
+    classroom = get_object_or_404(Classroom.objects.only('id', 'teacher_id'), id=classroom_id)
+    if classroom.teacher_id != request.user.id:
+        return Response({'error': 'Only the classroom teacher can export it'}, status=status.HTTP_403_FORBIDDEN)
+
+    job = tasks.export_classroom_questions.enqueue(classroom.id, user=request.user)
+    return job_response(request, job)
 
-    # Filter the users who have these ids and are actually students
-    students = User.objects.filter(id__in=student_ids, role=UserRole.STUDENT)
 
-    # Enroll them in the classroom
-    classroom.enrolled_students.add(*students)
-    return Response({"message": "Students added successfully"}, status=status.HTTP_200_OK)
+def get_own_job(request, job_id):
+    # Jobs are only visible to the user who started them and to staff
+    jobs = Job.objects.all() if request.user.is_staff else Job.objects.filter(user=request.user)
+    return get_object_or_404(jobs, id=job_id)
+
+
+@swagger_auto_schema(method='get', responses={200: JobSerializer})
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def get_job(request, job_id):
+    """
+        Status of a background job, to poll until it succeeded or failed.
+        Only accessible by the user who started it.
+    """
+    return Response(JobSerializer(get_own_job(request, job_id)).data)
+
+
+@swagger_auto_schema(method='get', responses={200: 'The exported file', 404: 'No file for this job'})
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
+@permission_classes([IsAuthenticated])
+def download_job_result(request, job_id):
+    """
+        Download the file written by a background job, e.g. a classroom export.
+        Only accessible by the user who started it.
+    """
+    job = get_own_job(request, job_id)
+    if job.status != JobStatus.SUCCEEDED or not isinstance(job.result, dict) or 'file' not in job.result:
+        raise Http404
+    name = job.result['file']
+    return FileResponse(default_storage.open(name), as_attachment=True, filename=os.path.basename(name),
+                        content_type=NDJSONRenderer.media_type)
 
 
 @swagger_auto_schema(method='post', request_body=QuestionSerializer, responses={201: QuestionSerializer})
 @api_view(['POST'])
-@authentication_classes([SessionAuthentication, TokenAuthentication])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
 @permission_classes([IsAuthenticated, IsStudent])
 def post_question(request, classroom_id):
     """
@@ -145,26 +410,290 @@ def post_question(request, classroom_id):
     classroom = get_object_or_404(Classroom, id=classroom_id)
 
     # Check if user is enrolled
-    if request.user not in classroom.enrolled_students.all():
+    if not is_enrolled(request.user.id, classroom.id):
         return Response(status=status.HTTP_403_FORBIDDEN)
 
-    # Create the question and save it
+    # Create the question and save it, along with the ones posted at the same time if coalescing
     serializer = QuestionSerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save(student=request.user, classroom=classroom)
+        question = Question(student=request.user, classroom_id=classroom.id, **serializer.validated_data)
+        coalescer = get_coalescer()
+        if coalescer is not None:
+            serializer.instance = coalescer.submit(question)
+        else:
+            serializer.instance = create_questions([question])[0]
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-@swagger_auto_schema(method='get',
-                     responses={200: openapi.Response('List of Questions', QuestionSerializer(many=True))})
+def save_question(serializer, student, classroom_id):
+    """
+        Save a validated question, see `questions.create_questions`.
+    """
+    question = Question(student=student, classroom_id=classroom_id, **serializer.validated_data)
+    serializer.instance = create_questions([question])[0]
+    return serializer.instance
+
+
+# Used to specify return type for the batch question endpoint
+question_batch_result = openapi.Schema(
+    type=openapi.TYPE_ARRAY,
+    items=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        description='The saved question, or the errors of the question',
+        properties={
+            'id': openapi.Schema(type=openapi.TYPE_INTEGER),
+            'errors': openapi.Schema(type=openapi.TYPE_OBJECT),
+        }
+    )
+)
+
+
+@swagger_auto_schema(method='post', request_body=QuestionBatchSerializer,
+                     responses={201: question_batch_result, 400: question_batch_result})
+@api_view(['POST'])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
+@permission_classes([IsAuthenticated, IsStudent])
+def post_questions(request, classroom_id):
+    """
+        Post several questions in a classroom at once, written in a single transaction.
+        Returns the result of each question, in order: the saved question, or its errors.
+        Only accessible by enrolled students.
+    """
+    classroom = get_object_or_404(Classroom, id=classroom_id)
+
+    # Check if user is enrolled
+    if not is_enrolled(request.user.id, classroom.id):
+        return Response(status=status.HTTP_403_FORBIDDEN)
+
+    batch = QuestionBatchSerializer(data=request.data)
+    if not batch.is_valid():
+        return Response(batch.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    # Validate each question on its own, then save the valid ones together
+    items = [QuestionSerializer(data=item) for item in batch.validated_data['questions']]
+    valid = [serializer for serializer in items if serializer.is_valid()]
+    questions = create_questions([
+        Question(student=request.user, classroom_id=classroom.id, **serializer.validated_data)
+        for serializer in valid
+    ]) if valid else []
+    for serializer, question in zip(valid, questions):
+        serializer.instance = question
+
+    results = [serializer.data if serializer.instance is not None else {'errors': serializer.errors}
+               for serializer in items]
+    return Response(results, status=status.HTTP_201_CREATED if valid else status.HTTP_400_BAD_REQUEST)
+
+
+def questions_etag(request, classroom_id, question_version):
+    """
+        ETag of a question feed response.
+        It changes whenever questions are posted or the client asks for another page or format.
+    """
+    key = '%s:%s:%s:%s' % (classroom_id, question_version, request.get_full_path(), request.META.get('HTTP_ACCEPT', ''))
+    return '"%s"' % hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+# Rows fetched per database round trip when streaming a question export
+EXPORT_CHUNK_SIZE = 2000
+
+
+def export_questions(request, questions, renderer=None, fields=fast_serializers.QUESTION_FIELDS):
+    """
+        Stream every question of the querysets, one after the other, one NDJSON line each with
+        the given fields. Rows are read from the database chunk by chunk while the response is sent,
+        so memory stays flat whatever the size of the classroom.
+        `request` is either an API request or, with `renderer`, a plain Django one.
+    """
+    renderer = renderer or request.accepted_renderer
+    parts = [part.values(*fields) for part in questions]
+    format_question = fast_serializers.question_formatter(fields)
+    render_item = renderer.render_item
+
+    # ASGI servers need an asynchronous iterator, Django would load a synchronous one in memory first
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        async def lines():
+            for rows in parts:
+                async for row in rows.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+                    yield render_item(format_question(row))
+    else:
+        def lines():
+            for rows in parts:
+                for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+                    yield render_item(format_question(row))
+
+    return StreamingHttpResponse(lines(), content_type=renderer.media_type)
+
+
+@swagger_auto_schema(method='get', manual_parameters=QuestionCursorPagination.swagger_parameters + [
+    fieldsets.swagger_parameter(fast_serializers.QUESTION_FIELDS),
+], responses={200: openapi.Response('List of Questions', QuestionSerializer(many=True)),
+                                304: 'The questions did not change since the last request'})
 @api_view(['GET'])
+@renderer_classes(api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer])
 def get_questions(request, classroom_id):
     """
-        Retrieve all questions from a classroom.
+        Retrieve the questions of a classroom, newest first, one page at a time.
+        The next and previous pages are given in the Link header.
+        With `Accept: application/x-ndjson` or `?format=ndjson`, streams all of them instead
+        (or all of those posted after `since`), one JSON object per line.
+        Supports conditional requests with ETag / If-None-Match and Last-Modified / If-Modified-Since.
+        With `?fields=`, returns and reads only these fields of the questions.
+        Accessible by anyone.
+    """
+    fields = fieldsets.requested_fields(request, fast_serializers.QUESTION_FIELDS)
+
+    # Answer unchanged feeds from the classroom version alone, without reading the questions
+    etag = last_modified = None
+    feed_version = Classroom.objects.filter(id=classroom_id).values_list(
+        'question_version', 'last_question_at', 'archived_before').first()
+    archived_before = None
+    if feed_version is not None:
+        question_version, last_question_at, archived_before = feed_version
+        etag = questions_etag(request, classroom_id, question_version)
+        if last_question_at is not None:
+            last_modified = int(last_question_at.timestamp())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+    # Serve pages already rendered for the current version of the feed from the cache,
+    # the ETag in the key covers the format. HTML pages depend on the user, they are not cached.
+    cacheable = etag is not None and not isinstance(
+        request.accepted_renderer, (NDJSONRenderer, BrowsableAPIRenderer))
+    cached_page = cache.get_page(classroom_id, etag) if cacheable else None
+    if isinstance(request.accepted_renderer, NDJSONRenderer):
+        questions = Question.objects.filter(classroom_id=classroom_id)
+        archive = feed_archive(classroom_id, archived_before)
+        position = QuestionCursorPagination(archive).get_position(request, questions)
+        response = export_questions(request, seek_parts(questions, archive, position), fields=fields)
+    elif cached_page is not None:
+        content, headers = cached_page
+        response = HttpResponse(content, content_type=request.accepted_renderer.media_type, headers=headers)
+        response['X-Cache'] = 'HIT'
+    else:
+        # Filter the question by classroom id, the paginator orders them by date
+        questions = Question.objects.filter(classroom_id=classroom_id)
+        columns = fieldsets.query_fields(fields, POSITION_FIELDS)
+        if settings.FAST_READ_SERIALIZERS:
+            paginator = QuestionCursorPagination(feed_archive(
+                classroom_id, archived_before, lambda archived: archived.values(*columns)))
+            page = paginator.paginate_queryset(questions.values(*columns), request)
+            data = fast_serializers.question_data(page, fields)
+        else:
+            paginator = QuestionCursorPagination(feed_archive(
+                classroom_id, archived_before, lambda archived: archived.only(*columns)))
+            page = paginator.paginate_queryset(questions.only(*columns), request)
+            data = QuestionSerializer(page, many=True, fields=fields).data
+        response = paginator.get_paginated_response(data)
+        if cacheable:
+            content = request.accepted_renderer.render(data, request.accepted_media_type)
+            headers = {'Link': response['Link']} if response.has_header('Link') else {}
+            cache.set_page(classroom_id, etag, content, headers)
+            response['X-Cache'] = 'MISS'
+
+    if etag is not None:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+SEARCH_ORDERS = ('recent', 'rank')
+
+
+@swagger_auto_schema(method='get', manual_parameters=[
+    openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+                      description='Words that must all appear in the questions'),
+    openapi.Parameter('order', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(SEARCH_ORDERS),
+                      description='Newest matches first, a page at a time (default), '
+                                  'or a single page of the best matches'),
+] + QuestionCursorPagination.swagger_parameters + [
+    fieldsets.swagger_parameter(fast_serializers.QUESTION_FIELDS),
+], responses={200: QuestionSerializer(many=True)})
+@api_view(['GET'])
+def search_questions(request, classroom_id):
+    """
+        Search the questions of a classroom, archived ones included, backed by the full-text index of search.py.
+        By default the matches come newest first, with the same cursor pagination as `get_questions`.
+        With `order=rank` a single page of the best matches is returned instead.
+        With `?fields=`, returns and reads only these fields of the questions.
         Accessible by anyone.
     """
-    # Filter the question by classroom id and order by date
-    questions = Question.objects.filter(classroom_id=classroom_id).order_by('-timestamp')
-    serializer = QuestionSerializer(questions, many=True)
-    return Response(serializer.data)
+    fields = fieldsets.requested_fields(request, fast_serializers.QUESTION_FIELDS)
+    text = request.query_params.get('q', '').strip()
+    order = request.query_params.get('order', 'recent')
+    if not search.search_words(text):
+        return Response({'q': ['This parameter is required.']}, status=status.HTTP_400_BAD_REQUEST)
+    if order not in SEARCH_ORDERS:
+        return Response({'order': ['Must be one of %s.' % ', '.join(SEARCH_ORDERS)]},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not classroom_id.isdigit():
+        raise Http404
+
+    questions = Question.objects.filter(classroom_id=classroom_id)
+    if order == 'rank':
+        ids = search.ranked_ids(int(classroom_id), text, QuestionCursorPagination().get_page_size(request),
+                                using=questions.db)
+        rows = {}
+        if ids:
+            # The best matches can be live or archived questions, they keep their id in the archive
+            columns = fieldsets.query_fields(fields, ['id'])
+            for queryset in (questions, ArchivedQuestion.objects.filter(classroom_id=classroom_id)):
+                rows.update((row['id'], row) for row in queryset.filter(id__in=ids).values(*columns))
+        return Response(fast_serializers.question_data([rows[question_id] for question_id in ids if question_id in rows],
+                                                       fields))
+
+    # Past the oldest live question, the pages read the matching archived questions like the feed does
+    columns = fieldsets.query_fields(fields, POSITION_FIELDS)
+    archived_before = Classroom.objects.filter(id=classroom_id).values_list('archived_before', flat=True).first()
+    paginator = QuestionCursorPagination(feed_archive(
+        classroom_id, archived_before, lambda archived: search.matching(archived, text).values(*columns)))
+    page = paginator.paginate_queryset(search.matching(questions, text).values(*columns), request)
+    return paginator.get_paginated_response(fast_serializers.question_data(page, fields))
+
+
+@swagger_auto_schema(method='get', responses={200: openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        'hits': openapi.Schema(type=openapi.TYPE_INTEGER),
+        'misses': openapi.Schema(type=openapi.TYPE_INTEGER),
+    }
+)})
+@api_view(['GET'])
+@authentication_classes([SessionAuthentication, CachedTokenAuthentication])
+@permission_classes([IsAdminUser])
+def question_cache_stats(request):
+    """
+        Hit and miss counters of the question feed cache for the worker serving the request.
+        Only accessible by staff users.
+    """
+    return Response(cache.stats.as_dict())
+
+
+def metrics(request):
+    """
+        Request metrics of the worker serving the request, in the Prometheus text format.
+        Only accessible by staff users and the ALLOWED_IPS of REQUEST_METRICS.
+    """
+    if request.META.get('REMOTE_ADDR') not in metrics_config()['ALLOWED_IPS'] and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(request_metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+async def stream_questions(request, classroom_id):
+    """
+        Stream the questions of a classroom as Server-Sent Events as soon as they are posted.
+        Each event carries the question id, so a client can catch up with
+        `get_questions?since=<Last-Event-ID>` after a reconnection.
+        Accessible by anyone, meant to be served over ASGI.
+    """
+    if not await Classroom.objects.filter(id=classroom_id).aexists():
+        raise Http404
+
+    subscription = get_broker().subscribe(classroom_channel(classroom_id))
+    response = StreamingHttpResponse(event_stream(subscription), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the events
+    response['X-Accel-Buffering'] = 'no'
+    return response